@@ -0,0 +1,120 @@
+"""
+Rendering of the /complete response, on stories shaped by core.fake_llm.FakeLLM:
+
+* pydantic: routers.story.build_complete_story_tree(...).model_dump_json() (ORM objects, a model per node)
+* fast:     routers.story.render_complete_story (column tuples, plain dicts, orjson)
+
+Before timing anything, every story is rendered both ways and the bytes are compared (rows and packed storage, plus a story full of quotes, escapes, emoji and non-ASCII text); a difference is printed and the script exits with 1, so it doubles as the parity check for CI.
+
+Run from the backend directory:
+    python -m benchmarks.bench_complete_render
+    python -m benchmarks.bench_complete_render --rounds 100 --save render.json
+    python -m benchmarks.bench_complete_render --check-only
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+# Settings() needs these to exist, the benchmark never talks to an LLM
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import LatencySamples, print_table, save_results
+from core.config import settings
+from core.fake_llm import FakeLLM
+from core.models import StoryLLMResponse
+from core.story_generator import StoryGenerator
+from db.database import Base
+from models.story import Story
+from routers.story import build_complete_story_tree, render_complete_story
+
+SHAPES = [(2, 2), (5, 3), (8, 2)] # (depth, branching): 7, 364 and 511 nodes
+TRICKY_TEXT = 'He said "run!" \\ then \n\t\u0001 ran — naïve café, 你好, 😀 </script> &  '
+
+
+def tricky_story() -> StoryLLMResponse:
+    ending = {"content": TRICKY_TEXT, "isEnding": True, "isWinningEnding": True}
+    return StoryLLMResponse.model_validate({
+        "title": "Ünïcödé " + TRICKY_TEXT,
+        "rootNode": {"content": TRICKY_TEXT, "isEnding": False, "isWinningEnding": False,
+                     "options": [{"text": TRICKY_TEXT, "nextNode": ending}, {"text": "", "nextNode": {**ending, "isWinningEnding": False}}]},
+    })
+
+
+def render_pydantic(db, story_id: int) -> bytes:
+    return build_complete_story_tree(db, db.get(Story, story_id)).model_dump_json().encode("utf-8")
+
+
+def check_parity(session_factory, story_ids: dict) -> int:
+    mismatches = 0
+    for label, story_id in story_ids.items():
+        with session_factory() as db:
+            expected = render_pydantic(db, story_id)
+        with session_factory() as db:
+            actual = render_complete_story(db, story_id)
+        if actual != expected:
+            mismatches += 1
+            offset = next((i for i, (a, b) in enumerate(zip(actual, expected)) if a != b), min(len(actual), len(expected)))
+            print(f"MISMATCH {label} at byte {offset}:\n  pydantic: {expected[max(offset - 40, 0):offset + 40]!r}\n  fast:     {actual[max(offset - 40, 0):offset + 40]!r}")
+        else:
+            print(f"parity ok: {label} ({len(actual)} bytes)")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--check-only", action="store_true", help="only compare the outputs")
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_complete_render.db")
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    _, story_parser = StoryGenerator._build_prompt("benchmark", "story")
+    structures = {"tricky": tricky_story()}
+    for depth, branching in SHAPES:
+        llm = FakeLLM(depth=depth, branching=branching)
+        structures[f"{llm.node_count} nodes"] = StoryGenerator._parse_response(story_parser, llm.invoke(None))
+
+    story_ids = {}
+    for storage in ("rows", "packed"):
+        settings.STORY_STORAGE = storage
+        for label, structure in structures.items():
+            with session_factory() as db:
+                story = StoryGenerator._save_story(db, "benchmark", structure)
+                db.commit()
+                story_ids[f"{label}, {storage}"] = story.id
+
+    mismatches = check_parity(session_factory, story_ids)
+    if mismatches:
+        print(f"\n{mismatches} stories render differently")
+        sys.exit(1)
+    if args.check_only:
+        return
+
+    samples = LatencySamples()
+    for label, story_id in story_ids.items():
+        for name, render in (("pydantic", render_pydantic), ("fast", render_complete_story)):
+            for _ in range(args.rounds):
+                with session_factory() as db: # a fresh session each round, so the story is really loaded from the database
+                    with samples.measure(f"{name} ({label})"):
+                        render(db, story_id)
+
+    summary = samples.summary()
+    print()
+    print_table(summary)
+    if args.save:
+        save_results(summary, args.save)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Playthrough event ingestion (POST /stories/{id}/events), many players sending small batches at the same time:
+
+* direct:    every request opens a session, inserts its events, updates the node aggregates and commits (the usual get_db pattern)
+* buffered:  every request only calls core.playthrough_events.EventBuffer.add(), the flush loop writes the batches in the background
+
+Latency is per request, throughput is events per second until the last event is in the database.
+Uses DATABASE_URL when set, a throwaway SQLite file otherwise.
+A final burst sends more events than the buffer holds while nothing is flushed, to show the shedding (dropped events are counted, the requests stay fast).
+
+Run from the backend directory:
+    python -m benchmarks.bench_events
+    python -m benchmarks.bench_events --requests 5000 --concurrency 100 --save events.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+# Settings() needs these to exist, the benchmark never talks to an LLM; the engines are created on import, so the database is chosen here
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_events.db"))
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+from sqlalchemy import insert, select, func
+
+from benchmarks.common import LatencySamples, print_table, save_results
+from core.playthrough_events import event_buffer, aggregate_events, upsert_node_stats
+from db.async_database import AsyncSessionLocal
+from db.database import create_tables
+from models.playthrough import PlaythroughEvent
+
+STORIES = 20
+NODES_PER_STORY = 63
+
+
+def random_batch(size: int) -> tuple:
+    story_id = random.randint(1, STORIES)
+    events = []
+    for _ in range(size):
+        node_id = random.randint(1, NODES_PER_STORY)
+        kind = random.choice(("visit", "visit", "choice", "finish"))
+        events.append((kind, node_id, 0 if kind == "choice" else None, random.random() < 0.3 if kind == "finish" else None,
+                       [1, node_id // 2] if kind == "finish" else []))
+    return story_id, f"p{random.getrandbits(32)}", events
+
+
+async def write_directly(story_id: int, playthrough_id: str, events: list):
+    buffered = [(story_id, playthrough_id, *event) for event in events]
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(PlaythroughEvent), [
+            {"story_id": story_id, "node_id": node_id, "kind": kind, "option_index": option_index, "won": won, "playthrough_id": playthrough_id}
+            for _, _, kind, node_id, option_index, won, _ in buffered])
+        await upsert_node_stats(db, aggregate_events(buffered))
+        await db.commit()
+
+
+async def stored_events() -> int:
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(select(func.count(PlaythroughEvent.id)))).scalar()
+
+
+async def run(name: str, handle, batches: list, concurrency: int, samples: LatencySamples):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(batch):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await handle(*batch)
+            except Exception:
+                samples.error(name)
+                return
+            samples.add(name, time.perf_counter() - started)
+
+    await asyncio.gather(*(request(batch) for batch in batches))
+
+
+async def main_async(args):
+    await asyncio.to_thread(create_tables)
+    samples = LatencySamples()
+    total_events = args.requests * args.events_per_request
+    throughput = {}
+
+    batches = [random_batch(args.events_per_request) for _ in range(args.requests)]
+    before = await stored_events()
+    started = time.perf_counter()
+    await run("direct", write_directly, batches, args.concurrency, samples)
+    throughput["direct"] = (await stored_events() - before) / (time.perf_counter() - started)
+
+    async def add_to_buffer(story_id, playthrough_id, events):
+        event_buffer.add(story_id, playthrough_id, events) # the whole work of the endpoint, apart from parsing the request
+        await asyncio.sleep(0) # let the flush loop run between requests, as it would between real ones
+
+    event_buffer.capacity = max(args.buffer_size, total_events) # no shedding in the throughput run
+    event_buffer.start()
+    batches = [random_batch(args.events_per_request) for _ in range(args.requests)]
+    before = await stored_events()
+    started = time.perf_counter()
+    await run("buffered", add_to_buffer, batches, args.concurrency, samples)
+    await event_buffer.stop() # writes the rest
+    throughput["buffered"] = (await stored_events() - before) / (time.perf_counter() - started)
+
+    event_buffer.capacity = args.buffer_size
+    dropped_before = event_buffer.stats["dropped"]
+    burst = [random_batch(args.events_per_request) for _ in range(args.buffer_size // args.events_per_request * 2)] # twice what fits
+    await run("buffered, full buffer", add_to_buffer, burst, args.concurrency, samples)
+    dropped = event_buffer.stats["dropped"] - dropped_before
+    await event_buffer.flush()
+
+    summary = samples.summary()
+    for name, events_per_second in throughput.items():
+        summary[name]["events_per_second"] = round(events_per_second)
+    print(f"{args.requests} requests of {args.events_per_request} events, {args.concurrency} at a time")
+    print_table(summary)
+    for name, events_per_second in throughput.items():
+        print(f"{name}: {events_per_second:,.0f} events/s until written")
+    print(f"burst of {len(burst) * args.events_per_request} events into a buffer of {args.buffer_size}: {dropped} dropped")
+    if args.save:
+        save_results(summary, args.save)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--events-per-request", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=50, help="requests in flight at the same time")
+    parser.add_argument("--buffer-size", type=int, default=2000, help="buffer capacity for the shedding burst")
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compare single-completion generation (StoryGenerator.agenerate_story) with fan-out generation (agenerate_story_fanout) on the fake LLM.
+
+The fake is given a first-token latency and an output speed, so, like on a real model, a call takes longer the more it writes.
+One completion has to write the whole tree; fan-out writes an outline and then the branches in parallel.
+
+Run from the backend directory:
+    python -m benchmarks.bench_fanout
+    python -m benchmarks.bench_fanout --latency 1.0 --tokens-per-second 150 --outline-levels 2
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+# Settings() needs these to exist, the benchmark never talks to a real LLM
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_fanout.db")
+os.environ["ASYNC_DATABASE_URL"] = ""
+
+from sqlalchemy import select, func
+
+from benchmarks.common import use_fake_llm
+from core.config import settings
+from core.fake_llm import FakeLLM
+from core.story_generator import StoryGenerator
+from db.async_database import AsyncSessionLocal
+from db.database import create_tables
+from models.story import StoryNode
+
+
+async def run(mode: str, llm: FakeLLM) -> tuple:
+    calls_before = llm.calls
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        if mode == "single":
+            story = await StoryGenerator.agenerate_story(db, "benchmark", "benchmark")
+        else:
+            story = await StoryGenerator.agenerate_story_fanout(db, "benchmark", "benchmark")
+        seconds = time.perf_counter() - started
+        node_count = (await db.execute(select(func.count()).where(StoryNode.story_id == story.id))).scalar()
+    return seconds, node_count, llm.calls - calls_before
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200, help="fake LLM output speed")
+    parser.add_argument("--branching", type=int, default=3)
+    parser.add_argument("--subtree-depth", type=int, default=2, help="levels below the first scene of each fan-out branch")
+    parser.add_argument("--outline-levels", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--concurrency", type=int, default=8, help="FANOUT_CONCURRENCY")
+    args = parser.parse_args()
+
+    create_tables()
+    settings.FANOUT_CONCURRENCY = args.concurrency
+    settings.FANOUT_SUBTREE_DEPTH = args.subtree_depth + 1
+    print(f"fake LLM: {args.latency}s to first token, {args.tokens_per_second:.0f} tokens/s, branching {args.branching}, fan-out concurrency {args.concurrency}")
+    print(f"{'mode':<22} {'nodes':>6} {'llm calls':>10} {'seconds':>8} {'nodes/s':>8}")
+
+    for outline_levels in args.outline_levels:
+        settings.FANOUT_OUTLINE_LEVELS = outline_levels
+        # the fan-out subtrees are `subtree_depth` deep below their first scene; the single completion writes a tree of the same total depth
+        total_depth = outline_levels + args.subtree_depth
+        llm = use_fake_llm(FakeLLM(depth=args.subtree_depth, branching=args.branching, latency=args.latency, tokens_per_second=args.tokens_per_second))
+        fanout = await run("fanout", llm)
+        llm = use_fake_llm(FakeLLM(depth=total_depth, branching=args.branching, latency=args.latency, tokens_per_second=args.tokens_per_second))
+        single = await run("single", llm)
+        for name, (seconds, nodes, calls) in ((f"single, depth {total_depth}", single), (f"fan-out, {outline_levels} outline lvl", fanout)):
+            print(f"{name:<22} {nodes:>6} {calls:>10} {seconds:>8.2f} {nodes / seconds:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
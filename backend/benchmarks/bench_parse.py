@@ -0,0 +1,107 @@
+"""
+Parsing the LLM's story JSON into typed nodes, on large trees shaped by core.fake_llm.FakeLLM:
+
+* two-pass:        what the code did while StoryOptionLLM.nextNode was an untyped dict: LangChain's parser (json.loads + validate the top level), then StoryNodeLLM.model_validate again for every node while walking the tree
+* langchain:       PydanticOutputParser.parse with the recursive models (json.loads into dicts, then one validation)
+* orjson:          orjson.loads + model_validate
+* validate_json:   StoryGenerator._parse_response, i.e. model_validate_json (pydantic-core parses and validates in one pass, no dicts in between)
+
+Every variant ends with the flattened node list _persist_story_nodes works from, so they are compared on the same output.
+
+Run from the backend directory:
+    python -m benchmarks.bench_parse
+    python -m benchmarks.bench_parse --rounds 50 --save parse.json
+    python -m benchmarks.bench_parse --baseline parse.json --tolerance 0.3   # exit 1 on a regression, for CI
+"""
+import argparse
+import os
+from typing import Any, Dict, List, Optional
+
+# Settings() needs these to exist, the benchmark never talks to an LLM
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+import orjson
+from langchain_core.output_parsers import PydanticOutputParser
+from pydantic import BaseModel
+
+from benchmarks.common import LatencySamples, print_table, save_results, check_baseline
+from core.fake_llm import FakeLLM
+from core.models import StoryLLMResponse
+from core.story_generator import StoryGenerator
+
+SHAPES = [(8, 2), (10, 2), (6, 4), (12, 2)] # (depth, branching): 511, 2047, 5461 and 8191 nodes
+
+
+# the previous, untyped models: only the top level is validated by the parser, every nextNode stays a dict
+class UntypedOptionLLM(BaseModel):
+    text: str
+    nextNode: Dict[str, Any]
+
+class UntypedNodeLLM(BaseModel):
+    content: str
+    isEnding: bool
+    isWinningEnding: bool
+    options: Optional[List[UntypedOptionLLM]] = None
+
+class UntypedStoryLLMResponse(BaseModel):
+    title: str
+    rootNode: UntypedNodeLLM
+
+
+def two_pass(parser: PydanticOutputParser, text: str) -> list:
+    story = parser.parse(text)
+    flat_nodes, stack = [], [story.rootNode]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            node = UntypedNodeLLM.model_validate(node) # the per-level validation the recursive models made unnecessary
+        flat_nodes.append(node)
+        for option in reversed(node.options or []):
+            stack.append(option.nextNode)
+    return flat_nodes
+
+
+def bench_shape(samples: LatencySamples, depth: int, branching: int, rounds: int):
+    llm = FakeLLM(depth=depth, branching=branching)
+    text = llm.invoke(None).content
+    label = f"{llm.node_count} nodes, {len(text) // 1024} KiB"
+    untyped_parser = PydanticOutputParser(pydantic_object=UntypedStoryLLMResponse)
+    _, story_parser = StoryGenerator._build_prompt("benchmark", "story")
+
+    variants = {
+        "two-pass": lambda: two_pass(untyped_parser, text),
+        "langchain": lambda: StoryGenerator._flatten_story_tree(story_parser.parse(text).rootNode),
+        "orjson": lambda: StoryGenerator._flatten_story_tree(StoryLLMResponse.model_validate(orjson.loads(text)).rootNode),
+        "validate_json": lambda: StoryGenerator._flatten_story_tree(StoryGenerator._parse_response(story_parser, text).rootNode),
+    }
+    for name, parse in variants.items():
+        assert len(parse()) == llm.node_count
+        for _ in range(rounds):
+            with samples.measure(f"{name} ({label})"):
+                parse()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="compare the p50s with a saved JSON and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    samples = LatencySamples()
+    for depth, branching in SHAPES:
+        bench_shape(samples, depth, branching, args.rounds)
+
+    summary = samples.summary()
+    print_table(summary)
+    if args.save:
+        save_results(summary, args.save)
+    if args.baseline:
+        check_baseline(summary, args.baseline, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compare PROMPT_MODE=verbose with PROMPT_MODE=compact: prompt and completion tokens per story, tokens per node, latency and how often the answer parses.
+
+With the fake LLM (the default) both modes get the same story, so the token counts show what the prompt and the key names cost (tokens are estimated at 4 characters each).
+--corrupt damages that fraction of the answers (cut-off tail, trailing commas) to compare how well each mode's answers survive parsing and repair.
+With --provider gemini (or openai) the real model is called, token counts come from the provider's usage metadata and the parse rate is the real one, so the right mode can be picked per deployment.
+
+Run from the backend directory:
+    python -m benchmarks.bench_prompt_modes
+    python -m benchmarks.bench_prompt_modes --corrupt 0.3 --samples 200
+    python -m benchmarks.bench_prompt_modes --provider gemini --samples 10 --themes pirates space "haunted house"
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+# Settings() needs these to exist; a real --provider needs the real key in the environment or .env
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from benchmarks.common import percentile, save_results
+from core import llm_providers
+from core.config import settings
+from core.fake_llm import estimate_tokens
+from core.story_generator import StoryGenerator
+
+MODES = ("verbose", "compact")
+
+
+def corrupt(text: str, rng: random.Random) -> str:
+    if rng.random() < 0.5:
+        return text[:rng.randint(len(text) // 2, len(text) - 1)] # the answer stopped early (token limit, dropped connection)
+    return text.replace("}", "},", 3).replace("]", "],", 2) # trailing commas
+
+
+def count_nodes(node) -> int:
+    return 1 + sum(count_nodes(option.nextNode) for option in node.options or [])
+
+
+def run_mode(mode: str, args, rng: random.Random) -> dict:
+    settings.PROMPT_MODE = mode
+    llm_providers._router = None # the clients are created again, with the provider's JSON mode in compact mode
+    llm = StoryGenerator._get_llm()
+
+    prompt_tokens, completion_tokens, seconds, nodes = [], [], [], []
+    outcomes = {"parsed": 0, "repaired": 0, "failed": 0}
+    for index in range(args.samples):
+        theme = args.themes[index % len(args.themes)]
+        prompt_value, story_parser = StoryGenerator._build_prompt(theme)
+        started = time.perf_counter()
+        message = llm.invoke(prompt_value)
+        seconds.append(time.perf_counter() - started)
+
+        text = message.content if isinstance(message.content, str) else str(message.content)
+        usage = getattr(message, "usage_metadata", None) or {}
+        prompt_tokens.append(usage.get("input_tokens") or estimate_tokens(prompt_value.to_string()))
+        completion_tokens.append(usage.get("output_tokens") or estimate_tokens(text))
+
+        if rng.random() < args.corrupt:
+            text = corrupt(text, rng)
+        try:
+            story, salvage = StoryGenerator._parse_or_salvage(story_parser, text)
+        except Exception:
+            outcomes["failed"] += 1
+            continue
+        outcomes["repaired" if salvage and salvage.repairs else "parsed"] += 1
+        nodes.append(count_nodes(story.rootNode))
+
+    return {
+        "samples": args.samples,
+        "prompt_tokens": statistics.mean(prompt_tokens),
+        "completion_tokens": statistics.mean(completion_tokens),
+        "completion_tokens_per_node": sum(completion_tokens) / max(sum(nodes), 1),
+        "nodes": statistics.mean(nodes) if nodes else 0,
+        "p50_ms": percentile(seconds, 0.50) * 1000,
+        "parsed": outcomes["parsed"] / args.samples,
+        "repaired": outcomes["repaired"] / args.samples,
+        "failed": outcomes["failed"] / args.samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", default="fake", help="LLM_PROVIDERS for the run, e.g. fake, gemini, openai")
+    parser.add_argument("--samples", type=int, default=50, help="stories per mode")
+    parser.add_argument("--themes", nargs="+", default=["pirates", "space station", "haunted house", "dragons"])
+    parser.add_argument("--corrupt", type=float, default=0.0, help="fraction of answers to damage before parsing")
+    parser.add_argument("--depth", type=int, default=3, help="fake LLM story depth")
+    parser.add_argument("--branching", type=int, default=3, help="fake LLM branching")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    settings.LLM_PROVIDERS = args.provider
+    settings.FAKE_LLM_DEPTH = args.depth
+    settings.FAKE_LLM_BRANCHING = args.branching
+    StoryGenerator._pipelines.clear()
+
+    results = {mode: run_mode(mode, args, random.Random(args.seed)) for mode in MODES}
+
+    print(f"provider: {args.provider}, {args.samples} stories per mode, {args.corrupt:.0%} of the answers damaged")
+    print(f"{'mode':<8} {'prompt tok':>10} {'answer tok':>10} {'tok/node':>8} {'nodes':>6} {'p50 ms':>8} {'parsed':>7} {'repaired':>8} {'failed':>7}")
+    for mode, row in results.items():
+        print(f"{mode:<8} {row['prompt_tokens']:>10.0f} {row['completion_tokens']:>10.0f} {row['completion_tokens_per_node']:>8.1f} {row['nodes']:>6.1f}"
+              f" {row['p50_ms']:>8.1f} {row['parsed']:>7.0%} {row['repaired']:>8.0%} {row['failed']:>7.0%}")
+    verbose, compact = results["verbose"], results["compact"]
+    total = lambda row: row["prompt_tokens"] + row["completion_tokens"]
+    print(f"\ncompact uses {1 - total(compact) / total(verbose):.0%} fewer tokens per story")
+    if args.save:
+        save_results(results, args.save)
+
+
+if __name__ == "__main__":
+    main()
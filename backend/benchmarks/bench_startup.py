@@ -0,0 +1,107 @@
+"""
+Cold start of one API process: how long until it answers its first request, for each startup configuration.
+Every sample is a new Python process that imports main, runs the app's lifespan startup and sends GET /api/jobs/{id} through httpx's ASGI transport (a 404, the answer doesn't matter), the same steps a uvicorn worker goes through minus the socket.
+
+* import:         `import main`
+* startup:        the lifespan startup (schema setup, LLM warm-up if it runs before serving, background loops)
+* first request:  from the start of the process until the first response, interpreter start-up included
+
+Configurations (SCHEMA_SETUP / LLM_WARM_UP):
+* startup:     schema setup and LLM warm-up both before serving, what every process did before both were made lazy
+* background:  schema setup in the lifespan, warm-up in a thread after startup (the default)
+* lazy:        warm-up on the first generation
+* migrate:     no schema work at all (run `python migrate.py` once per deploy), warm-up in the background
+
+Run from the backend directory:
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --provider gemini --save startup.json
+
+After the first process the OS file cache is warm, like on a host that restarts or scales up workers.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import LatencySamples, print_table, save_results
+
+CONFIGURATIONS = {
+    "startup": {"SCHEMA_SETUP": "lifespan", "LLM_WARM_UP": "startup"},
+    "background": {"SCHEMA_SETUP": "lifespan", "LLM_WARM_UP": "background"},
+    "lazy": {"SCHEMA_SETUP": "lifespan", "LLM_WARM_UP": "lazy"},
+    "migrate": {"SCHEMA_SETUP": "migrate", "LLM_WARM_UP": "background"},
+}
+
+# runs in the measured process; prints the seconds spent in each step as JSON, then exits without waiting for a background warm-up
+CHILD_SCRIPT = """
+import asyncio, json, os, time
+started = time.perf_counter()
+import httpx
+import main
+imported = time.perf_counter()
+
+async def first_request():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+            await client.get("/api/jobs/startup-probe")
+        print(json.dumps({"import": imported - started, "startup": ready - imported, "answered": time.perf_counter()}), flush=True)
+        os._exit(0)
+
+asyncio.run(first_request())
+"""
+
+
+def start_process(env: dict, timeout: float) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT], env=env, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["first request"] = timings.pop("answered") - started # perf_counter is the same clock in both processes (CLOCK_MONOTONIC)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="processes started per configuration")
+    parser.add_argument("--provider", default="fake", help="LLM_PROVIDERS of the started processes (their clients are created by the warm-up)")
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file, created before the runs")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_startup.db"),
+        "LLM_PROVIDERS": args.provider,
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "unused"),
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "unused"),
+    }
+    subprocess.run([sys.executable, "migrate.py"], env=env, check=True, capture_output=True) # the "migrate" configuration needs the schema to exist
+
+    samples = LatencySamples()
+    for name, overrides in CONFIGURATIONS.items():
+        run_env = {**env, **overrides}
+        for _ in range(args.runs):
+            try:
+                timings = start_process(run_env, args.timeout)
+            except (RuntimeError, subprocess.TimeoutExpired) as e:
+                print(f"{name}: {e}")
+                samples.error(f"first request ({name})")
+                continue
+            for step, seconds in timings.items():
+                samples.add(f"{step} ({name})", seconds)
+
+    summary = samples.summary()
+    print(f"provider: {args.provider}, {args.runs} processes per configuration")
+    print_table(summary)
+    if args.save:
+        save_results(summary, args.save)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare the row-per-node layout (STORY_STORAGE=rows) with packed stories (STORY_STORAGE=packed, core/story_pack.py), on stories shaped by core.fake_llm.FakeLLM:
+
+* size:  database file size per story after VACUUM, one SQLite file per layout
+* save:  StoryGenerator._save_story + commit
+* load:  routers.story.build_complete_story_tree on a fresh session (the work behind an uncached /complete response)
+
+The fake LLM repeats a lot of text, so compression looks better here than on real stories; run with --database-dir on a copy of real data (after pack_stories.py) for real numbers.
+
+Run from the backend directory:
+    python -m benchmarks.bench_story_storage
+    python -m benchmarks.bench_story_storage --stories 200 --rounds 50 --save storage.json
+
+Needs no network and no API key.
+"""
+import argparse
+import os
+import tempfile
+
+# Settings() needs these to exist, the benchmark never talks to an LLM
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import LatencySamples, print_table, save_results
+from core.config import settings
+from core.fake_llm import FakeLLM
+from core.story_generator import StoryGenerator
+from db.database import Base
+from models.story import Story
+from routers.story import build_complete_story_tree
+
+SHAPES = [(2, 2), (4, 2), (5, 3)] # (depth, branching): 7, 31 and 364 nodes
+LAYOUTS = { # name -> (STORY_STORAGE, STORY_PACK_COMPRESSION)
+    "rows": ("rows", None),
+    "packed": ("packed", "none"),
+    "packed+zlib": ("packed", "zlib"),
+    "packed+zstd": ("packed", "zstd"),
+}
+
+
+def bench_layout(samples: LatencySamples, directory: str, layout: str, story_structure, label: str, stories: int, rounds: int) -> float:
+    settings.STORY_STORAGE, compression = LAYOUTS[layout]
+    settings.STORY_PACK_COMPRESSION = compression or settings.STORY_PACK_COMPRESSION
+    path = os.path.join(directory, f"{layout}-{label.replace(' ', '_')}.db")
+    engine = create_engine("sqlite:///" + path)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    story_ids = []
+    for _ in range(stories):
+        with session_factory() as db:
+            with samples.measure(f"save {layout} ({label})"):
+                story = StoryGenerator._save_story(db, "benchmark", story_structure)
+                db.commit()
+            story_ids.append(story.id)
+
+    for index in range(rounds):
+        with session_factory() as db: # a fresh session each round, so the story is really loaded from the database
+            with samples.measure(f"load {layout} ({label})"):
+                build_complete_story_tree(db, db.get(Story, story_ids[index % len(story_ids)]))
+
+    with engine.connect() as connection:
+        connection.execute(text("VACUUM"))
+    engine.dispose()
+    return os.path.getsize(path) / stories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=100, help="stories saved per layout and shape (for the size)")
+    parser.add_argument("--rounds", type=int, default=50, help="loads measured per layout and shape")
+    parser.add_argument("--database-dir", default=None, help="where the SQLite files go, defaults to a temporary directory")
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    args = parser.parse_args()
+
+    directory = args.database_dir or tempfile.mkdtemp()
+    _, story_parser = StoryGenerator._build_prompt("benchmark", "story")
+    samples = LatencySamples()
+    sizes = {}
+    for depth, branching in SHAPES:
+        llm = FakeLLM(depth=depth, branching=branching)
+        label = f"{llm.node_count} nodes"
+        story_structure = StoryGenerator._parse_response(story_parser, llm.invoke(None))
+        for layout in LAYOUTS:
+            sizes[f"{layout} ({label})"] = bench_layout(samples, directory, layout, story_structure, label, args.stories, args.rounds)
+
+    summary = samples.summary()
+    print(f"{args.stories} stories per layout and shape, databases in {directory}")
+    print_table(summary)
+    print(f"\n{'':<28} {'bytes/story':>12} {'vs rows':>8}")
+    for name, size in sizes.items():
+        rows_size = sizes["rows (" + name.split(" (", 1)[1]]
+        print(f"{name:<28} {size:>12.0f} {size / rows_size:>8.0%}")
+    if args.save:
+        save_results({"latency": summary, "bytes_per_story": sizes}, args.save)
+
+
+if __name__ == "__main__":
+    main()
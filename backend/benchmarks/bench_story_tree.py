@@ -0,0 +1,104 @@
+"""
+Microbenchmarks for the per-story work that doesn't involve the LLM, on stories shaped by core.fake_llm.FakeLLM:
+
+* parse:     StoryGenerator._parse_response (LLM text -> StoryLLMResponse)
+* recursive: StoryGenerator._process_story_node (INSERT + flush per node)
+* bulk:      StoryGenerator._persist_story_nodes
+* tree:      routers.story.build_complete_story_tree (load the nodes and build the /complete response)
+
+Run from the backend directory:
+    python -m benchmarks.bench_story_tree
+    python -m benchmarks.bench_story_tree --rounds 50 --save baseline.json
+    python -m benchmarks.bench_story_tree --baseline baseline.json --tolerance 0.3   # exit 1 on a regression, for CI
+
+Needs no network and no API key.
+"""
+import argparse
+import os
+import tempfile
+
+# Settings() needs these to exist, the benchmark never talks to an LLM
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("OPENAI_API_KEY", "unused")
+os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.common import LatencySamples, print_table, save_results, check_baseline
+from core.fake_llm import FakeLLM
+from core.story_generator import StoryGenerator
+from db.database import Base
+from models.story import Story
+from routers.story import build_complete_story_tree
+
+SHAPES = [(2, 2), (4, 2), (5, 3), (8, 2)] # (depth, branching): 7, 31, 364 and 511 nodes
+
+
+def save_story(session_factory, story_structure, persist) -> int:
+    db = session_factory()
+    try:
+        story = Story(title=story_structure.title, session_id="benchmark")
+        db.add(story)
+        db.flush()
+        persist(db, story.id, story_structure.rootNode)
+        db.commit()
+        return story.id
+    finally:
+        db.close()
+
+
+def bench_shape(samples: LatencySamples, session_factory, depth: int, branching: int, rounds: int):
+    llm = FakeLLM(depth=depth, branching=branching)
+    label = f"{llm.node_count} nodes"
+    _, story_parser = StoryGenerator._build_prompt("benchmark", "story")
+    raw_response = llm.invoke(None)
+
+    for _ in range(rounds):
+        with samples.measure(f"parse ({label})"):
+            story_structure = StoryGenerator._parse_response(story_parser, raw_response)
+
+    for name, persist in (("recursive", lambda db, story_id, root: StoryGenerator._process_story_node(db, story_id, root, is_root=True)),
+                          ("bulk", StoryGenerator._persist_story_nodes)):
+        for _ in range(rounds):
+            with samples.measure(f"{name} ({label})"):
+                story_id = save_story(session_factory, story_structure, persist)
+
+    for _ in range(rounds):
+        db = session_factory() # a fresh session each round, so the nodes are really loaded from the database
+        try:
+            with samples.measure(f"tree ({label})"):
+                build_complete_story_tree(db, db.get(Story, story_id))
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="compare the p50s with a saved JSON and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench_story_tree.db")
+    engine = create_engine(database_url)
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    print(f"database: {engine.url.render_as_string(hide_password=True)}, rounds: {args.rounds}")
+    samples = LatencySamples()
+    for depth, branching in SHAPES:
+        bench_shape(samples, session_factory, depth, branching, args.rounds)
+
+    summary = samples.summary()
+    print_table(summary)
+    if args.save:
+        save_results(summary, args.save)
+    if args.baseline:
+        check_baseline(summary, args.baseline, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
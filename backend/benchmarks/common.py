@@ -0,0 +1,111 @@
+"""
+Helpers shared by the benchmark scripts: latency percentiles, result tables, and saving / comparing results so a CI job can fail on a regression.
+
+    samples = LatencySamples()
+    samples.add("GET /api/jobs/{id}", 0.004)
+    print_table(samples.summary())
+    check_baseline(samples.summary(), "baseline.json", tolerance=0.25) # exits with 1 if a p50 got >25% slower
+"""
+import json
+import math
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+def percentile(values, fraction: float) -> float:
+    # nearest-rank percentile, good enough for latency reports and stable for small sample counts
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class LatencySamples:
+    def __init__(self):
+        self.samples = defaultdict(list) # name -> seconds
+        self.errors = defaultdict(int)
+
+    def add(self, name: str, seconds: float):
+        self.samples[name].append(seconds)
+
+    def error(self, name: str):
+        self.errors[name] += 1
+
+    @contextmanager
+    def measure(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    # {name: {"count", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms", "per_second"}}; per_second only when the wall time of the run is given
+    def summary(self, wall_seconds: float = None) -> dict:
+        result = {}
+        for name in list(self.samples) + [name for name in self.errors if name not in self.samples]: # in the order they were first measured
+            values = self.samples.get(name, [])
+            row = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "p50_ms": percentile(values, 0.50) * 1000,
+                "p95_ms": percentile(values, 0.95) * 1000,
+                "p99_ms": percentile(values, 0.99) * 1000,
+                "max_ms": max(values, default=0.0) * 1000,
+            }
+            if wall_seconds:
+                row["per_second"] = len(values) / wall_seconds
+            result[name] = row
+        return result
+
+
+def print_table(summary: dict, title: str = None):
+    if title:
+        print(f"\n{title}")
+    width = max([len(name) for name in summary] + [10])
+    has_rate = any("per_second" in row for row in summary.values())
+    header = f"{'':<{width}} {'count':>7} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header + (f" {'per s':>8}" if has_rate else ""))
+    for name, row in summary.items():
+        line = (f"{name:<{width}} {row['count']:>7} {row['errors']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f}"
+                f" {row['p99_ms']:>9.2f} {row['max_ms']:>9.2f}")
+        if has_rate:
+            line += f" {row.get('per_second', 0.0):>8.1f}"
+        print(line)
+
+
+def save_results(summary: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2, sort_keys=True)
+    print(f"\nresults written to {path}")
+
+
+# Compare the p50 of every benchmark with a saved run and exit with status 1 when one is slower by more than `tolerance` (0.25 = 25%).
+# p50 is used because p95/p99 of short CI runs are too noisy to gate on.
+def check_baseline(summary: dict, baseline_path: str, tolerance: float):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for name, row in summary.items():
+        before = baseline.get(name, {}).get("p50_ms")
+        if not before:
+            continue
+        change = row["p50_ms"] / before - 1
+        status = "REGRESSION" if change > tolerance else "ok"
+        print(f"{name}: p50 {before:.2f} -> {row['p50_ms']:.2f} ms ({change:+.0%}) {status}")
+        if change > tolerance:
+            regressions.append(name)
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than {baseline_path} by more than {tolerance:.0%}")
+        sys.exit(1)
+
+
+# Make StoryGenerator use `llm` (e.g. a configured FakeLLM) instead of building a real client, for the rest of the process
+def use_fake_llm(llm):
+    from core.story_generator import StoryGenerator
+    StoryGenerator._get_llm = classmethod(lambda cls: llm)
+    return llm
@@ -0,0 +1,224 @@
+"""
+End-to-end load test: virtual users run the same flow as the frontend against the FastAPI app, with the LLM replaced by core.fake_llm.FakeLLM.
+
+    POST /api/stories/create  ->  GET /api/jobs/{id}?wait=30 (long-poll until finished)  ->  GET /api/stories/{id}/complete
+
+Run from the backend directory:
+    python -m benchmarks.load_test                                  # 200 stories, 20 users, in-process app on a throwaway SQLite file
+    python -m benchmarks.load_test --stories 1000 --users 100 --latency 2 --jitter 1 --depth 4
+    python -m benchmarks.load_test --themes 5                       # only 5 distinct themes, exercises the generation cache
+    python -m benchmarks.load_test --stream                         # STREAM_GENERATION=True
+    python -m benchmarks.load_test --base-url http://localhost:8000 # a running server (start it with LLM_PROVIDERS=fake)
+
+Reports throughput and p50/p95/p99 per endpoint, for the whole flow, and (in-process only) for every generation stage:
+queue wait, LLM call, parsing, saving the nodes and rendering the /complete payload.
+With --poll-interval 0 (the default) the job request is a long-poll, so its latency includes the time spent waiting for the story.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
+from functools import wraps
+
+from benchmarks.common import LatencySamples, print_table, save_results, check_baseline
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stories", type=int, default=200, help="flows to run in total")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users, each runs its flows one after the other")
+    parser.add_argument("--themes", type=int, default=0, help="number of distinct themes (0: a new theme for every story, so no cache hits)")
+    parser.add_argument("--poll-interval", type=float, default=0.0, help="seconds between job polls, 0 uses long-polling like the frontend")
+    parser.add_argument("--base-url", default=None, help="load test a running server instead of the in-process app")
+    # in-process only
+    parser.add_argument("--database-url", default=None, help="defaults to a throwaway SQLite file")
+    parser.add_argument("--depth", type=int, default=3, help="fake story depth")
+    parser.add_argument("--branching", type=int, default=2, help="fake story options per node")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.1, help="fake LLM extra random seconds per call")
+    parser.add_argument("--stream", action="store_true", help="generate with STREAM_GENERATION=True")
+    parser.add_argument("--generation-concurrency", type=int, default=None, help="override GENERATION_MAX_CONCURRENCY")
+    # CI
+    parser.add_argument("--save", default=None, help="write the results as JSON")
+    parser.add_argument("--baseline", default=None, help="compare the p50s with a saved JSON and exit 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    return parser.parse_args()
+
+
+# Wrap the generation steps of the in-process app so each one reports its duration. The functions are looked up by name at call time, so replacing the attributes is enough.
+def instrument_stages(samples: LatencySamples, llm, queued_at: dict):
+    from core.story_generator import StoryGenerator
+    from routers import story as story_router
+
+    def timed(name, function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with samples.measure(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def timed_async(name, function):
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            with samples.measure(name):
+                return await function(*args, **kwargs)
+        return wrapper
+
+    def timed_stream(name, function):
+        @wraps(function)
+        async def wrapper(*args, **kwargs):
+            with samples.measure(name): # first chunk requested -> last chunk received
+                async for chunk in function(*args, **kwargs):
+                    yield chunk
+        return wrapper
+
+    llm.ainvoke = timed_async("stage: llm call", llm.ainvoke)
+    llm.astream = timed_stream("stage: llm stream (incl. saving)", llm.astream)
+    StoryGenerator._parse_or_salvage = classmethod(timed("stage: parse", StoryGenerator._parse_or_salvage.__func__)) # _parse_response goes through it too
+    StoryGenerator._save_story = classmethod(timed("stage: save nodes", StoryGenerator._save_story.__func__))
+    story_router.store_complete_payload = timed("stage: render /complete", story_router.store_complete_payload)
+
+    run_story_job = story_router.run_story_job
+    async def run_story_job_with_queue_wait(db, job, worker_id):
+        created = queued_at.pop(job.job_id, None)
+        if created is not None:
+            samples.add("stage: queue wait", time.perf_counter() - created)
+        with samples.measure("stage: job total"):
+            return await run_story_job(db, job, worker_id)
+    story_router.run_story_job = run_story_job_with_queue_wait
+
+
+@asynccontextmanager
+async def in_process_client_factory(args, samples: LatencySamples, queued_at: dict):
+    # the app reads its settings at import time, so point it at the benchmark database first
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "load_test.db")
+    os.environ["DATABASE_URL"] = database_url
+    os.environ["ASYNC_DATABASE_URL"] = ""
+    os.environ.setdefault("OPENAI_API_KEY", "unused")
+    os.environ.setdefault("GEMINI_API_KEY", "unused")
+
+    import httpx
+    from core.config import settings
+    from core.llm_providers import get_llm_router
+    from core.scheduler import generation_scheduler
+    import main
+
+    settings.STREAM_GENERATION = args.stream
+    if args.generation_concurrency:
+        generation_scheduler.max_concurrency = args.generation_concurrency
+    generation_scheduler.max_queue = max(generation_scheduler.max_queue, args.users * 2) # measure the service, not its admission control
+    # the fake goes through the provider router like a real model would
+    settings.LLM_PROVIDERS = "fake"
+    settings.FAKE_LLM_DEPTH, settings.FAKE_LLM_BRANCHING = args.depth, args.branching
+    settings.FAKE_LLM_LATENCY_SECONDS, settings.FAKE_LLM_JITTER_SECONDS = args.latency, args.jitter
+    llm = get_llm_router().providers[0].client
+    instrument_stages(samples, llm, queued_at)
+
+    print(f"in-process app, database: {database_url}")
+    print(f"fake LLM: {llm.node_count} nodes per story, {args.latency}s + up to {args.jitter}s per call, stream={args.stream}, "
+          f"generation concurrency {generation_scheduler.max_concurrency}")
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app): # start the notification bus and the recovery loop like uvicorn would
+        yield lambda: httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=120)
+
+
+@asynccontextmanager
+async def remote_client_factory(args):
+    import httpx
+    print(f"server: {args.base_url}")
+    yield lambda: httpx.AsyncClient(base_url=args.base_url, timeout=120)
+
+
+async def request(samples: LatencySamples, client, name: str, method: str, url: str, **kwargs):
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except Exception:
+        samples.error(name)
+        raise
+    samples.add(name, time.perf_counter() - started)
+    if response.status_code >= 400 and response.status_code != 429:
+        samples.error(name)
+    return response
+
+
+async def run_flow(args, samples: LatencySamples, client, theme: str, queued_at: dict):
+    flow_started = time.perf_counter()
+    while True:
+        response = await request(samples, client, "POST /api/stories/create", "POST", "/api/stories/create", json={"theme": theme})
+        if response.status_code != 429:
+            break
+        samples.error("rejected (429)")
+        await asyncio.sleep(min(float(response.headers.get("Retry-After", 1)), 1.0))
+    response.raise_for_status()
+    job = response.json()
+    queued_at.setdefault(job["job_id"], flow_started)
+
+    poll_name = "GET /api/jobs/{id}" + ("?wait" if not args.poll_interval else "")
+    while job["status"] not in FINISHED_STATUSES:
+        if args.poll_interval:
+            await asyncio.sleep(args.poll_interval)
+            params = {}
+        else:
+            params = {"wait": 30}
+        response = await request(samples, client, poll_name, "GET", f"/api/jobs/{job['job_id']}", params=params)
+        response.raise_for_status()
+        job = response.json()
+
+    if job["status"] != "completed":
+        samples.error("flow")
+        return
+    response = await request(samples, client, "GET /api/stories/{id}/complete", "GET", f"/api/stories/{job['story_id']}/complete")
+    response.raise_for_status()
+    samples.add("flow: create -> complete", time.perf_counter() - flow_started)
+
+
+async def run(args):
+    samples = LatencySamples()
+    queued_at = {} # job_id -> time its flow started, read by the queue wait stage
+    factory = remote_client_factory(args) if args.base_url else in_process_client_factory(args, samples, queued_at)
+
+    async with factory as make_client:
+        remaining = iter(range(args.stories))
+        run_id = uuid.uuid4().hex[:6] # keeps the themes of separate runs apart in a long-running server's generation cache
+
+        async def user():
+            async with make_client() as client: # own cookie jar, so every virtual user is its own session
+                for index in remaining: # the users share one iterator, together they run exactly --stories flows
+                    theme = f"load test {run_id} theme {index % args.themes if args.themes else index}"
+                    try:
+                        await run_flow(args, samples, client, theme, queued_at)
+                    except Exception as e:
+                        samples.error("flow")
+                        print(f"flow failed: {e!r}")
+
+        print(f"{args.stories} stories, {args.users} users\n")
+        started = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(args.users)))
+        wall_seconds = time.perf_counter() - started
+
+    summary = samples.summary(wall_seconds)
+    flows = summary.get("flow: create -> complete", {}).get("count", 0)
+    print(f"wall time {wall_seconds:.2f}s, {flows} completed flows, {flows / wall_seconds:.1f} stories/s")
+    print_table({name: row for name, row in summary.items() if not name.startswith("stage:")}, "requests and flows")
+    stages = {name: row for name, row in summary.items() if name.startswith("stage:")}
+    if stages:
+        print_table(stages, "generation stages")
+    if args.save:
+        save_results(summary, args.save)
+    if args.baseline:
+        check_baseline(summary, args.baseline, args.tolerance)
+
+
+def main():
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
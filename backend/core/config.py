@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import field_validator
 
@@ -7,9 +7,90 @@ class Settings(BaseSettings):
     API_PREFIX: str = "/api" # default prefix for all API endpoints, e.g., /api/generate-story
     DEBUG: bool = False
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: str = "" # optional, when empty it is derived from DATABASE_URL by swapping in an async driver (aiosqlite / asyncpg)
+    DATABASE_READ_URL: str = "" # optional read replica for the read-only paths (job status polls, /complete); empty: they read from DATABASE_URL
+    DB_ENGINE_PROFILE: str = "auto" # connection pool and driver options (db/engine_profiles.py): "auto" picks "sqlite" or "server" from the URL; "default" keeps SQLAlchemy's defaults
+    DB_POOL_SIZE: Optional[int] = None # connections each engine keeps open (unset: the profile's value)
+    DB_MAX_OVERFLOW: Optional[int] = None # extra connections an engine may open under load beyond DB_POOL_SIZE
+    DB_POOL_PRE_PING: Optional[bool] = None # check a pooled connection before using it, so one closed by a database restart isn't handed to a request
+    DB_POOL_RECYCLE_SECONDS: Optional[int] = None # replace connections older than this, before a proxy's idle timeout closes them (-1: never)
+    DB_STATEMENT_CACHE_SIZE: Optional[int] = None # prepared statements the driver caches per connection (sqlite3, asyncpg); 0 turns it off, e.g. behind PgBouncer in transaction mode
+    DB_SQLITE_BUSY_TIMEOUT_MS: int = 5000 # in the sqlite profile, how long a writer waits for the write lock before "database is locked"
     ALLOWED_ORIGINS: str = ""
     OPENAI_API_KEY: str
     GEMINI_API_KEY: str
+    LLM_PROVIDERS: str = "gemini" # comma-separated providers the router may use: gemini, openai, fake (offline, core/fake_llm.py, for benchmarks and load tests)
+    LLM_MODEL: str = "gemini-2.5-flash" # Gemini model
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    PROMPT_MODE: str = "verbose" # "verbose": the full prompt and JSON schema; "compact": a short prompt, one-letter keys and the provider's JSON mode (fewer tokens per story, see benchmarks/bench_prompt_modes.py)
+    GEMINI_REQUESTS_PER_MINUTE: int = 0 # quota of the Gemini key, calls are paced to stay just under it (0: no limit)
+    OPENAI_REQUESTS_PER_MINUTE: int = 0 # quota of the OpenAI key (0: no limit)
+    LLM_PROVIDER_COOLDOWN_SECONDS: int = 30 # a failing provider gets no calls for this long, doubled for every further consecutive error
+    FAKE_LLM_DEPTH: int = 3 # levels below the root node in the fake stories
+    FAKE_LLM_BRANCHING: int = 2 # options per non-ending node in the fake stories
+    FAKE_LLM_LATENCY_SECONDS: float = 0.0 # simulated time per fake LLM call
+    FAKE_LLM_JITTER_SECONDS: float = 0.0 # up to this much extra random time per fake LLM call
+    FAKE_LLM_TOKENS_PER_SECOND: float = 0.0 # simulated output speed of the fake LLM, 0 for instant answers
+    NOTIFICATION_BACKEND_URL: str = "" # empty: job/story notifications stay inside this process; redis://host:6379/0 shares them between API replicas and workers
+    STREAM_GENERATION: bool = False # stream the LLM output and save nodes as they are generated, see GET /stories/{id}/stream
+    FANOUT_GENERATION: bool = False # outline the story first, then write its branches with parallel, smaller LLM calls (larger stories in about the same time)
+    FANOUT_CONCURRENCY: int = 4 # LLM calls one fan-out story may run at the same time
+    FANOUT_OUTLINE_LEVELS: int = 1 # levels written as outlines before the branches are expanded, each adds one round of calls and multiplies the story size by 2-3
+    FANOUT_SUBTREE_DEPTH: int = 3 # levels per branch written by one subtree call
+    JSON_REPAIR_ENABLED: bool = True # repair malformed or truncated LLM JSON (comments, trailing commas, cut-off tail) instead of failing the attempt
+    JSON_SALVAGE_MIN_NODES: int = 7 # a repaired story with fewer nodes gets its cut-off branches regenerated (one subtree call each)
+    GENERATION_MAX_CONCURRENCY: int = 8 # LLM generations running at the same time in this process
+    GENERATION_MAX_QUEUE: int = 200 # jobs allowed to wait for a free slot, beyond that POST /stories/create answers 429
+    GENERATION_MAX_QUEUE_PER_SESSION: int = 3 # waiting jobs allowed per session_id
+    BATCH_MAX_THEMES: int = 500 # themes accepted by one POST /stories/batch
+    BATCH_CONCURRENCY: int = 4 # batch stories generated at the same time by this process, all batches together (inprocess mode; in worker mode the workers' concurrency applies)
+    BATCH_MAX_PENDING_PER_SESSION: int = 500 # unfinished batch jobs allowed per session_id, beyond that POST /stories/batch answers 429
+    JOB_EXECUTION_MODE: str = "inprocess" # "inprocess": the API process generates the stories; "worker": the API only queues jobs and `python worker.py` processes generate them
+    JOB_LEASE_SECONDS: int = 60 # a job whose worker hasn't sent a heartbeat for this long is considered abandoned and requeued
+    JOB_HEARTBEAT_SECONDS: int = 15
+    JOB_MAX_ATTEMPTS: int = 3 # a job is marked failed after this many attempts
+    JOB_RETRY_BACKOFF_SECONDS: int = 10 # wait before the 2nd attempt, doubled for every further attempt
+    JOB_POLL_SECONDS: float = 1.0 # how often an idle worker looks for new jobs
+    JOB_RECOVERY_INTERVAL_SECONDS: int = 30 # how often abandoned jobs are looked for
+    WORKER_CONCURRENCY: int = 4 # generations one worker process runs at the same time
+    GENERATION_CACHE_SIZE: int = 256 # how many themes the generation cache remembers (least recently used are dropped first), 0 turns the cache off
+    GENERATION_CACHE_TTL_SECONDS: int = 3600 # a cached story is served for at most this long after it was generated
+    GENERATION_CACHE_VARIETY: int = 3 # generate fresh stories until a theme has this many cached, then serve them in turn
+    STORY_STORAGE: str = "rows" # "rows": one story_nodes row per node; "packed": the whole tree as one blob on the story row (core/story_pack.py), streamed stories are always saved as rows
+    STORY_PACK_COMPRESSION: str = "zstd" # compression of packed stories: zstd (zlib when zstandard isn't installed), zlib or none
+    STORY_LIST_PAGE_SIZE: int = 20 # stories per page of GET /stories when no limit is given
+    STORY_LIST_MAX_PAGE_SIZE: int = 100 # largest limit GET /stories accepts
+    COMPLETE_STORY_CACHE_BYTES: int = 64 * 1024 * 1024 # memory for pre-rendered /stories/{id}/complete responses (all compressed variants included)
+    COMPLETE_STORY_CACHE_TTL_SECONDS: int = 600 # a cached response is looked up in the database again after this long, so a story deleted by another process (sweep.py, another replica) stops being served (0: kept until evicted)
+    STORY_POOL_ENABLED: bool = False # keep finished stories in stock for the most requested themes, so those requests complete immediately
+    STORY_POOL_SIZE: int = 3 # stories kept in stock per popular theme
+    STORY_POOL_THEMES: int = 10 # how many of the most requested themes are stocked
+    STORY_POOL_MIN_REQUESTS: int = 5 # a theme needs at least this many requests in the window to be stocked
+    STORY_POOL_WINDOW_HOURS: float = 24 # how far back requests count towards a theme's popularity
+    STORY_POOL_REFILL_INTERVAL_SECONDS: int = 300 # how often the pool checks its stock and refills it
+    STORY_POOL_MAX_PER_HOUR: int = 20 # generation budget of the pool, stories per hour and process
+    STORY_POOL_BUSY_JOBS: int = 2 # refills only run while fewer jobs than this are pending or processing
+    STORY_EVENTS_BUFFER_SIZE: int = 20000 # playthrough events one process holds in memory (plus one per path node of a "finish" event); when full, new events are dropped (and counted) instead of waiting for the database
+    STORY_EVENTS_FLUSH_SIZE: int = 1000 # write the buffered events as soon as this many are waiting...
+    STORY_EVENTS_FLUSH_SECONDS: float = 2.0 # ...or at the latest after this long
+    STORY_EVENTS_MAX_PER_REQUEST: int = 200 # events accepted by one POST /stories/{id}/events
+    STORY_EVENTS_MAX_PATH: int = 50 # nodes in the path of a "finish" event; longer than any story is deep, players going back and forth are counted once per node anyway
+    STORY_EVENTS_STORE_RAW: bool = True # also keep every event in playthrough_events, not only the per-node aggregates in story_node_stats
+    RETENTION_ENABLED: bool = False # periodically delete old jobs and stories (core/retention.py)
+    RETENTION_DRY_RUN: bool = False # sweep without deleting: only count what would go, see GET /api/stories/retention/stats
+    RETENTION_INTERVAL_SECONDS: int = 3600 # time between two sweeps
+    RETENTION_COMPLETED_JOB_DAYS: float = 30 # completed jobs are deleted this long after they finished (0: kept forever), their stories stay
+    RETENTION_FAILED_JOB_DAYS: float = 7 # failed jobs are deleted this long after they failed (0: kept forever); pending and processing jobs are never deleted
+    RETENTION_STORY_DAYS: float = 180 # stories nobody has opened for this long are deleted with their nodes and jobs (0: kept forever)
+    RETENTION_EVENT_DAYS: float = 90 # raw playthrough events are deleted after this long (0: kept forever); the per-node aggregates stay with their story
+    RETENTION_ORPHAN_GRACE_HOURS: float = 24 # stories without a session (and not in the warm pool) are deleted once they are this old
+    RETENTION_BATCH_SIZE: int = 500 # rows per delete transaction, small enough that no lock is held for long
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.05 # pause between two delete transactions, lets other writers in
+    RETENTION_ARCHIVE_DIR: str = "" # if set, deleted jobs and stories are first appended to gzipped JSON lines files in this directory
+    RETENTION_ACCESS_FLUSH_SECONDS: int = 60 # how often the story ids opened in this process are written to stories.last_opened_at
+    SCHEMA_SETUP: str = "lifespan" # "lifespan": the API (and worker.py) create missing tables, columns and indexes when they start; "migrate": only `python migrate.py` does, so new replicas start without schema work
+    LLM_WARM_UP: str = "background" # "startup": import langchain, compile the prompts and create the LLM clients before serving; "background": in a thread right after startup; "lazy": on the first generation
+    OTEL_ENABLED: bool = False # also record the generation stages as OpenTelemetry spans (needs opentelemetry-api, export is configured through the standard OTEL_* variables)
     # parse the ALLOWED_ORIGINS string from the .env file into a list of origins because .env doesn't support list type, so we need to parse it manually. The field_validator decorator is used to define a validation function for the ALLOWED_ORIGINS field. This function takes the string value from the .env file, splits it by commas, and returns a list of origins. If the string is empty, it returns an empty list. This allows us to easily manage CORS settings in our application by simply updating the ALLOWED_ORIGINS variable in the .env file.
     @field_validator("ALLOWED_ORIGINS")
     def parse_allowed_origins(cls, v: str) -> List[str]:
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import random
+import time
+
+"""
+An offline stand-in for the chat model, so the whole generation pipeline can be run and measured without an API key, network or cost.
+
+It answers every prompt with a valid StoryLLMResponse JSON document of a configurable shape:
+
+    depth=3, branching=2   ->  1 + 2 + 4 + 8 = 15 nodes, the 8 leaves are endings
+    latency=2.0, jitter=0.5 -> every call takes 2.0 to 2.5 seconds, like a real completion
+    tokens_per_second=100   -> plus the time to "write" the answer, so bigger answers take longer
+
+and implements the three calls StoryGenerator makes on a model: invoke(), ainvoke() and astream().
+The fan-out prompts get an outline or a single branch instead, recognised by the schema in their format instructions.
+Select it with LLM_PROVIDERS=fake (shaped by the FAKE_LLM_* settings), or install an instance with benchmarks.common.use_fake_llm().
+"""
+
+WORDS = ("the", "cave", "glows", "a", "door", "opens", "into", "darkness", "you", "hear", "footsteps", "behind", "and", "a", "voice", "calls", "your", "name")
+
+
+class FakeMessage:
+    # the attributes StoryGenerator reads from a model response (and from a streamed chunk)
+    def __init__(self, content: str, input_tokens: int = 0, output_tokens: int = None, usage: bool = True):
+        self.content = content
+        self.usage_metadata = {"input_tokens": input_tokens, "output_tokens": estimate_tokens(content) if output_tokens is None else output_tokens} if usage else None
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4 # roughly 4 characters per token for English text and JSON
+
+
+class FakeLLM:
+    def __init__(self, depth: int = 3, branching: int = 2, latency: float = 0.0, jitter: float = 0.0,
+                 tokens_per_second: float = 0.0, words_per_node: int = 40, chunk_size: int = 40, seed: int = 0):
+        self.depth = depth
+        self.branching = branching
+        self.latency = latency # seconds per call before the first token, spread over the chunks when streaming
+        self.jitter = jitter # up to this many extra seconds, drawn at random per call
+        self.tokens_per_second = tokens_per_second # output speed, 0 means instant; makes long completions slower than short ones like on a real model
+        self.words_per_node = words_per_node
+        self.chunk_size = chunk_size # characters per streamed chunk, a few tokens like a real stream
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.text = json.dumps(self.build_story())
+
+    @property
+    def node_count(self) -> int:
+        return sum(self.branching ** level for level in range(self.depth + 1))
+
+    def _content(self, number: int) -> str:
+        return f"Scene {number}: " + " ".join(WORDS[(number + i) % len(WORDS)] for i in range(self.words_per_node))
+
+    def build_node(self, depth: int) -> dict:
+        counter = {"next": 0}
+
+        def node(level: int) -> dict:
+            number = counter["next"]
+            counter["next"] += 1
+            if level == depth:
+                return {"content": self._content(number), "isEnding": True, "isWinningEnding": number % 3 == 0, "options": None}
+            return {
+                "content": self._content(number),
+                "isEnding": False,
+                "isWinningEnding": False,
+                "options": [{"text": f"Choice {number}.{i + 1}", "nextNode": node(level + 1)} for i in range(self.branching)],
+            }
+
+        return node(0)
+
+    def build_story(self) -> dict:
+        return {"title": f"Fake story ({self.node_count} nodes)", "rootNode": self.build_node(self.depth)}
+
+    # the same story with the one-letter keys of PROMPT_MODE=compact (core.models.CompactStoryLLM), false flags left out
+    def build_compact_story(self) -> dict:
+        def compact(node: dict) -> dict:
+            result = {"c": node["content"]}
+            if node["isEnding"]:
+                result["e"] = True
+            if node["isWinningEnding"]:
+                result["w"] = True
+            if node["options"]:
+                result["o"] = [{"t": option["text"], "n": compact(option["nextNode"])} for option in node["options"]]
+            return result
+
+        story = self.build_story()
+        return {"t": story["title"], "r": compact(story["rootNode"])}
+
+    def build_outline(self) -> dict:
+        return {
+            "content": self._content(0),
+            "isEnding": False,
+            "isWinningEnding": False,
+            "branches": [{"text": f"Choice {i + 1}", "summary": f"Where choice {i + 1} leads"} for i in range(self.branching)],
+        }
+
+    # Answer in the schema the prompt's format instructions ask for: a whole story (verbose or compact), a story or node outline (fan-out mode), or a single subtree
+    def _respond(self, prompt_value) -> str:
+        prompt_text = prompt_value.to_string() if hasattr(prompt_value, "to_string") else str(prompt_value)
+        if '"r": NODE' in prompt_text: # core.prompts.COMPACT_FORMAT_INSTRUCTIONS
+            return json.dumps(self.build_compact_story())
+        if '"branches"' in prompt_text:
+            if '"rootNode"' in prompt_text:
+                return json.dumps({"title": "Fake outlined story", "rootNode": self.build_outline()})
+            return json.dumps(self.build_outline())
+        if '"rootNode"' in prompt_text or prompt_value is None:
+            return self.text
+        return json.dumps(self.build_node(self.depth))
+
+    def _call_seconds(self, text: str) -> float:
+        self.calls += 1
+        seconds = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.tokens_per_second:
+            seconds += estimate_tokens(text) / self.tokens_per_second
+        return seconds
+
+    def _prompt_tokens(self, prompt_value) -> int:
+        return estimate_tokens(prompt_value.to_string()) if hasattr(prompt_value, "to_string") else 0
+
+    def invoke(self, prompt_value) -> FakeMessage:
+        text = self._respond(prompt_value)
+        time.sleep(self._call_seconds(text))
+        return FakeMessage(text, self._prompt_tokens(prompt_value))
+
+    async def ainvoke(self, prompt_value) -> FakeMessage:
+        text = self._respond(prompt_value)
+        await asyncio.sleep(self._call_seconds(text))
+        return FakeMessage(text, self._prompt_tokens(prompt_value))
+
+    async def astream(self, prompt_value):
+        text = self._respond(prompt_value)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)]
+        delay = self._call_seconds(text) / len(chunks)
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield FakeMessage(chunk, usage=False)
+        yield FakeMessage("", self._prompt_tokens(prompt_value), estimate_tokens(text)) # like the real providers, the token usage of the whole stream comes with a last, empty chunk
@@ -0,0 +1,127 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from core.config import settings
+from core.prompts import STORY_PROMPT_VERSION
+
+"""
+A cache in front of the LLM, so popular themes don't pay for a full generation every time.
+
+* Key: the normalized theme ("  Fantasy " and "fantasy" are the same) + prompt version + prompt mode + fan-out flag + model name, so changing the prompt, the way it is sent or the model never serves stale stories.
+* Variety: the first GENERATION_CACHE_VARIETY requests for a theme still generate fresh stories; after that the cached ones are handed out in turn.
+* Eviction: least recently used themes are dropped past GENERATION_CACHE_SIZE entries, and a story expires GENERATION_CACHE_TTL_SECONDS after it was generated.
+* Single flight: while a story for a key is being generated, identical requests wait for that generation instead of starting their own LLM call.
+
+The cache only stores story ids, the stories themselves stay in the database. Each process has its own cache, so a story deleted by another process (sweep.py, another replica's retention sweep) can still be in it: a hit is only served after `exists` confirmed the story is still there.
+"""
+
+
+def normalize_theme(theme: str) -> str:
+    return " ".join(theme.split()).casefold()
+
+
+class GenerationCache:
+    def __init__(self, max_entries: int, ttl_seconds: float, variety: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variety = max(variety, 1)
+        self._entries = OrderedDict() # key -> {"stories": [(story_id, generated_at)], "next": index of the story to serve next}; oldest access first
+        self._in_flight = {} # key -> Future resolved with the story id of the running generation
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expirations": 0, "deleted": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def make_key(self, theme: str) -> tuple:
+        return (normalize_theme(theme), STORY_PROMPT_VERSION, settings.PROMPT_MODE, settings.FANOUT_GENERATION, settings.LLM_MODEL)
+
+    # `generate` is an async function that creates a new story and returns its id. It is only called on a miss.
+    # `exists`, an async function taking a story id, checks a cached story is still in the database before it is handed out.
+    async def get_or_generate(self, theme: str, generate, exists=None) -> int:
+        if not self.enabled:
+            return await generate()
+
+        key = self.make_key(theme)
+        story_id = self._pick(key)
+        while story_id is not None and exists is not None and not await exists(story_id):
+            self.forget_stories([story_id]) # deleted since it was cached, try the next one
+            self.stats["deleted"] += 1
+            story_id = self._pick(key)
+        if story_id is not None:
+            self.stats["hits"] += 1
+            return story_id
+
+        if key in self._in_flight:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(self._in_flight[key]) # shield: a cancelled waiter must not cancel the generation everyone else waits for
+
+        self.stats["misses"] += 1
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception()) # mark a failure as seen even if nobody else was waiting for it
+        self._in_flight[key] = future
+        try:
+            story_id = await generate()
+            self._store(key, story_id)
+            future.set_result(story_id)
+            return story_id
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del self._in_flight[key]
+
+    def _pick(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        now = time.monotonic()
+        fresh = [(story_id, generated_at) for story_id, generated_at in entry["stories"] if now - generated_at < self.ttl_seconds]
+        self.stats["expirations"] += len(entry["stories"]) - len(fresh)
+        entry["stories"] = fresh
+        if not fresh:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key) # mark as most recently used
+        if len(fresh) < self.variety:
+            return None # not enough different stories yet, generate another one
+        entry["next"] %= len(fresh)
+        story_id = fresh[entry["next"]][0]
+        entry["next"] += 1
+        return story_id
+
+    def _store(self, key: tuple, story_id: int):
+        entry = self._entries.setdefault(key, {"stories": [], "next": 0})
+        entry["stories"] = entry["stories"][-(self.variety - 1):] if self.variety > 1 else [] # keep at most `variety` stories, drop the oldest
+        entry["stories"].append((story_id, time.monotonic()))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False) # evict the least recently used theme
+            self.stats["evictions"] += 1
+
+    # stop serving stories that were deleted (core/retention.py)
+    def forget_stories(self, story_ids):
+        story_ids = set(story_ids)
+        for key in list(self._entries):
+            entry = self._entries[key]
+            entry["stories"] = [(story_id, generated_at) for story_id, generated_at in entry["stories"] if story_id not in story_ids]
+            if not entry["stories"]:
+                del self._entries[key]
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "cached_stories": sum(len(entry["stories"]) for entry in self._entries.values()),
+            "in_flight": len(self._in_flight),
+        }
+
+
+generation_cache = GenerationCache(
+    max_entries=settings.GENERATION_CACHE_SIZE,
+    ttl_seconds=settings.GENERATION_CACHE_TTL_SECONDS,
+    variety=settings.GENERATION_CACHE_VARIETY,
+)
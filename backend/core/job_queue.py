@@ -0,0 +1,194 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import select, update, and_, or_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.notifications import notification_bus, job_channel
+from db.async_database import AsyncSessionLocal
+from models.job import StoryJob
+from schemas.job import StoryJobResponse
+
+"""
+The story_jobs table used as a durable work queue, so jobs survive a restart and can be processed by separate worker processes.
+
+    pending ──claim (lease)──► processing ──► completed
+       ▲                           │
+       │  retry after backoff      │ error, or lease expired (worker crashed)
+       └───────────────────────────┤
+                                   └──► failed (after JOB_MAX_ATTEMPTS)
+
+* Claiming is atomic. On Postgres the candidate row is locked with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers skip each other's rows instead of waiting. On SQLite (no row locks) the claim is a conditional UPDATE ... WHERE status = 'pending', which only one worker can win; the others move on to the next candidate.
+* While a job runs, its worker renews the lease every JOB_HEARTBEAT_SECONDS. If it stops (crash, lost network), the lease expires and requeue_expired_jobs() puts the job back to pending.
+* Delivery is at-least-once: a worker that loses its lease cancels its own generation, but a job can still be started twice around a lease expiry.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# Tell everyone waiting on /jobs/{job_id} (long-poll or SSE) about the new status. The message is the full StoryJobResponse, so the waiting requests can answer without querying the database again.
+def publish_job_status(job: StoryJob):
+    notification_bus.publish(job_channel(job.job_id), StoryJobResponse.model_validate(job).model_dump(mode="json"))
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=settings.JOB_RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)) # 10s, 20s, 40s ...
+
+
+# Column values for a job whose attempt ended without a story: back to pending with a backoff, or failed for good once the attempts are used up
+def retry_or_fail_values(attempts: int, error: str) -> dict:
+    values = {"error": error, "lease_owner": None, "lease_expires_at": None}
+    if (attempts or 0) < settings.JOB_MAX_ATTEMPTS:
+        values.update(status="pending", next_attempt_at=utcnow() + retry_delay(attempts or 0))
+    else:
+        values.update(status="failed", completed_at=utcnow())
+    return values
+
+
+# Claim one specific job (pending -> processing) for `worker_id`. Returns None if somebody else got it first.
+async def claim_job(db: AsyncSession, job_id: str, worker_id: str) -> Optional[StoryJob]:
+    now = utcnow()
+    result = await db.execute(
+        update(StoryJob)
+        .where(StoryJob.job_id == job_id, StoryJob.status == "pending")
+        .values(status="processing",
+                lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                heartbeat_at=now,
+                attempts=func.coalesce(StoryJob.attempts, 0) + 1)
+        .execution_options(synchronize_session=False))
+    await db.commit()
+    if result.rowcount != 1:
+        return None
+    result = await db.execute(select(StoryJob).where(StoryJob.job_id == job_id).execution_options(populate_existing=True))
+    return result.scalars().first()
+
+
+def due_condition():
+    return and_(StoryJob.status == "pending",
+                or_(StoryJob.next_attempt_at.is_(None), StoryJob.next_attempt_at <= utcnow()))
+
+
+# Claim the oldest job that is due, for the standalone workers (or, with `batch_id`, the oldest due job of that batch).
+# Jobs created one by one go before batch jobs, so a batch of hundreds of stories doesn't hold up the people waiting for theirs.
+async def claim_next_job(db: AsyncSession, worker_id: str, batch_id: str = None) -> Optional[StoryJob]:
+    candidates = select(StoryJob.job_id).where(due_condition())
+    if batch_id is not None:
+        candidates = candidates.where(StoryJob.batch_id == batch_id).order_by(StoryJob.id)
+    else:
+        candidates = candidates.order_by(StoryJob.batch_id.is_not(None), StoryJob.created_at)
+
+    if db.bind.dialect.name == "postgresql":
+        # the row stays locked until claim_job commits, other workers' SKIP LOCKED queries pass over it
+        result = await db.execute(candidates.limit(1).with_for_update(skip_locked=True))
+        job_id = result.scalar()
+        if job_id is None:
+            await db.rollback()
+            return None
+        return await claim_job(db, job_id, worker_id)
+
+    # SQLite: no row locks, so try a few candidates with the compare-and-set UPDATE in claim_job
+    result = await db.execute(candidates.limit(5))
+    candidates = result.scalars().all()
+    await db.rollback()
+    for job_id in candidates:
+        job = await claim_job(db, job_id, worker_id)
+        if job is not None:
+            return job
+    return None
+
+
+# Extend the lease of a running job. False means this worker no longer owns the job (it expired and was requeued).
+async def renew_lease(db: AsyncSession, job_id: str, worker_id: str) -> bool:
+    now = utcnow()
+    result = await db.execute(
+        update(StoryJob)
+        .where(StoryJob.job_id == job_id, StoryJob.lease_owner == worker_id, StoryJob.status == "processing")
+        .values(lease_expires_at=now + timedelta(seconds=settings.JOB_LEASE_SECONDS), heartbeat_at=now)
+        .execution_options(synchronize_session=False))
+    await db.commit()
+    return result.rowcount == 1
+
+
+class LeaseLost(Exception):
+    pass
+
+
+# Await `coroutine` (the generation of a job) while renewing the job's lease. If the lease is lost, another worker may already be generating the job, so the generation is cancelled and LeaseLost raised.
+# The coroutine runs as its own task: only the generation is cancelled, not the task that called this (a scheduler slot or a batch lane), which can record the outcome and move on to the next job.
+async def run_with_lease(job_id: str, worker_id: str, coroutine):
+    generation = asyncio.ensure_future(coroutine) # copies the current context, so core.metrics.track_job keeps counting its statements and tokens
+    lost = False
+
+    async def heartbeat():
+        nonlocal lost
+        while True:
+            await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+            try:
+                async with AsyncSessionLocal() as db: # own session, the job's session is busy with the generation
+                    owned = await renew_lease(db, job_id, worker_id)
+            except Exception:
+                logger.exception("Heartbeat for job %s failed, retrying", job_id)
+                continue
+            if not owned:
+                logger.warning("Lost the lease on job %s, stopping its generation", job_id)
+                lost = True
+                generation.cancel()
+                return
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    try:
+        return await generation # if the caller is cancelled (shutdown), the generation it waits on is cancelled with it
+    except asyncio.CancelledError:
+        if lost and not asyncio.current_task().cancelling():
+            raise LeaseLost(f"Lost the lease on job {job_id}") from None
+        raise
+    finally:
+        heartbeat_task.cancel()
+
+
+# Put jobs whose lease expired back in the queue (or fail them when out of attempts). Returns the jobs that changed.
+async def requeue_expired_jobs(db: AsyncSession) -> List[StoryJob]:
+    now = utcnow()
+    result = await db.execute(select(StoryJob).where(
+        StoryJob.status == "processing",
+        or_(StoryJob.lease_expires_at < now,
+            # jobs started before leases existed have none, treat them as abandoned once they are old enough
+            and_(StoryJob.lease_expires_at.is_(None), StoryJob.created_at < now - timedelta(seconds=settings.JOB_LEASE_SECONDS)))))
+
+    requeued = []
+    for job in result.scalars().all():
+        values = retry_or_fail_values(job.attempts, f"Worker {job.lease_owner or 'unknown'} stopped renewing its lease")
+        # compare-and-set on the lease we saw, so a job whose worker just renewed it (or another sweeper already handled) is left alone
+        lease_unchanged = StoryJob.lease_expires_at.is_(None) if job.lease_expires_at is None else StoryJob.lease_expires_at == job.lease_expires_at
+        update_result = await db.execute(
+            update(StoryJob).where(StoryJob.id == job.id, StoryJob.status == "processing", lease_unchanged)
+            .values(**values).execution_options(synchronize_session=False))
+        if update_result.rowcount == 1:
+            for column, value in values.items():
+                setattr(job, column, value)
+            requeued.append(job)
+    await db.commit()
+
+    for job in requeued:
+        logger.warning("Job %s was abandoned by its worker, now %s", job.job_id, job.status)
+        publish_job_status(job)
+    return requeued
+
+
+# Pending jobs that nobody is going to start on their own: retries whose backoff is over, and jobs that were waiting in the memory of an API process that went away
+async def orphaned_pending_jobs(db: AsyncSession, limit: int = 100) -> List[StoryJob]:
+    now = utcnow()
+    result = await db.execute(select(StoryJob).where(
+        StoryJob.status == "pending",
+        or_(StoryJob.next_attempt_at <= now,
+            and_(StoryJob.next_attempt_at.is_(None), StoryJob.created_at < now - timedelta(seconds=settings.JOB_LEASE_SECONDS)))
+    ).order_by(StoryJob.created_at).limit(limit))
+    return result.scalars().all()
@@ -0,0 +1,198 @@
+from typing import Any, Optional
+
+from core.stream_parser import IncrementalJSONParser
+
+"""
+Salvage for LLM answers that are almost, but not quite, the JSON we asked for, so a stray comma or a cut-off tail doesn't cost a whole new generation.
+
+    text ──► strip // and /* */ comments, drop trailing commas ──► parse as far as the text goes (IncrementalJSONParser) ──► prune what is incomplete
+                                                                      truncated? open strings are dropped,
+                                                                      open objects and arrays are closed
+
+Pruning keeps every node that is complete and turns the rest into valid story nodes:
+* an option without text is dropped
+* an option whose next node was cut off before its content gets a placeholder ending (the option text as content); its path is reported as a stub
+* a node that should have options but ended up with none becomes an ending (not a winning one); its path is reported as a stub
+Either way the caller can regenerate just the stubbed branches.
+
+    value, report = salvage_story_json(text, "story")
+    report.repairs    # {"trailing_commas", "truncated", "pruned_branches"}
+    report.stubs      # [(0, 1), (2,)]: option indexes from the root to each cut-off node
+"""
+
+# kinds of repair, also the label values of adventure_llm_json_repairs_total
+COMMENTS = "comments"
+TRAILING_COMMAS = "trailing_commas"
+TRUNCATED = "truncated"
+MALFORMED = "malformed"
+PRUNED_BRANCHES = "pruned_branches"
+REGENERATED_SUBTREES = "regenerated_subtrees"
+
+
+class SalvageReport:
+    def __init__(self):
+        self.repairs = set()
+        self.stubs = [] # option index paths of the nodes that were turned into endings (or made up as placeholders) because their branch was incomplete
+        self.node_count = 0 # nodes that came from the answer, placeholders not included
+
+
+# Remove what JSON doesn't allow but LLMs write anyway: comments (often copied from an example in the prompt) and commas before a closing bracket
+def clean_json_text(text: str, report: SalvageReport) -> str:
+    start = text.find("{")
+    if start > 0: # skip a code fence or a sentence before the document, its quotes or slashes would be misread
+        text = text[start:]
+    output = []
+    in_string = False
+    position = 0
+    length = len(text)
+    while position < length:
+        char = text[position]
+        if in_string:
+            output.append(char)
+            if char == "\\" and position + 1 < length:
+                output.append(text[position + 1])
+                position += 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+            output.append(char)
+        elif text.startswith("//", position):
+            end = text.find("\n", position)
+            position = length if end == -1 else end
+            report.repairs.add(COMMENTS)
+            continue
+        elif text.startswith("/*", position):
+            end = text.find("*/", position + 2)
+            position = length if end == -1 else end + 2
+            report.repairs.add(COMMENTS)
+            continue
+        elif char in "}]":
+            last = len(output) - 1
+            while last >= 0 and output[last].isspace():
+                last -= 1
+            if last >= 0 and output[last] == ",":
+                del output[last]
+                report.repairs.add(TRAILING_COMMAS)
+            output.append(char)
+        else:
+            output.append(char)
+        position += 1
+    return "".join(output)
+
+
+# Parse as much of the document as there is. The incremental parser attaches every object and array to its parent as soon as it opens, so whatever was read before the text ended (or went wrong) is in parser.value.
+def parse_partial_json(text: str, report: SalvageReport) -> Any:
+    parser = IncrementalJSONParser()
+    try:
+        parser.feed(text)
+    except ValueError:
+        report.repairs.add(MALFORMED)
+        return parser.value
+    if not parser.done:
+        report.repairs.add(TRUNCATED)
+    return parser.value
+
+
+def _is_text(value) -> bool:
+    return isinstance(value, str) and value.strip() != ""
+
+
+# A StoryNodeLLM dict with every incomplete part removed, or None when the node itself is unusable (no content)
+def _prune_story_node(node, path: tuple, report: SalvageReport) -> Optional[dict]:
+    if not isinstance(node, dict) or not _is_text(node.get("content")):
+        return None
+    report.node_count += 1
+    declared_ending = node.get("isEnding") is True
+
+    options = []
+    if not declared_ending and isinstance(node.get("options"), list):
+        for option in node["options"]:
+            if not isinstance(option, dict) or not _is_text(option.get("text")):
+                report.repairs.add(PRUNED_BRANCHES)
+                continue
+            child_path = path + (len(options),)
+            child = _prune_story_node(option.get("nextNode"), child_path, report)
+            if child is None: # the choice was written but its node was cut off: keep the choice with a placeholder ending, to be regenerated
+                child = {"content": option["text"], "isEnding": True, "isWinningEnding": False, "options": None}
+                report.stubs.append(child_path)
+                report.repairs.add(PRUNED_BRANCHES)
+            options.append({"text": option["text"], "nextNode": child})
+
+    if not declared_ending and not options:
+        report.stubs.append(path) # should have continued, but nothing of its branches survived
+        report.repairs.add(PRUNED_BRANCHES)
+    return {
+        "content": node["content"],
+        "isEnding": not options,
+        "isWinningEnding": declared_ending and node.get("isWinningEnding") is True,
+        "options": options or None,
+    }
+
+
+# A NodeOutlineLLM dict: branches without a text or summary are dropped, an outline left without branches becomes an ending
+def _prune_outline_node(node, report: SalvageReport) -> Optional[dict]:
+    if not isinstance(node, dict) or not _is_text(node.get("content")):
+        return None
+    report.node_count += 1
+    declared_ending = node.get("isEnding") is True
+
+    branches = []
+    if not declared_ending and isinstance(node.get("branches"), list):
+        for branch in node["branches"]:
+            if isinstance(branch, dict) and _is_text(branch.get("text")) and _is_text(branch.get("summary")):
+                branches.append({"text": branch["text"], "summary": branch["summary"]})
+            else:
+                report.repairs.add(PRUNED_BRANCHES)
+    if not declared_ending and not branches:
+        report.repairs.add(PRUNED_BRANCHES)
+    return {
+        "content": node["content"],
+        "isEnding": not branches,
+        "isWinningEnding": declared_ending and node.get("isWinningEnding") is True,
+        "branches": branches or None,
+    }
+
+
+# A partial compact story (core.models.CompactStoryLLM) with the long key names, so it can be pruned like any story. Missing "e" and "w" mean false in compact mode, so they are only copied when present.
+def expand_compact_keys(value):
+    def node(data):
+        if not isinstance(data, dict):
+            return data
+        expanded = {"content": data.get("c")}
+        if "e" in data:
+            expanded["isEnding"] = data["e"]
+        if "w" in data:
+            expanded["isWinningEnding"] = data["w"]
+        if isinstance(data.get("o"), list):
+            expanded["options"] = [{"text": option.get("t"), "nextNode": node(option.get("n"))} if isinstance(option, dict) else option
+                                   for option in data["o"]]
+        return expanded
+
+    if not isinstance(value, dict):
+        return value
+    return {"title": value.get("t"), "rootNode": node(value.get("r"))}
+
+
+# Repair and prune an LLM answer for one of the story schemas. `shape` says what the document is:
+#   "story" (title + rootNode tree), "story_compact" (the same with one-letter keys), "node" (a bare node tree), "story_outline" (title + outlined rootNode), "node_outline" (a bare outlined node)
+# Returns the salvaged value (still to be validated against the schema) and what was done to it; raises ValueError when nothing usable is left.
+def salvage_story_json(text: str, shape: str) -> tuple:
+    report = SalvageReport()
+    value = parse_partial_json(clean_json_text(text, report), report)
+
+    if shape == "story_compact":
+        value, shape = expand_compact_keys(value), "story"
+
+    has_title = shape in ("story", "story_outline")
+    root = value.get("rootNode") if has_title and isinstance(value, dict) else value
+    if shape in ("story", "node"):
+        root = _prune_story_node(root, (), report)
+    else:
+        root = _prune_outline_node(root, report)
+
+    if root is None or (has_title and not _is_text(value.get("title"))):
+        raise ValueError("the title or the first node is incomplete")
+    if shape == "story" and (() in report.stubs or report.node_count < 2):
+        raise ValueError("nothing after the first node survived") # a one-node story isn't worth saving, a full re-generation is
+    return ({"title": value["title"], "rootNode": root} if has_title else root), report
@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import threading
+import time
+
+from core.config import settings
+from core.metrics import record_llm_usage, llm_provider_calls, llm_provider_available
+
+"""
+Long-lived LLM clients behind one router, so every story doesn't pay for a new client, a new HTTP connection pool and a TLS handshake.
+
+    router = get_llm_router()            # built once per process (LLM_PROVIDERS=gemini,openai)
+    message = await router.ainvoke(prompt_value)
+
+                       ┌── gemini  (token bucket: GEMINI_REQUESTS_PER_MINUTE)  ewma latency 8.1s ✓
+    router.ainvoke ────┤
+                       └── openai  (token bucket: OPENAI_REQUESTS_PER_MINUTE)  ewma latency 6.4s ✓  <- picked
+
+* Routing: among the providers that are not cooling down after errors, the one whose rate limit has room right now and whose recent calls were fastest (exponentially weighted average) gets the call. A provider that has never been called counts as fastest, so each one gets tried.
+* Failover: when a call fails, the provider cools down (LLM_PROVIDER_COOLDOWN_SECONDS, doubled for every further consecutive error) and the call is retried on the next provider. A stream is only retried if it failed before its first chunk.
+* Rate limits: every provider has a token bucket refilled slightly below its requests-per-minute quota, so calls wait a moment on our side instead of being rejected with a 429.
+The router offers the same invoke() / ainvoke() / astream() calls as a LangChain chat model, so StoryGenerator doesn't need to know about any of this.
+"""
+
+logger = logging.getLogger(__name__)
+
+QUOTA_HEADROOM = 0.95 # refill at 95% of the quota, so clock drift and retries don't push us over it
+LATENCY_SMOOTHING = 0.3 # weight of the newest call in the moving average
+
+
+class TokenBucket:
+    def __init__(self, requests_per_minute: int):
+        self.unlimited = requests_per_minute <= 0
+        self.rate = requests_per_minute * QUOTA_HEADROOM / 60 # tokens per second
+        self.capacity = 1.0 # no bursts: even the first minute stays under the quota
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock() # the sync invoke() path may call from several threads
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # seconds until a token is available, 0 if one can be taken now
+    def wait_time(self) -> float:
+        if self.unlimited:
+            return 0.0
+        with self._lock:
+            self._refill()
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def _try_take(self) -> float:
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    async def acquire(self):
+        if self.unlimited:
+            return
+        while (delay := self._try_take()) > 0:
+            await asyncio.sleep(delay)
+
+    def acquire_sync(self):
+        if self.unlimited:
+            return
+        while (delay := self._try_take()) > 0:
+            time.sleep(delay)
+
+
+class LLMProvider:
+    def __init__(self, name: str, model: str, create_client, requests_per_minute: int = 0):
+        self.name = name
+        self.model = model
+        self._create_client = create_client
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.bucket = TokenBucket(requests_per_minute)
+        self.latency = None # moving average of successful call durations, None until the first one
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+
+    # the client (and its HTTP connection pool) is created on first use and then kept for the life of the process
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock: # the background warm-up (see StoryGenerator.start_warm_up) and a first request may get here at the same time
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.cooldown_until
+
+    def record_success(self, seconds: float):
+        self.latency = seconds if self.latency is None else LATENCY_SMOOTHING * seconds + (1 - LATENCY_SMOOTHING) * self.latency
+        self.consecutive_failures = 0
+        llm_provider_calls.inc(provider=self.name, outcome="success")
+        llm_provider_available.set(1, provider=self.name)
+
+    def record_failure(self, error: Exception):
+        self.consecutive_failures += 1
+        cooldown = settings.LLM_PROVIDER_COOLDOWN_SECONDS * 2 ** (self.consecutive_failures - 1)
+        self.cooldown_until = time.monotonic() + min(cooldown, 600)
+        llm_provider_calls.inc(provider=self.name, outcome="error")
+        llm_provider_available.set(0, provider=self.name)
+        logger.warning("LLM provider %s failed (%s), cooling down for %.0fs", self.name, error, min(cooldown, 600))
+
+    def snapshot(self) -> dict:
+        return {
+            "model": self.model,
+            "available": self.available,
+            "latency_seconds": self.latency,
+            "consecutive_failures": self.consecutive_failures,
+            "rate_limit_wait_seconds": self.bucket.wait_time(),
+        }
+
+
+class LLMRouter:
+    def __init__(self, providers: list):
+        if not providers:
+            raise ValueError("LLM_PROVIDERS must name at least one provider")
+        self.providers = providers
+
+    # providers in the order they should be tried for the next call
+    def _candidates(self) -> list:
+        available = [provider for provider in self.providers if provider.available]
+        if not available: # everything is cooling down: try the one that comes back first rather than failing outright
+            available = [min(self.providers, key=lambda provider: provider.cooldown_until)]
+        return sorted(available, key=lambda provider: (provider.bucket.wait_time() > 0, provider.latency or 0.0))
+
+    def invoke(self, prompt_value):
+        last_error = None
+        for provider in self._candidates():
+            provider.bucket.acquire_sync()
+            started = time.perf_counter()
+            try:
+                message = provider.client.invoke(prompt_value)
+            except Exception as e:
+                provider.record_failure(e)
+                last_error = e
+                continue
+            provider.record_success(time.perf_counter() - started)
+            record_llm_usage(provider.model, message)
+            return message
+        raise last_error
+
+    async def ainvoke(self, prompt_value):
+        last_error = None
+        for provider in self._candidates():
+            await provider.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                message = await provider.client.ainvoke(prompt_value)
+            except Exception as e:
+                provider.record_failure(e)
+                last_error = e
+                continue
+            provider.record_success(time.perf_counter() - started)
+            record_llm_usage(provider.model, message)
+            return message
+        raise last_error
+
+    async def astream(self, prompt_value):
+        last_error = None
+        for provider in self._candidates():
+            await provider.bucket.acquire()
+            started = time.perf_counter()
+            received = False
+            try:
+                async for chunk in provider.client.astream(prompt_value):
+                    received = True
+                    record_llm_usage(provider.model, chunk)
+                    yield chunk
+            except GeneratorExit: # the caller stopped reading, e.g. once the JSON document was complete
+                provider.record_success(time.perf_counter() - started)
+                raise
+            except Exception as e:
+                provider.record_failure(e)
+                if received:
+                    raise # part of the story has already been consumed, another provider would start a different one
+                last_error = e
+                continue
+            provider.record_success(time.perf_counter() - started)
+            return
+        raise last_error
+
+    def snapshot(self) -> dict:
+        return {provider.name: provider.snapshot() for provider in self.providers}
+
+
+# In compact mode the providers are also put in their native JSON mode: the model can only produce a JSON document, so no tokens go to code fences or explanations, and no answer fails on them.
+# Every prompt we send asks for JSON, so this is safe for all the pipelines, not just the compact one.
+def _json_mode() -> bool:
+    return settings.PROMPT_MODE == "compact"
+
+
+# the provider SDKs read their keys (e.g. GOOGLE_API_KEY) from the environment, so .env is loaded right before the first client is created instead of at import
+def _load_env():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+
+def _create_gemini():
+    _load_env()
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    if _json_mode():
+        return ChatGoogleGenerativeAI(model=settings.LLM_MODEL, response_mime_type="application/json")
+    return ChatGoogleGenerativeAI(model=settings.LLM_MODEL)
+
+
+def _create_openai():
+    _load_env()
+    from langchain_openai import ChatOpenAI
+    if _json_mode():
+        return ChatOpenAI(model=settings.OPENAI_MODEL, api_key=settings.OPENAI_API_KEY, model_kwargs={"response_format": {"type": "json_object"}})
+    return ChatOpenAI(model=settings.OPENAI_MODEL, api_key=settings.OPENAI_API_KEY)
+
+
+def _create_fake():
+    from core.fake_llm import FakeLLM # offline model for benchmarks and load tests
+    return FakeLLM(depth=settings.FAKE_LLM_DEPTH,
+                   branching=settings.FAKE_LLM_BRANCHING,
+                   latency=settings.FAKE_LLM_LATENCY_SECONDS,
+                   jitter=settings.FAKE_LLM_JITTER_SECONDS,
+                   tokens_per_second=settings.FAKE_LLM_TOKENS_PER_SECOND)
+
+
+def create_provider(name: str) -> LLMProvider:
+    if name == "gemini":
+        return LLMProvider("gemini", settings.LLM_MODEL, _create_gemini, settings.GEMINI_REQUESTS_PER_MINUTE)
+    if name == "openai":
+        return LLMProvider("openai", settings.OPENAI_MODEL, _create_openai, settings.OPENAI_REQUESTS_PER_MINUTE)
+    if name == "fake":
+        return LLMProvider("fake", "fake", _create_fake)
+    raise ValueError(f"Unknown LLM provider in LLM_PROVIDERS: {name}")
+
+
+_router = None
+
+
+def get_llm_router() -> LLMRouter:
+    global _router
+    if _router is None:
+        _router = LLMRouter([create_provider(name.strip()) for name in settings.LLM_PROVIDERS.split(",") if name.strip()])
+    return _router
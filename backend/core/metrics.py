@@ -0,0 +1,276 @@
+import contextvars
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+
+from core.config import settings
+
+"""
+Timing spans and counters for the generation pipeline, exposed at GET /metrics in the Prometheus text format.
+
+    with stage("llm"):                 # observed in adventure_generation_stage_seconds{stage="llm"}
+        raw_response = llm.invoke(prompt_value)
+
+    with track_job():                  # counts the SQL statements the job sends, see adventure_job_db_round_trips
+        ...
+
+The metric types are implemented here (no prometheus_client dependency), they only need to be cheap to update and render as text.
+With OTEL_ENABLED=True every stage is also an OpenTelemetry span (needs the opentelemetry-api package; the exporter is configured the usual OpenTelemetry way, e.g. `opentelemetry-instrument python main.py`).
+"""
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {} # label values tuple -> value
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+        series["buckets"][bisect_left(self.buckets, value)] += 1 # the last slot is +Inf
+        series["sum"] += value
+        series["count"] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, series in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series["buckets"]):
+                cumulative += count # Prometheus buckets are cumulative: every observation <= le
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, 'le=\"%s\"' % bound)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {series['sum']}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry() # one per process, rendered by GET /metrics
+
+http_request_seconds = metrics_registry.register(Histogram(
+    "adventure_http_request_duration_seconds", "Time to answer an HTTP request (until the response starts for streams)", ("method", "route", "status")))
+http_requests_in_flight = metrics_registry.register(Gauge(
+    "adventure_http_requests_in_flight", "HTTP requests being handled right now"))
+stage_seconds = metrics_registry.register(Histogram(
+    "adventure_generation_stage_seconds", "Time spent in each stage of a story generation", ("stage",)))
+jobs_in_flight = metrics_registry.register(Gauge(
+    "adventure_jobs_in_flight", "Story jobs of this process by state (queued in the scheduler or running)", ("state",)))
+jobs_finished = metrics_registry.register(Counter(
+    "adventure_jobs_finished_total", "Story job attempts by outcome", ("status",)))
+llm_tokens = metrics_registry.register(Counter(
+    "adventure_llm_tokens_total", "Tokens reported by the LLM provider", ("model", "kind")))
+llm_provider_calls = metrics_registry.register(Counter(
+    "adventure_llm_provider_calls_total", "LLM calls by provider and outcome", ("provider", "outcome")))
+llm_provider_available = metrics_registry.register(Gauge(
+    "adventure_llm_provider_available", "1 while the provider takes calls, 0 while it cools down after errors", ("provider",)))
+llm_provider_latency = metrics_registry.register(Gauge(
+    "adventure_llm_provider_latency_seconds", "Moving average of the provider's recent call durations, used for routing", ("provider",)))
+story_pool_stock = metrics_registry.register(Gauge(
+    "adventure_story_pool_stock", "Finished stories waiting in the warm pool, by normalized theme", ("theme",)))
+story_pool_lookups = metrics_registry.register(Counter(
+    "adventure_story_pool_lookups_total", "Story requests looked up in the warm pool, by result (hit or miss)", ("result",)))
+story_pool_generated = metrics_registry.register(Counter(
+    "adventure_story_pool_generated_total", "Stories generated ahead of time for the warm pool"))
+llm_json_repairs = metrics_registry.register(Counter(
+    "adventure_llm_json_repairs_total", "LLM answers that were only usable after a repair, by repair; each one saved a full re-generation", ("repair",)))
+llm_json_unrepairable = metrics_registry.register(Counter(
+    "adventure_llm_json_unrepairable_total", "LLM answers that could not be repaired, by expected schema", ("schema",)))
+retention_rows = metrics_registry.register(Counter(
+    "adventure_retention_rows_deleted_total", "Rows removed by the retention sweeper, by table and reason", ("table", "reason")))
+retention_sweep_seconds = metrics_registry.register(Histogram(
+    "adventure_retention_sweep_seconds", "Duration of a retention sweep (dry runs included)"))
+story_events = metrics_registry.register(Counter(
+    "adventure_story_events_total", "Playthrough events by outcome: accepted into the buffer, dropped because it was full, written, or lost in a failed flush", ("outcome",)))
+story_events_buffered = metrics_registry.register(Gauge(
+    "adventure_story_events_buffered", "Playthrough events waiting in this process's buffer for the next flush"))
+story_events_flush_seconds = metrics_registry.register(Histogram(
+    "adventure_story_events_flush_seconds", "Time to write one batch of playthrough events and their node aggregates"))
+job_db_round_trips = metrics_registry.register(Histogram(
+    "adventure_job_db_round_trips", "SQL statements sent while running one story job", (), COUNT_BUCKETS))
+
+
+_tracer = None
+if settings.OTEL_ENABLED:
+    from opentelemetry import trace # optional dependency, only imported when OpenTelemetry export is turned on
+    _tracer = trace.get_tracer("adventure.generation")
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    with _tracer.start_as_current_span(f"generation.{name}") if _tracer else nullcontext():
+        try:
+            yield
+        finally:
+            stage_seconds.observe(time.perf_counter() - started, stage=name)
+
+
+# Plain ASGI middleware (no BaseHTTPMiddleware, which copies every response body through an extra task) that times each request until its response starts.
+# The route template (/jobs/{job_id}) is used as the label instead of the path, so every job doesn't become its own time series.
+class RequestTimingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status):
+            nonlocal observed
+            observed = True
+            route = scope.get("route") # set by the router once it matched the request
+            http_request_seconds.observe(time.perf_counter() - started,
+                                         method=scope["method"],
+                                         route=route.path if route is not None else "unmatched",
+                                         status=status)
+
+        async def send_and_observe(message):
+            if message["type"] == "http.response.start":
+                observe(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_and_observe)
+        except Exception:
+            if not observed:
+                observe(500)
+            raise
+        finally:
+            http_requests_in_flight.dec()
+
+
+# Time between a job row being created and a worker starting it. created_at comes from the database clock (SQLite stores it in UTC, without a timezone and to the second).
+def observe_queue_wait(created_at: datetime):
+    if created_at is None:
+        return
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    stage_seconds.observe(max((datetime.now(timezone.utc) - created_at).total_seconds(), 0.0), stage="queue_wait")
+
+
+# LangChain messages carry usage_metadata = {"input_tokens", "output_tokens", ...}; streamed chunks carry their share of it
+def record_llm_usage(model: str, message):
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return
+    llm_tokens.inc(usage.get("input_tokens", 0), model=model, kind="input")
+    llm_tokens.inc(usage.get("output_tokens", 0), model=model, kind="output")
+    counter = _job_statements.get()
+    if counter is not None: # also charge them to the job being run, see job_token_usage()
+        counter["input_tokens"] += usage.get("input_tokens", 0)
+        counter["output_tokens"] += usage.get("output_tokens", 0)
+
+
+# The statement and token counters of the job running in the current asyncio task. A ContextVar follows the job into run_sync() and into the tasks it starts (like the lease heartbeat or fan-out branches), but not into other jobs.
+_job_statements = contextvars.ContextVar("job_statements", default=None)
+
+
+@contextmanager
+def track_job():
+    counter = {"statements": 0, "input_tokens": 0, "output_tokens": 0}
+    token = _job_statements.set(counter)
+    jobs_in_flight.inc(state="running")
+    try:
+        yield
+    finally:
+        jobs_in_flight.dec(state="running")
+        _job_statements.reset(token)
+        job_db_round_trips.observe(counter["statements"])
+
+
+# (prompt tokens, completion tokens) the current job's LLM calls have used so far
+def job_token_usage() -> tuple:
+    counter = _job_statements.get()
+    if counter is None:
+        return 0, 0
+    return counter["input_tokens"], counter["output_tokens"]
+
+
+def _count_statement(*_):
+    counter = _job_statements.get()
+    if counter is not None:
+        counter["statements"] += 1
+
+
+# called by db/ for every engine, so statements are counted whichever engine a job uses
+def instrument_engine(engine):
+    from sqlalchemy import event
+    event.listen(engine, "before_cursor_execute", _count_statement)
@@ -1,11 +1,12 @@
-from typing import List, Dict, Any, Optional
-from pydantic import BaseModel, Field
+from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError
 
 
+# The models are recursive (an option holds the whole node it leads to), so model_validate_json() turns the LLM's text into the finished, typed tree in one pass, with no dicts left to validate level by level afterwards.
 class StoryOptionLLM(BaseModel):
     text: str = Field(description="the text of the option shown to the user")
-    nextNode: Dict[str, Any] = Field(description="the next node content and its options")
-    
+    nextNode: "StoryNodeLLM" = Field(description="the next node content and its options")
+
 class StoryNodeLLM(BaseModel):
     content: str = Field(description="The main content of the story node")
     isEnding: bool = Field(description="Whether this node is ending node ")
@@ -14,4 +15,68 @@ class StoryNodeLLM(BaseModel):
 
 class StoryLLMResponse(BaseModel):
     title: str = Field(description="The title of the story")
-    rootNode: StoryNodeLLM = Field(description="The root node of the story")
\ No newline at end of file
+    rootNode: StoryNodeLLM = Field(description="The root node of the story")
+
+StoryOptionLLM.model_rebuild() # resolve the forward reference to StoryNodeLLM
+
+
+# Outlines for the fan-out mode: a node plus one-line summaries of its branches, each branch is then written by its own LLM call
+class BranchOutlineLLM(BaseModel):
+    text: str = Field(description="the text of the option shown to the user")
+    summary: str = Field(description="one or two sentences on where this choice leads")
+
+class NodeOutlineLLM(BaseModel):
+    content: str = Field(description="The main content of the story node")
+    isEnding: bool = Field(description="Whether this node is ending node")
+    isWinningEnding: bool = Field(description="Whether this node is a winning ending node")
+    branches: Optional[List[BranchOutlineLLM]] = Field(default=None, description="The options for this node, with a summary of where each leads")
+
+class StoryOutlineLLM(BaseModel):
+    title: str = Field(description="The title of the story")
+    rootNode: NodeOutlineLLM = Field(description="The root node of the story")
+
+
+# Compact mode (PROMPT_MODE=compact): the same story with one-letter keys, and the flags left out when they are false, so the model writes far fewer tokens per node.
+#   {"t": title, "r": node}    node = {"c": content, "e": isEnding, "w": isWinningEnding, "o": [{"t": text, "n": node}, ...]}
+class CompactOptionLLM(BaseModel):
+    t: str
+    n: "CompactNodeLLM"
+
+class CompactNodeLLM(BaseModel):
+    c: str
+    e: bool = False
+    w: bool = False
+    o: Optional[List[CompactOptionLLM]] = None
+
+    def to_node(self) -> StoryNodeLLM:
+        return StoryNodeLLM(content=self.c,
+                            isEnding=self.e,
+                            isWinningEnding=self.w,
+                            options=[StoryOptionLLM(text=option.t, nextNode=option.n.to_node()) for option in self.o] if self.o else None)
+
+class CompactStoryLLM(BaseModel):
+    t: str
+    r: CompactNodeLLM
+
+    def to_story(self) -> StoryLLMResponse:
+        return StoryLLMResponse(title=self.t, rootNode=self.r.to_node())
+
+CompactOptionLLM.model_rebuild()
+
+# Raised when the LLM's answer is valid JSON but doesn't fit the schema. The message names the node each problem is in, e.g.
+#   StoryLLMResponse: rootNode.options[1].nextNode.isEnding: Field required
+class StoryParseError(ValueError):
+    def __init__(self, schema_name: str, error: ValidationError, max_errors: int = 5):
+        problems = [f"{node_path(item['loc'])}: {item['msg']}" for item in error.errors()[:max_errors]]
+        if error.error_count() > max_errors:
+            problems.append(f"and {error.error_count() - max_errors} more")
+        super().__init__(f"{schema_name}: " + "; ".join(problems))
+        self.errors = error.errors()
+
+
+# ("rootNode", "options", 1, "nextNode", "content") -> "rootNode.options[1].nextNode.content"
+def node_path(loc: tuple) -> str:
+    path = ""
+    for part in loc:
+        path += f"[{part}]" if isinstance(part, int) else (f".{part}" if path else str(part))
+    return path or "(root)"
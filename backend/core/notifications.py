@@ -0,0 +1,153 @@
+import asyncio
+import json
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from core.config import settings
+
+"""
+Publish/subscribe between the background generation tasks and the endpoints that push updates to the browser (long-poll and Server-Sent Events).
+
+Publisher (background task):   notification_bus.publish("story:42", {"type": "node", ...})
+Subscriber (SSE endpoint):     async with notification_bus.subscribe("story:42") as subscription:
+                                   message = await subscription.get(timeout=15)
+
+Every subscriber gets its own queue, so a slow client never holds up the publisher or the other clients.
+
+Where a message travels is decided by the backend:
+* InProcessBackend (default): delivered straight to the subscribers of this process. Enough when the API and the generation run in the same process.
+* RedisBackend (NOTIFICATION_BACKEND_URL=redis://...): every process publishes to Redis and receives from it, so a client waiting on API replica A hears about a job finished by replica B.
+A backend only needs attach(deliver) / start() / publish(channel, message) / stop(), so tests can swap in InProcessBackend (or their own stand-in) for Redis.
+"""
+
+
+class Subscription:
+    def __init__(self):
+        self._queue = asyncio.Queue()
+
+    def put(self, message: dict):
+        self._queue.put_nowait(message)
+
+    # wait for the next message, returns None if nothing arrived within `timeout` seconds
+    async def get(self, timeout: float = None):
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBackend:
+    def __init__(self):
+        self._deliver = None
+
+    def attach(self, deliver):
+        self._deliver = deliver
+
+    async def start(self):
+        pass
+
+    def publish(self, channel: str, message: dict):
+        self._deliver(channel, message)
+
+    async def stop(self):
+        pass
+
+
+class RedisBackend:
+    def __init__(self, url: str, prefix: str = "adventure:"):
+        try:
+            import redis.asyncio as redis # optional dependency, only needed when the bus has to cross processes
+        except ImportError as e:
+            raise ImportError("NOTIFICATION_BACKEND_URL points at Redis, install the 'redis' package to use it") from e
+        self._redis = redis.from_url(url)
+        self._prefix = prefix
+        self._deliver = None
+        self._listener = None
+        self._publishing = set() # keep references to the publish tasks so they aren't garbage collected half way
+
+    def attach(self, deliver):
+        self._deliver = deliver
+
+    async def start(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.psubscribe(self._prefix + "*") # one pattern subscription per process instead of one per waiting client
+
+        async def listen():
+            async for item in pubsub.listen():
+                if item["type"] != "pmessage":
+                    continue
+                channel = item["channel"].decode()[len(self._prefix):]
+                self._deliver(channel, json.loads(item["data"]))
+
+        self._listener = asyncio.create_task(listen())
+
+    def publish(self, channel: str, message: dict):
+        task = asyncio.get_running_loop().create_task(
+            self._redis.publish(self._prefix + channel, json.dumps(message, default=str)))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+        await self._redis.aclose()
+
+
+def create_notification_backend(url: str):
+    if not url:
+        return InProcessBackend()
+    if url.startswith(("redis://", "rediss://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported NOTIFICATION_BACKEND_URL: {url}")
+
+
+class NotificationBus:
+    def __init__(self, backend=None):
+        self._subscribers = defaultdict(set) # channel name -> subscriptions listening on it in this process
+        self.use_backend(backend or InProcessBackend())
+
+    def use_backend(self, backend):
+        self._backend = backend
+        backend.attach(self._deliver)
+
+    # called from the app lifespan, connects the backend (e.g. opens the Redis subscription). The in-process backend needs no start, so scripts can use the bus as is.
+    async def start(self):
+        await self._backend.start()
+
+    async def stop(self):
+        await self._backend.stop()
+
+    def publish(self, channel: str, message: dict):
+        self._backend.publish(channel, message)
+
+    # hand a message that came from the backend to the local subscribers of its channel
+    def _deliver(self, channel: str, message: dict):
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription.put(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel: str):
+        subscription = Subscription()
+        self._subscribers[channel].add(subscription)
+        try:
+            yield subscription
+        finally: # the client disconnected or the stream ended, stop delivering to this queue
+            self._subscribers[channel].discard(subscription)
+            if not self._subscribers[channel]:
+                del self._subscribers[channel]
+
+
+notification_bus = NotificationBus(create_notification_backend(settings.NOTIFICATION_BACKEND_URL)) # one bus per process, shared by the routers and the background tasks
+
+
+def story_channel(story_id: int) -> str:
+    return f"story:{story_id}"
+
+
+def job_channel(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+# One Server-Sent Event: "event: <name>\ndata: <json>\n\n". The browser's EventSource dispatches it to listeners of that event name.
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from collections import Counter as TallyCounter
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.job_queue import utcnow
+from core.metrics import story_events, story_events_buffered, story_events_flush_seconds
+from db.async_database import AsyncSessionLocal
+from models.playthrough import PlaythroughEvent, StoryNodeStats
+
+"""
+Playthrough events (which nodes players see, which options they pick, which endings they reach) without a database write per click.
+
+    POST /stories/{id}/events ──► EventBuffer.add()    in memory, never waits for the database
+                                        │  flushed when STORY_EVENTS_FLUSH_SIZE events are waiting, or every STORY_EVENTS_FLUSH_SECONDS
+                                        ▼
+                                  one transaction:  multi-row INSERT into playthrough_events (STORY_EVENTS_STORE_RAW)
+                                                    one upsert per touched node into story_node_stats (visits, choices, finishes, wins)
+
+* The buffer holds at most STORY_EVENTS_BUFFER_SIZE events, a "finish" event counting once more per node of its path (each of them is a node to update). When it is full, new events are dropped (shed) instead of queued, counted in adventure_story_events_total{outcome="dropped"} and reported to the client, so a slow database costs us analytics, not requests.
+* The counters are summed in memory before the upsert, so a thousand visits of the same root node are one row update.
+* Events of a failed flush are dropped and counted (outcome="failed"), not retried: retrying would let a database outage fill the buffer with old events.
+* Every API process has its own buffer; what it hasn't flushed yet is missing from GET /stories/{id}/stats for up to STORY_EVENTS_FLUSH_SECONDS.
+"""
+
+logger = logging.getLogger(__name__)
+
+STAT_COUNTERS = ("visits", "choices", "finishes", "wins")
+
+
+# Add the counts in `rows` ({story_id, node_id, visits, ...}) to story_node_stats, creating the rows that don't exist yet
+async def upsert_node_stats(db: AsyncSession, rows: list):
+    dialect = db.bind.dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        statement = (postgresql if dialect == "postgresql" else sqlite).insert(StoryNodeStats)
+        statement = statement.on_conflict_do_update(
+            index_elements=[StoryNodeStats.story_id, StoryNodeStats.node_id],
+            set_={name: getattr(StoryNodeStats, name) + getattr(statement.excluded, name) for name in STAT_COUNTERS})
+        await db.execute(statement, rows)
+        return
+
+    # other databases: add to the existing rows, insert the others (a concurrent insert of the same node fails the flush, which is counted)
+    missing = []
+    for row in rows:
+        result = await db.execute(
+            update(StoryNodeStats).where(StoryNodeStats.story_id == row["story_id"], StoryNodeStats.node_id == row["node_id"])
+            .values({name: getattr(StoryNodeStats, name) + row[name] for name in STAT_COUNTERS}))
+        if result.rowcount == 0:
+            missing.append(row)
+    if missing:
+        await db.execute(insert(StoryNodeStats), missing)
+
+
+# Sum the buffered events into one row of counter increments per (story, node)
+def aggregate_events(events: list) -> list:
+    counts = {}
+    for story_id, _, kind, node_id, _, won, path in events:
+        if kind == "finish":
+            nodes = dict.fromkeys([*path, node_id]) # every node of the playthrough once, even if the player went back to it
+        else:
+            nodes = (node_id,)
+        for node in nodes:
+            row = counts.get((story_id, node))
+            if row is None:
+                row = counts[(story_id, node)] = {"story_id": story_id, "node_id": node, "visits": 0, "choices": 0, "finishes": 0, "wins": 0}
+            if kind == "visit":
+                row["visits"] += 1
+            elif kind == "choice":
+                row["choices"] += 1
+            else:
+                row["finishes"] += 1
+                row["wins"] += bool(won)
+    return list(counts.values())
+
+
+class EventBuffer:
+    def __init__(self, capacity: int, flush_size: int, flush_seconds: float):
+        self.capacity = capacity
+        self.flush_size = flush_size
+        self.flush_seconds = flush_seconds
+        self._events = [] # (story_id, playthrough_id, kind, node_id, option_index, won, path) waiting for the next flush
+        self._load = 0 # what capacity and flush_size are measured against: the buffered events plus the path entries of the "finish" ones
+        self._wake = asyncio.Event() # set when flush_size events are waiting, or to stop the flush loop
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+        self._task = None
+        self.stats = TallyCounter() # events accepted / dropped / written / failed, and flushes, since the process started
+        self.last_flush = None
+
+    # Queue the events of one request; returns how many were accepted, the rest were dropped because the buffer is full.
+    # `events` are (kind, node_id, option_index, won, path) tuples.
+    def add(self, story_id: int, playthrough_id: str, events: list) -> int:
+        accepted = []
+        for event in events:
+            load = 1 + len(event[4]) if event[0] == "finish" else 1 # the path of other events is ignored by aggregate_events
+            if self._load + load > self.capacity:
+                break # the rest of the batch is dropped, like when it is cut at the event count
+            self._load += load
+            accepted.append(event)
+        self._events.extend((story_id, playthrough_id, *event) for event in accepted)
+        dropped = len(events) - len(accepted)
+        self.stats["accepted"] += len(accepted)
+        story_events.inc(len(accepted), outcome="accepted")
+        if dropped:
+            self.stats["dropped"] += dropped
+            story_events.inc(dropped, outcome="dropped")
+        story_events_buffered.set(len(self._events))
+        if self._load >= self.flush_size:
+            self._wake.set()
+        return len(accepted)
+
+    # Write everything buffered so far in one transaction; returns how many events were written
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            events, self._events = self._events, [] # requests arriving during the write fill the next batch
+            self._load = 0
+            self._wake.clear()
+            story_events_buffered.set(0)
+            if not events:
+                return 0
+
+            started = time.perf_counter()
+            stats_rows = aggregate_events(events)
+            try:
+                async with AsyncSessionLocal() as db:
+                    if settings.STORY_EVENTS_STORE_RAW:
+                        await db.execute(insert(PlaythroughEvent), [
+                            {"story_id": story_id, "node_id": node_id, "kind": kind, "option_index": option_index, "won": won, "playthrough_id": playthrough_id}
+                            for story_id, playthrough_id, kind, node_id, option_index, won, _ in events]) # executemany, sent as multi-row INSERTs
+                    await upsert_node_stats(db, stats_rows)
+                    await db.commit()
+            except Exception:
+                logger.exception("Writing %d playthrough events failed, they are dropped", len(events))
+                self.stats["failed"] += len(events)
+                story_events.inc(len(events), outcome="failed")
+                return 0
+
+            seconds = time.perf_counter() - started
+            story_events_flush_seconds.observe(seconds)
+            self.stats["written"] += len(events)
+            self.stats["flushes"] += 1
+            story_events.inc(len(events), outcome="written")
+            self.last_flush = {"finished_at": utcnow().isoformat(), "events": len(events), "nodes": len(stats_rows), "seconds": round(seconds, 4)}
+            return len(events)
+
+    async def _flush_loop(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    # called by main.py: flush in the background for the life of the server
+    def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._flush_loop())
+
+    # called by main.py on shutdown: lets a running flush finish and writes what is left
+    async def stop(self):
+        if self._task is None:
+            return
+        self._closing = True
+        self._wake.set()
+        await self._task
+        self._task = None
+        await self.flush()
+
+    def snapshot(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "buffered": len(self._events),
+            "load": self._load,
+            "accepted": self.stats["accepted"],
+            "dropped": self.stats["dropped"],
+            "written": self.stats["written"],
+            "failed": self.stats["failed"],
+            "flushes": self.stats["flushes"],
+            "last_flush": self.last_flush,
+        }
+
+
+event_buffer = EventBuffer(settings.STORY_EVENTS_BUFFER_SIZE, settings.STORY_EVENTS_FLUSH_SIZE, settings.STORY_EVENTS_FLUSH_SECONDS)
@@ -1,3 +1,6 @@
+# bump this whenever STORY_PROMPT changes, cached stories generated with an older prompt are then no longer served
+STORY_PROMPT_VERSION = "1"
+
 STORY_PROMPT = """
                 You are a creative story writer that creates engaging choose-your-own-adventure stories.
                 Generate a complete branching story with multiple paths and endings in the JSON format I'll specify.
@@ -45,4 +48,70 @@ json_structure = """
                 ]
             }
         }
-        """
\ No newline at end of file
+        """
+
+# Compact mode (PROMPT_MODE=compact): the same story, asked for in fewer words and answered with one-letter keys (core.models.CompactStoryLLM)
+COMPACT_STORY_PROMPT = """Write a choose-your-own-adventure story as JSON.
+Title; a root scene with 2-3 options; every option leads to a scene with 2-3 options or to an ending.
+3-4 levels deep, paths of different lengths, winning and losing endings, at least one winning path.
+{format_instructions}"""
+
+COMPACT_FORMAT_INSTRUCTIONS = """Reply with JSON only, in this shape:
+{"t": "title", "r": NODE}
+NODE = {"c": "scene text", "o": [{"t": "option text", "n": NODE}, ...]}
+An ending has no "o" and has "e": true, plus "w": true if the player wins."""
+
+# Prompts of the fan-out mode (FANOUT_GENERATION=True): one call plans the story, then every branch is written by its own, smaller call.
+
+STORY_OUTLINE_PROMPT = """
+                You are a creative story writer planning an engaging choose-your-own-adventure story.
+                Don't write the whole story yet. Write only:
+                1. A compelling title
+                2. The starting situation (root node)
+                3. 2-3 options for the player, each with a short summary (one or two sentences) of where that choice leads
+
+                The branches will be written separately from your summaries, so make them distinct from each other
+                and make sure at least one of them can lead to a winning ending.
+
+                Output the outline in this exact JSON structure:
+                {format_instructions}
+
+                Don't add any text outside of the JSON structure.
+                """
+
+NODE_OUTLINE_PROMPT = """
+                You are a creative story writer continuing a choose-your-own-adventure story.
+                You get the story so far and the choice the player just made.
+                Write only the next scene (the node right after the choice) and, unless the scene is an ending,
+                2-3 options for the player, each with a short summary (one or two sentences) of where that choice leads.
+
+                Output the scene in this exact JSON structure:
+                {format_instructions}
+
+                Don't add any text outside of the JSON structure.
+                """
+
+SUBTREE_PROMPT = """
+                You are a creative story writer continuing a choose-your-own-adventure story.
+                You get the story so far, the choice the player just made and a summary of where it leads.
+                Write the rest of this branch as a tree of nodes, starting with the scene right after the choice.
+
+                The branch should have:
+                - {subtree_depth} levels at most (including the first scene)
+                - 2-3 options on each node except for ending nodes
+                - Some paths ending earlier than others, with both winning and losing endings
+                - The same characters, places and tone as the story so far
+
+                Output the branch in this exact JSON structure:
+                {format_instructions}
+
+                Don't simplify or omit any part of the structure.
+                Don't add any text outside of the JSON structure.
+                """
+
+BRANCH_CONTEXT = """Theme: {theme}
+Story title: {title}
+Story so far:
+{story_so_far}
+The player chose: {choice}
+Where this choice leads: {summary}"""
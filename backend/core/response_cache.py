@@ -0,0 +1,103 @@
+import asyncio
+import gzip
+import hashlib
+import time
+from collections import OrderedDict
+
+from core.config import settings
+
+try:
+    import brotli # optional, better compression than gzip for browsers that accept "br"
+except ImportError:
+    brotli = None
+
+"""
+Bounded in-memory cache of pre-rendered HTTP bodies (the /stories/{id}/complete JSON).
+
+Each entry holds the identity body plus gzip (and brotli, when installed) variants compressed once up front, so a repeat request costs a dict lookup and no ORM, Pydantic or compression work.
+The compression of a new entry runs in a worker thread (aput) at mid levels (gzip 6, brotli quality 5): the top levels (gzip 9, brotli's default 11, by far the slowest) cost much more time for bodies only a few percent smaller, and that time is paid on every cache miss.
+The cache is limited by the total number of bytes it holds and drops the least recently used entries first.
+Entries also expire ttl_seconds after they were put: each process has its own cache, and a story deleted by another process (sweep.py, the sweep of another API replica) would otherwise be served from memory for as long as it stays popular.
+"""
+
+
+PAYLOAD_VERSION = "v2" # bumped when the stored /complete layout changes; v2 dropped session_id, which is the library's credential
+
+
+def make_etag(payload: bytes) -> str:
+    return f'"{PAYLOAD_VERSION}-' + hashlib.sha256(payload).hexdigest()[:32] + '"' # strong ETag: quoted, no W/ prefix, changes whenever a single byte changes
+
+
+# a payload stored by an older version (its ETag has no or another version prefix) is rendered again before it is served
+def is_current_etag(etag) -> bool:
+    return bool(etag) and etag.startswith(f'"{PAYLOAD_VERSION}-')
+
+
+class RenderedResponse:
+    def __init__(self, payload: bytes, etag: str):
+        self.etag = etag
+        self.cached_at = time.monotonic()
+        self.bodies = {"identity": payload, "gzip": gzip.compress(payload, compresslevel=6)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(payload, quality=5)
+        self.size = sum(len(body) for body in self.bodies.values())
+
+    # pick the smallest variant the client accepts
+    def body_for(self, accept_encoding: str):
+        accepted = {part.split(";")[0].strip().lower() for part in accept_encoding.split(",")}
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding, self.bodies[encoding]
+        return "identity", self.bodies["identity"]
+
+    # If-None-Match may hold several ETags, weak ones (W/"...") or "*"
+    def matches(self, if_none_match: str) -> bool:
+        if not if_none_match:
+            return False
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in candidates or self.etag in candidates
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, ttl_seconds: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds # 0: no expiry
+        self._entries = OrderedDict() # key -> RenderedResponse, least recently used first
+        self._size = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_seconds and time.monotonic() - entry.cached_at >= self.ttl_seconds:
+            self.discard(key) # the caller reads it from the database again (or finds it gone)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, payload: bytes, etag: str = None) -> RenderedResponse:
+        return self._store(key, RenderedResponse(payload, etag or make_etag(payload)))
+
+    # put() for the event loop: hashing and compressing a large story takes milliseconds, so it runs in a thread, only the bookkeeping stays on the loop
+    async def aput(self, key, payload: bytes, etag: str = None) -> RenderedResponse:
+        entry = await asyncio.to_thread(lambda: RenderedResponse(payload, etag or make_etag(payload)))
+        return self._store(key, entry)
+
+    def _store(self, key, entry: RenderedResponse) -> RenderedResponse:
+        if entry.size > self.max_bytes:
+            return entry # too big to keep, still usable for this one response
+        self.discard(key)
+        self._entries[key] = entry
+        self._size += entry.size
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+        return entry
+
+    def discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+
+complete_story_cache = ResponseCache(settings.COMPLETE_STORY_CACHE_BYTES, settings.COMPLETE_STORY_CACHE_TTL_SECONDS)
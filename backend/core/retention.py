@@ -0,0 +1,267 @@
+import asyncio
+import base64
+import gzip
+import logging
+import os
+import time
+from collections import Counter as TallyCounter
+from datetime import timedelta
+
+import orjson
+from sqlalchemy import select, update, delete, func, and_, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.generation_cache import generation_cache
+from core.job_queue import utcnow
+from core.metrics import retention_rows, retention_sweep_seconds
+from core.response_cache import complete_story_cache
+from db.async_database import AsyncSessionLocal
+from models.job import StoryJob
+from models.playthrough import PlaythroughEvent, StoryNodeStats
+from models.story import Story, StoryNode
+
+"""
+Retention: story_jobs, stories and story_nodes would otherwise only grow, and every poll and story load walks their indexes.
+
+Every RETENTION_INTERVAL_SECONDS a sweep removes, in this order:
+* completed_jobs     completed jobs finished more than RETENTION_COMPLETED_JOB_DAYS ago (their stories stay); a job whose story was generated for another session is kept, it is what puts the story in its session's library
+* failed_jobs        failed jobs older than RETENTION_FAILED_JOB_DAYS
+* old_events         raw playthrough events older than RETENTION_EVENT_DAYS (the per-node aggregates in story_node_stats stay)
+* unopened_stories   stories nobody has opened for RETENTION_STORY_DAYS, with their nodes, finished jobs, events and node stats
+* ownerless_stories  stories without a session that are not in the warm pool, older than RETENTION_ORPHAN_GRACE_HOURS
+* orphan_nodes       story_nodes rows whose story no longer exists
+* orphan_node_stats  story_node_stats rows whose story doesn't exist (events are accepted without a lookup, so a client can send them for any story id)
+Pending and processing jobs, and stories they are generating, are never touched.
+
+Deletes run RETENTION_BATCH_SIZE rows per transaction with a short pause in between, so no lock is held for long and the API keeps serving during a sweep.
+With RETENTION_ARCHIVE_DIR set, jobs and stories (with their nodes) are appended to <dir>/<category>-<date>.jsonl.gz before they are deleted; the archive is written before the commit, so a failed commit can leave rows in the archive that are still in the database (they are archived again next time).
+With RETENTION_DRY_RUN (or `python sweep.py --dry-run`) the sweep only counts what it would remove.
+
+"Opened" means the /complete response or the root node was requested. Recording that on every request would add a write to the hottest read path, so the ids are collected in memory and written to stories.last_opened_at in one UPDATE every RETENTION_ACCESS_FLUSH_SECONDS. Stories that existed before the column was added got the time it was added, so they have a full RETENTION_STORY_DAYS before they can count as unopened.
+"""
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_JOB_STATUSES = ("pending", "processing")
+FINISHED_JOB_STATUSES = ("completed", "failed")
+
+
+def _days_ago(days: float):
+    return utcnow() - timedelta(days=days)
+
+
+# stories a pending or processing job is still generating
+def _active_story_ids():
+    return select(StoryJob.story_id).where(StoryJob.story_id.is_not(None), StoryJob.status.in_(ACTIVE_JOB_STATUSES))
+
+
+def _row_dict(row) -> dict:
+    return {column.name: getattr(row, column.name) for column in row.__table__.columns}
+
+
+def _archive_default(value):
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode() # complete_payload, packed_tree
+    raise TypeError
+
+
+def _append_archive(category: str, records: list):
+    path = os.path.join(settings.RETENTION_ARCHIVE_DIR, f"{category}-{utcnow():%Y%m%d}.jsonl.gz")
+    os.makedirs(settings.RETENTION_ARCHIVE_DIR, exist_ok=True)
+    with gzip.open(path, "ab") as archive: # each append is its own gzip member, gzip readers read them as one stream
+        archive.write(b"".join(orjson.dumps(record, default=_archive_default) + b"\n" for record in records))
+
+
+class RetentionSweeper:
+    def __init__(self):
+        self._opened = set() # story ids opened in this process since the last flush
+        self.last_sweep = None # stats of the last sweep, see sweep()
+        self.totals = TallyCounter() # rows removed by this process, by category
+        self.sweeps = 0
+
+    def record_open(self, story_id: int):
+        self._opened.add(story_id)
+
+    # write the collected story ids to stories.last_opened_at, one UPDATE per RETENTION_BATCH_SIZE ids
+    async def flush_opened(self):
+        story_ids, self._opened = sorted(self._opened), set()
+        now = utcnow()
+        for start in range(0, len(story_ids), settings.RETENTION_BATCH_SIZE):
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Story).where(Story.id.in_(story_ids[start:start + settings.RETENTION_BATCH_SIZE]))
+                                 .values(last_opened_at=now).execution_options(synchronize_session=False))
+                await db.commit()
+
+    # One pass over every category. Returns {"dry_run", "seconds", "rows": {category: rows}}, rows being the rows that were (or in a dry run would be) removed.
+    async def sweep(self, dry_run: bool = None) -> dict:
+        dry_run = settings.RETENTION_DRY_RUN if dry_run is None else dry_run
+        started = time.perf_counter()
+        await self.flush_opened() # so a story opened a moment ago isn't taken for unopened
+        rows = TallyCounter()
+        swept_jobs = [] # conditions of the job categories, a dry run must not count those jobs again with their stories
+
+        for status, days in (("completed", settings.RETENTION_COMPLETED_JOB_DAYS), ("failed", settings.RETENTION_FAILED_JOB_DAYS)):
+            if days > 0:
+                expired = and_(StoryJob.status == status, func.coalesce(StoryJob.completed_at, StoryJob.created_at) < _days_ago(days),
+                               ~exists().where(Story.id == StoryJob.story_id, Story.session_id != StoryJob.session_id)) # a story from the generation cache, owned through this job
+                rows[f"{status}_jobs"] += await self._sweep_jobs(f"{status}_jobs", expired, dry_run)
+                swept_jobs.append(expired)
+
+        if settings.RETENTION_EVENT_DAYS > 0:
+            rows["old_events"] += await self._sweep_chunks(
+                "old_events", PlaythroughEvent.id, PlaythroughEvent.created_at < _days_ago(settings.RETENTION_EVENT_DAYS), self._delete_events, dry_run)
+
+        not_busy = and_(Story.pool_theme.is_(None), Story.id.not_in(_active_story_ids()))
+        if settings.RETENTION_STORY_DAYS > 0:
+            unopened = and_(not_busy, func.coalesce(Story.last_opened_at, Story.created_at) < _days_ago(settings.RETENTION_STORY_DAYS))
+            rows.update(await self._sweep_stories("unopened_stories", unopened, dry_run, swept_jobs))
+            not_busy = and_(not_busy, ~unopened) # in a dry run nothing is gone yet, don't count these stories again below
+        ownerless = and_(not_busy, Story.session_id.is_(None), Story.created_at < _days_ago(settings.RETENTION_ORPHAN_GRACE_HOURS / 24))
+        rows.update(await self._sweep_stories("ownerless_stories", ownerless, dry_run, swept_jobs))
+
+        orphan = ~exists().where(Story.id == StoryNode.story_id)
+        rows["orphan_nodes"] += await self._sweep_chunks("orphan_nodes", StoryNode.id, orphan, self._delete_nodes, dry_run)
+        rows["orphan_node_stats"] += await self._sweep_orphan_node_stats(dry_run)
+
+        rows = +rows # only the categories something was removed from
+        seconds = time.perf_counter() - started
+        retention_sweep_seconds.observe(seconds)
+        self.sweeps += 1
+        if not dry_run:
+            self.totals.update(rows)
+        self.last_sweep = {"finished_at": utcnow().isoformat(), "dry_run": dry_run, "seconds": round(seconds, 3), "rows": dict(rows)}
+        logger.info("Retention sweep%s: %s in %.2fs", " (dry run)" if dry_run else "", dict(rows) or "nothing to remove", seconds)
+        return self.last_sweep
+
+    async def _sweep_jobs(self, category: str, condition, dry_run: bool) -> int:
+        async def delete_jobs(db: AsyncSession, job_ids: list) -> dict:
+            if settings.RETENTION_ARCHIVE_DIR:
+                result = await db.execute(select(StoryJob).where(StoryJob.id.in_(job_ids)))
+                await asyncio.to_thread(_append_archive, category, [_row_dict(job) for job in result.scalars()])
+            await db.execute(delete(StoryJob).where(StoryJob.id.in_(job_ids)))
+            return {}
+        return await self._sweep_chunks(category, StoryJob.id, condition, delete_jobs, dry_run)
+
+    # Stories go with their nodes, their finished jobs (a job pointing at a deleted story would only lead to a 404) and their playthrough events and node stats. Returns rows per table.
+    # `swept_jobs`: conditions of the jobs an earlier category of this sweep removed; a dry run leaves them out of story_jobs, a real sweep has already deleted them.
+    async def _sweep_stories(self, category: str, condition, dry_run: bool, swept_jobs: list = ()) -> dict:
+        removed = TallyCounter()
+
+        async def delete_stories(db: AsyncSession, story_ids: list) -> dict:
+            if settings.RETENTION_ARCHIVE_DIR:
+                nodes = {}
+                result = await db.execute(select(StoryNode).where(StoryNode.story_id.in_(story_ids)))
+                for node in result.scalars():
+                    nodes.setdefault(node.story_id, []).append(_row_dict(node))
+                result = await db.execute(select(Story).where(Story.id.in_(story_ids)))
+                await asyncio.to_thread(_append_archive, category, [{"story": _row_dict(story), "nodes": nodes.get(story.id, [])} for story in result.scalars()])
+            nodes = await db.execute(delete(StoryNode).where(StoryNode.story_id.in_(story_ids)))
+            jobs = await db.execute(delete(StoryJob).where(StoryJob.story_id.in_(story_ids), StoryJob.status.in_(FINISHED_JOB_STATUSES)))
+            events = await db.execute(delete(PlaythroughEvent).where(PlaythroughEvent.story_id.in_(story_ids)))
+            node_stats = await db.execute(delete(StoryNodeStats).where(StoryNodeStats.story_id.in_(story_ids)))
+            await db.execute(delete(Story).where(Story.id.in_(story_ids)))
+            return {"story_nodes": nodes.rowcount, "story_jobs": jobs.rowcount, "playthrough_events": events.rowcount, "story_node_stats": node_stats.rowcount}
+
+        removed[category] = await self._sweep_chunks(category, Story.id, condition, delete_stories, dry_run, removed)
+        if dry_run and removed[category]:
+            async with AsyncSessionLocal() as db:
+                matching = select(Story.id).where(condition)
+                removed["story_nodes"] = (await db.execute(select(func.count(StoryNode.id)).where(StoryNode.story_id.in_(matching)))).scalar()
+                removed["story_jobs"] = (await db.execute(select(func.count(StoryJob.id)).where(
+                    StoryJob.story_id.in_(matching), StoryJob.status.in_(FINISHED_JOB_STATUSES), *(~expired for expired in swept_jobs)))).scalar()
+        return removed
+
+    async def _delete_nodes(self, db: AsyncSession, node_ids: list) -> dict:
+        await db.execute(delete(StoryNode).where(StoryNode.id.in_(node_ids)))
+        return {}
+
+    # story_node_stats has no id column (its key is story_id + node_id), so it is swept by story: up to RETENTION_BATCH_SIZE missing stories per transaction, with all their rows
+    async def _sweep_orphan_node_stats(self, dry_run: bool) -> int:
+        orphan = ~exists().where(Story.id == StoryNodeStats.story_id)
+        if dry_run:
+            async with AsyncSessionLocal() as db:
+                return (await db.execute(select(func.count()).select_from(StoryNodeStats).where(orphan))).scalar()
+
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(StoryNodeStats.story_id).where(orphan).distinct().order_by(StoryNodeStats.story_id).limit(settings.RETENTION_BATCH_SIZE))
+                story_ids = list(result.scalars())
+                if not story_ids:
+                    break
+                deleted = await db.execute(delete(StoryNodeStats).where(StoryNodeStats.story_id.in_(story_ids)))
+                await db.commit()
+
+            total += deleted.rowcount
+            retention_rows.inc(deleted.rowcount, table="story_node_stats", reason="orphan_node_stats")
+            if len(story_ids) < settings.RETENTION_BATCH_SIZE:
+                break
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+        return total
+
+    async def _delete_events(self, db: AsyncSession, event_ids: list) -> dict:
+        await db.execute(delete(PlaythroughEvent).where(PlaythroughEvent.id.in_(event_ids)))
+        return {}
+
+    # Remove the rows matching `condition` in chunks of RETENTION_BATCH_SIZE, each chunk in its own short transaction; returns how many rows matched.
+    # `delete_chunk(db, ids)` removes one chunk (and whatever goes with it) and returns extra rows removed per table, added to `extra`.
+    async def _sweep_chunks(self, category: str, id_column, condition, delete_chunk, dry_run: bool, extra: TallyCounter = None) -> int:
+        if dry_run:
+            async with AsyncSessionLocal() as db:
+                return (await db.execute(select(func.count(id_column)).where(condition))).scalar()
+
+        table = id_column.class_.__tablename__
+        total = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(select(id_column).where(condition).order_by(id_column).limit(settings.RETENTION_BATCH_SIZE))
+                ids = list(result.scalars())
+                if not ids:
+                    break
+                extra_rows = await delete_chunk(db, ids)
+                await db.commit()
+
+            total += len(ids)
+            retention_rows.inc(len(ids), table=table, reason=category)
+            for extra_table, count in extra_rows.items():
+                retention_rows.inc(count, table=extra_table, reason=category)
+                if extra is not None:
+                    extra[extra_table] += count
+            if table == "stories":
+                for story_id in ids:
+                    complete_story_cache.discard(story_id)
+                generation_cache.forget_stories(ids)
+            if len(ids) < settings.RETENTION_BATCH_SIZE:
+                break
+            await asyncio.sleep(settings.RETENTION_BATCH_PAUSE_SECONDS)
+        return total
+
+    def snapshot(self) -> dict:
+        return {
+            "enabled": settings.RETENTION_ENABLED,
+            "dry_run": settings.RETENTION_DRY_RUN,
+            "sweeps": self.sweeps,
+            "last_sweep": self.last_sweep,
+            "removed_total": dict(self.totals),
+            "opened_not_flushed": len(self._opened),
+        }
+
+
+retention_sweeper = RetentionSweeper()
+
+
+# Runs in every API process: writes the opened story ids every RETENTION_ACCESS_FLUSH_SECONDS and, with RETENTION_ENABLED, sweeps every RETENTION_INTERVAL_SECONDS.
+# Several processes may sweep at the same time; they just find less to delete.
+async def retention_loop():
+    last_sweep = time.monotonic()
+    while True:
+        await asyncio.sleep(settings.RETENTION_ACCESS_FLUSH_SECONDS)
+        try:
+            if settings.RETENTION_ENABLED and time.monotonic() - last_sweep >= settings.RETENTION_INTERVAL_SECONDS:
+                last_sweep = time.monotonic()
+                await retention_sweeper.sweep()
+            else:
+                await retention_sweeper.flush_opened()
+        except Exception:
+            logger.exception("Retention sweep failed")
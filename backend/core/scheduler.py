@@ -0,0 +1,129 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from core.config import settings
+
+"""
+Runs story generations with a bounded number of concurrent LLM calls.
+
+* At most GENERATION_MAX_CONCURRENCY generations run at once, the rest wait in a queue.
+* Fairness: every session has its own FIFO queue and the scheduler takes one job from each session in turn (round robin), so one session submitting many stories can't push everybody else to the back.
+* Backpressure: when the whole queue (GENERATION_MAX_QUEUE) or a session's queue (GENERATION_MAX_QUEUE_PER_SESSION) is full, submit() raises SchedulerSaturated and the API answers 429 with a Retry-After estimate, instead of accepting work it can't finish in reasonable time.
+
+            submit(job A1, session A) ──► queue A: [A1, A2, A3] ─┐
+            submit(job B1, session B) ──► queue B: [B1]         ─┼─ round robin ─► A1, B1, C1, A2, C2, A3 ... ─► N running slots
+            submit(job C1, session C) ──► queue C: [C1, C2]     ─┘
+"""
+
+DEFAULT_JOB_SECONDS = 15 # used for the Retry-After estimate until some generations have finished
+
+
+class SchedulerSaturated(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class GenerationScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int, max_queue_per_session: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_queue_per_session = max_queue_per_session
+        self._queues = OrderedDict() # session_id -> deque of (job_id, run); the first session is the next one to be served
+        self._job_sessions = {} # queued job_id -> session_id
+        self._queued = 0
+        self._running = set() # asyncio tasks of the running generations
+        self._durations = deque(maxlen=50) # seconds taken by the last generations
+
+    def check_admission(self, session_id: str):
+        if self._queued >= self.max_queue:
+            raise SchedulerSaturated("Too many stories are being generated right now, please try again later", self.retry_after())
+        if len(self._queues.get(session_id, ())) >= self.max_queue_per_session:
+            raise SchedulerSaturated("You already have too many stories waiting to be generated", self.retry_after())
+
+    # queue `run` (an async function without arguments) for the given job; raises SchedulerSaturated when full
+    def submit(self, job_id: str, session_id: str, run):
+        self.check_admission(session_id)
+        self._queues.setdefault(session_id, deque()).append((job_id, run))
+        self._job_sessions[job_id] = session_id
+        self._queued += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while len(self._running) < self.max_concurrency and self._queued:
+            session_id, queue = next(iter(self._queues.items()))
+            job_id, run = queue.popleft()
+            if queue:
+                self._queues.move_to_end(session_id) # this session had its turn, serve the others first
+            else:
+                del self._queues[session_id]
+            del self._job_sessions[job_id]
+            self._queued -= 1
+
+            task = asyncio.get_running_loop().create_task(self._run(run))
+            self._running.add(task)
+            task.add_done_callback(self._finished)
+
+    async def _run(self, run):
+        started = time.monotonic()
+        try:
+            await run() # generate_story_task records its own failures on the job
+        finally:
+            self._durations.append(time.monotonic() - started)
+
+    def _finished(self, task):
+        self._running.discard(task)
+        self._dispatch() # a slot is free, start the next job. Also after a cancellation: shutdown() empties the queues first, so this only refills slots while serving
+
+    def is_queued(self, job_id: str) -> bool:
+        return job_id in self._job_sessions
+
+    # 1-based place of a queued job in the round-robin order, None once it is running (or unknown)
+    def position(self, job_id: str) -> Optional[int]:
+        session_id = self._job_sessions.get(job_id)
+        if session_id is None:
+            return None
+        own_queue = self._queues[session_id]
+        index = next(i for i, (queued_job_id, _) in enumerate(own_queue) if queued_job_id == job_id)
+
+        ahead = index # earlier jobs of the same session
+        before_own_turn = True
+        for other_session, queue in self._queues.items():
+            if other_session == session_id:
+                before_own_turn = False
+                continue
+            # sessions served before ours in each round get index + 1 turns before our job, the ones after it get index turns
+            ahead += min(len(queue), index + 1 if before_own_turn else index)
+        return ahead + 1
+
+    def retry_after(self) -> int:
+        average = sum(self._durations) / len(self._durations) if self._durations else DEFAULT_JOB_SECONDS
+        rounds = (self._queued + 1) / max(self.max_concurrency, 1) # how many "waves" of generations are ahead of a new job
+        return max(1, math.ceil(average * rounds))
+
+    def snapshot(self) -> dict:
+        return {
+            "running": len(self._running),
+            "queued": self._queued,
+            "sessions_waiting": len(self._queues),
+            "max_concurrency": self.max_concurrency,
+        }
+
+    # stop the running generations when the server shuts down; their jobs stay "processing" until the lease runs out and they are requeued
+    async def shutdown(self):
+        self._queues.clear()
+        self._job_sessions.clear()
+        self._queued = 0
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+
+generation_scheduler = GenerationScheduler(
+    max_concurrency=settings.GENERATION_MAX_CONCURRENCY,
+    max_queue=settings.GENERATION_MAX_QUEUE,
+    max_queue_per_session=settings.GENERATION_MAX_QUEUE_PER_SESSION,
+)
@@ -1,91 +1,361 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import TYPE_CHECKING
+from sqlalchemy import select, func, text, insert
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
+
+from core.prompts import (
+    STORY_PROMPT, STORY_OUTLINE_PROMPT, NODE_OUTLINE_PROMPT, SUBTREE_PROMPT, BRANCH_CONTEXT, COMPACT_STORY_PROMPT, COMPACT_FORMAT_INSTRUCTIONS)
+from core.llm_providers import get_llm_router
+from core.metrics import stage, llm_json_repairs, llm_json_unrepairable
+from core.json_repair import salvage_story_json, REGENERATED_SUBTREES
+from core.stream_parser import IncrementalJSONParser
+from core.story_stream import StreamingStoryWriter
+from core.story_pack import pack_story
+from models.story import Story, StoryNode
+from core.models import StoryLLMResponse, StoryNodeLLM, StoryOptionLLM, StoryOutlineLLM, NodeOutlineLLM, CompactStoryLLM, StoryParseError
 from core.config import settings
 
-# from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
+if TYPE_CHECKING:
+    from langchain_core.output_parsers import PydanticOutputParser # imported for real in _pipeline(), see warm_up()
 
-from core.prompts import STORY_PROMPT
-from models.story import Story, StoryNode
-from core.models import StoryLLMResponse, StoryNodeLLM
-from dotenv import load_dotenv
-load_dotenv() # load .env file to get the environment variables for the current script, such as OPENAI_API
+logger = logging.getLogger(__name__)
 
 class StoryGenerator:
 
+    # name -> (system prompt, human message template, schema the answer is parsed into)
+    PIPELINES = {
+        "story": (STORY_PROMPT, "Create the story with this theme: {theme}", StoryLLMResponse),
+        "story_outline": (STORY_OUTLINE_PROMPT, "Create the story outline with this theme: {theme}", StoryOutlineLLM),
+        "node_outline": (NODE_OUTLINE_PROMPT, BRANCH_CONTEXT, NodeOutlineLLM),
+        "subtree": (SUBTREE_PROMPT, BRANCH_CONTEXT, StoryNodeLLM),
+        "story_compact": (COMPACT_STORY_PROMPT, "Theme: {theme}", CompactStoryLLM), # PROMPT_MODE=compact
+    }
+    # schemas that bring their own, shorter format instructions instead of the JSON schema PydanticOutputParser renders
+    FORMAT_INSTRUCTIONS = {
+        CompactStoryLLM: COMPACT_FORMAT_INSTRUCTIONS,
+    }
+    # what salvage_story_json should expect for each schema when an answer has to be repaired
+    SALVAGE_SHAPES = {
+        StoryLLMResponse: "story",
+        CompactStoryLLM: "story_compact",
+        StoryNodeLLM: "node",
+        StoryOutlineLLM: "story_outline",
+        NodeOutlineLLM: "node_outline",
+    }
+    _pipelines = {} # name -> (prompt template, parser), compiled once per process by _pipeline(), reused by every story
+
     @classmethod
     def _get_llm(cls): # In Python, with a prefix underscore, it is a private method in this class
-        return ChatGoogleGenerativeAI(model="gemini-2.5-flash")
+        # one router with long-lived provider clients per process (see core/llm_providers.py), so HTTP connections stay warm between stories
+        return get_llm_router()
 
     @classmethod
-    def generate_story(cls, db: Session, session_id: str, theme: str = "fantasy") -> Story:
-        llm = cls._get_llm()
-        # PydanticOutputParser creates a parser that knows how to convert LLM responses into StoryLLMResponse Pydantic objects. pydantic_object=StoryLLMResponse tells it: "I expect the LLM to return data matching this schema"
-        story_parser = PydanticOutputParser(pydantic_object=StoryLLMResponse)
+    # The parser, its format instructions (a JSON schema rendered to text) and the prompt template don't depend on the theme, so they are built once instead of for every story.
+    def _pipeline(cls, name: str):
+        if name not in cls._pipelines:
+            from langchain_core.prompts import ChatPromptTemplate # langchain takes a good part of a second to import, so it is only loaded when a story is generated (or warmed up)
+            from langchain_core.output_parsers import PydanticOutputParser
+            system_prompt, human_template, schema = cls.PIPELINES[name]
+            # PydanticOutputParser creates a parser that knows how to convert LLM responses into Pydantic objects. pydantic_object=StoryLLMResponse tells it: "I expect the LLM to return data matching this schema"
+            parser = PydanticOutputParser(pydantic_object=schema)
 
-        # format_instructions is specified in the prompt
-        # get_format_instructions() gives us a string following the format defined in the StoryLLMResponse
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", STORY_PROMPT),
-            ("human", f"Create the story with this theme: {theme}")
-        ]).partial(format_instructions=story_parser.get_format_instructions())
+            # format_instructions is specified in the prompt
+            # get_format_instructions() gives us a string following the format defined in the schema
+            prompt = ChatPromptTemplate.from_messages([
+                ("system", system_prompt),
+                ("human", human_template) # filled in per story; as template variables a theme containing { } can't break the template
+            ]).partial(format_instructions=cls.FORMAT_INSTRUCTIONS.get(schema) or parser.get_format_instructions())
+            cls._pipelines[name] = (prompt, parser)
+        return cls._pipelines[name]
 
+    @classmethod
+    # `pipeline` defaults to the story pipeline of PROMPT_MODE ("story" or "story_compact")
+    def _build_prompt(cls, theme: str, pipeline: str = None):
+        prompt, story_parser = cls._pipeline(pipeline or ("story_compact" if settings.PROMPT_MODE == "compact" else "story"))
+        return prompt.invoke({"theme": theme}), story_parser
 
-        # We don't need to pass any information to the prompt, so we pass an empty dictionary to the invoke() method
-        raw_response = llm.invoke(prompt.invoke({}))
+    @classmethod
+    # Compiles the prompts and creates the LLM clients (importing langchain and the provider SDKs), so the first story doesn't pay for it. When it runs is set by LLM_WARM_UP, see start_warm_up().
+    def warm_up(cls):
+        for name in cls.PIPELINES:
+            cls._pipeline(name)
+        for provider in get_llm_router().providers:
+            try:
+                provider.client
+            except Exception:
+                logger.exception("Could not create the %s LLM client, it will be retried on first use", provider.name)
+
+    @classmethod
+    # Called at startup (API lifespan and worker.py). LLM_WARM_UP="startup" warms up before the process serves anything, "background" right after, in a thread, so the process answers its first requests (job polls, stored stories) without waiting for langchain; "lazy" leaves it to the first generation.
+    # Returns the background task, if any.
+    def start_warm_up(cls):
+        if settings.LLM_WARM_UP == "startup":
+            cls.warm_up()
+        elif settings.LLM_WARM_UP == "background":
+            return asyncio.create_task(asyncio.to_thread(cls.warm_up))
+        return None
 
+    @classmethod
+    # LLM text -> typed schema object in one pass: pydantic-core parses the JSON and validates the whole recursive tree while reading it, instead of json.loads() building dicts that are validated again afterwards.
+    def _parse_response(cls, story_parser: "PydanticOutputParser", raw_response):
+        structure, _ = cls._parse_or_salvage(story_parser, raw_response)
+        return structure
+
+    @classmethod
+    # Like _parse_response, but also returns the SalvageReport (None when the answer was fine) of an answer that had to be repaired first, see core/json_repair.py
+    def _parse_or_salvage(cls, story_parser: "PydanticOutputParser", raw_response) -> tuple:
         response_text = raw_response
         if hasattr(raw_response, "content"):
             response_text = raw_response.content
+        schema = story_parser.pydantic_object
 
-        story_structure = story_parser.parse(response_text)
         """
             response_text (raw JSON string)
                 ↓
-            Parser reads the string
-                ↓
-            Converts to Python dict
-                ↓
-            Validates against StoryLLMResponse schema
-                ↓
-            Returns StoryLLMResponse object (story_structure)
+            model_validate_json: parse + validate every node (Rust, one pass)
+                ↓                                       ↘ invalid JSON or wrong shape
+            Returns StoryLLMResponse object               salvage_story_json: strip comments / trailing commas, close a cut-off tail,
+            (story_structure), nodes already typed        prune incomplete branches into endings, then validate
         """
+        try:
+            return cls._expand_compact(schema.model_validate_json(cls._strip_code_fence(response_text))), None
+        except ValidationError as e:
+            error = e
+        wrong_shape = any(item["type"] != "json_invalid" for item in error.errors())
+
+        if not settings.JSON_REPAIR_ENABLED:
+            if wrong_shape:
+                raise StoryParseError(schema.__name__, error) from None # valid JSON, wrong shape: report which nodes are wrong
+            return cls._expand_compact(story_parser.parse(response_text)), None # not plain JSON (e.g. text around it): the LangChain parser finds the JSON inside
+
+        try:
+            value, report = salvage_story_json(response_text, cls.SALVAGE_SHAPES[schema])
+            structure = (StoryLLMResponse if schema is CompactStoryLLM else schema).model_validate(value) # salvage already spells compact keys out
+        except ValueError as salvage_error: # includes ValidationError
+            llm_json_unrepairable.inc(schema=schema.__name__)
+            if wrong_shape:
+                raise StoryParseError(schema.__name__, error) from None
+            raise ValueError(f"{schema.__name__}: the LLM response is not valid JSON and could not be repaired ({salvage_error})") from None
+
+        for repair in report.repairs:
+            llm_json_repairs.inc(repair=repair)
+        if report.repairs:
+            logger.warning("Repaired the LLM's %s answer (%s), %d nodes kept", schema.__name__, ", ".join(sorted(report.repairs)), report.node_count)
+        return structure, report
 
-        story_db = Story(title=story_structure.title, session_id=session_id)
+    @classmethod
+    # the rest of the pipeline only knows StoryLLMResponse, a compact answer is mapped onto it right after parsing
+    def _expand_compact(cls, structure):
+        return structure.to_story() if isinstance(structure, CompactStoryLLM) else structure
+
+    @classmethod
+    # models often wrap JSON in a markdown code block (```json ... ```)
+    def _strip_code_fence(cls, text: str) -> str:
+        text = text.strip()
+        if text.startswith("```"):
+            text = text[text.find("\n") + 1:]
+            if text.rstrip().endswith("```"):
+                text = text.rstrip()[:-3]
+        return text
+
+    @classmethod
+    # Save the parsed story and all its nodes in the current transaction. It only uses the sync Session API, so the async path can run it via AsyncSession.run_sync().
+    def _save_story(cls, db: Session, session_id: str, story_structure: StoryLLMResponse) -> Story:
+        flat_nodes = cls._flatten_story_tree(story_structure.rootNode) # flatten the whole tree in memory once, for the counters and the storage below
+        story_db = Story(title=story_structure.title, session_id=session_id,
+                         node_count=len(flat_nodes), ending_count=sum(1 for entry in flat_nodes if entry["data"].isEnding))
+        if settings.STORY_STORAGE == "packed":
+            story_db.packed_tree = cls._pack_story_tree(flat_nodes) # the whole tree in one blob on the story row, no story_nodes rows at all
         db.add(story_db)
         db.flush() # update all the database objects in the current session, so that the story_db object will have the id generated by the database, which we need to use as the foreign key for the story nodes
 
-        root_node_data = story_structure.rootNode
-        if isinstance(root_node_data, dict):
-            root_node_data = StoryNodeLLM.model_validate(root_node_data) # validate the data and convert it to a StoryNodeLLM object
+        if story_db.packed_tree is None:
+            cls._persist_flat_nodes(db, story_db.id, flat_nodes) # save every node with one bulk insert
+        return story_db
+
+    @classmethod
+    def generate_story(cls, db: Session, session_id: str, theme: str = "fantasy") -> Story:
+        llm = cls._get_llm()
+        with stage("prompt"):
+            prompt_value, story_parser = cls._build_prompt(theme)
 
-        cls._process_story_node(db, story_db.id, root_node_data, is_root=True) # process the root node and its child nodes recursively, and save them to the database
-        
-        db.commit() # commit the story and story nodes to the database
+        with stage("llm"):
+            raw_response = llm.invoke(prompt_value) # blocks the calling thread until the whole story is generated
+        with stage("parse"):
+            story_structure = cls._parse_response(story_parser, raw_response)
+
+        with stage("save"):
+            story_db = cls._save_story(db, session_id, story_structure)
+        with stage("commit"):
+            db.commit() # commit the story and story nodes to the database
         return story_db
 
+    @classmethod
+    # Async version of generate_story. ainvoke() awaits the LLM call on the event loop instead of holding a threadpool thread, so one process can keep hundreds of generations in flight.
+    async def agenerate_story(cls, db: AsyncSession, session_id: str, theme: str = "fantasy") -> Story:
+        llm = cls._get_llm()
+        with stage("prompt"):
+            prompt_value, story_parser = cls._build_prompt(theme)
+
+        with stage("llm"):
+            raw_response = await llm.ainvoke(prompt_value)
+        with stage("parse"):
+            story_structure, salvage = cls._parse_or_salvage(story_parser, raw_response)
+        if salvage and salvage.stubs and salvage.node_count < settings.JSON_SALVAGE_MIN_NODES:
+            await cls._regenerate_stubs(llm, theme, story_structure, salvage.stubs) # too little survived the repair, write the cut-off branches again
+
+        # run_sync hands our sync helpers a Session bound to the same connection, so the bulk insert code is shared with the sync path
+        with stage("save"):
+            story_db = await db.run_sync(cls._save_story, session_id, story_structure)
+        with stage("commit"):
+            await db.commit()
+        return story_db
+
+    @classmethod
+    # Fan-out version of agenerate_story (FANOUT_GENERATION=True). Instead of one huge completion, one call outlines the story (title, root node, a summary per branch) and every branch is then written by its own, smaller call, FANOUT_CONCURRENCY at a time:
+    #
+    #   story_outline ──► root + branches A, B, C
+    #                       ├── subtree(A) ─┐
+    #                       ├── subtree(B) ─┼─ in parallel ──► merged into one StoryLLMResponse ──► _save_story
+    #                       └── subtree(C) ─┘
+    #
+    # With FANOUT_OUTLINE_LEVELS > 1 the branches are outlined again (node_outline) before their subtrees are written, so the tree grows by a factor of 2-3 per level while the wall time only grows by one call per level.
+    async def agenerate_story_fanout(cls, db: AsyncSession, session_id: str, theme: str = "fantasy") -> Story:
+        llm = cls._get_llm()
+        calls = asyncio.Semaphore(settings.FANOUT_CONCURRENCY) # bounds the LLM calls of this story; the provider rate limits bound all stories together
+
+        outline = await cls._acall_pipeline(llm, calls, "story_outline", theme=theme)
+        root_node = await cls._expand_outline(llm, calls, theme, outline.title, outline.rootNode, story_so_far=[], level=1)
+        story_structure = StoryLLMResponse(title=outline.title, rootNode=root_node)
+
+        with stage("save"):
+            story_db = await db.run_sync(cls._save_story, session_id, story_structure)
+        with stage("commit"):
+            await db.commit()
+        return story_db
+
+    @classmethod
+    async def _acall_pipeline(cls, llm, calls: asyncio.Semaphore, name: str, **variables):
+        prompt, parser = cls._pipeline(name)
+        prompt_value = prompt.invoke(variables)
+        async with calls:
+            with stage(f"fanout_{name}"):
+                raw_response = await llm.ainvoke(prompt_value)
+        with stage("parse"):
+            return cls._parse_response(parser, raw_response)
+
+    @classmethod
+    # Turn an outlined node into a full StoryNodeLLM by writing (or outlining further) each of its branches concurrently
+    async def _expand_outline(cls, llm, calls: asyncio.Semaphore, theme: str, title: str, outline: NodeOutlineLLM, story_so_far: list, level: int) -> StoryNodeLLM:
+        if outline.isEnding or not outline.branches:
+            return StoryNodeLLM(content=outline.content, isEnding=True, isWinningEnding=outline.isWinningEnding)
+
+        async def expand_branch(branch):
+            branch_so_far = story_so_far + [outline.content, f"(The player chose: {branch.text})"]
+            variables = dict(theme=theme, title=title, story_so_far="\n".join(story_so_far + [outline.content]), choice=branch.text, summary=branch.summary)
+            if level < settings.FANOUT_OUTLINE_LEVELS:
+                child_outline = await cls._acall_pipeline(llm, calls, "node_outline", **variables)
+                return await cls._expand_outline(llm, calls, theme, title, child_outline, branch_so_far, level + 1)
+            return await cls._acall_pipeline(llm, calls, "subtree", subtree_depth=settings.FANOUT_SUBTREE_DEPTH, **variables)
+
+        try:
+            async with asyncio.TaskGroup() as branches: # if one branch fails, the calls still running for its siblings are cancelled instead of paid for
+                tasks = [branches.create_task(expand_branch(branch)) for branch in outline.branches]
+        except ExceptionGroup as group:
+            raise group.exceptions[0] from None # the job records str(error), report the first real cause
+
+        return StoryNodeLLM(content=outline.content,
+                            isEnding=False,
+                            isWinningEnding=False,
+                            options=[StoryOptionLLM(text=branch.text, nextNode=task.result())
+                                     for branch, task in zip(outline.branches, tasks)])
+
+    @classmethod
+    # Rewrite the branches that were cut off in a repaired story (each stub is an ending the repair made up), one subtree call per branch, the rest of the story is kept.
+    # A branch whose call fails keeps its stub ending, the story is still complete without it.
+    async def _regenerate_stubs(cls, llm, theme: str, story_structure: StoryLLMResponse, stubs: list):
+        calls = asyncio.Semaphore(settings.FANOUT_CONCURRENCY)
+
+        async def regenerate(path: tuple):
+            node, story_so_far, option = story_structure.rootNode, [], None
+            for index in path: # follow the option indexes from the root down to the stub
+                option = node.options[index]
+                story_so_far += [node.content, f"(The player chose: {option.text})"]
+                node = option.nextNode
+            option.nextNode = await cls._acall_pipeline(llm, calls, "subtree",
+                                                        theme=theme,
+                                                        title=story_structure.title,
+                                                        story_so_far="\n".join(story_so_far[:-1]),
+                                                        choice=option.text,
+                                                        summary=node.content,
+                                                        subtree_depth=settings.FANOUT_SUBTREE_DEPTH)
+
+        results = await asyncio.gather(*(regenerate(path) for path in stubs if path), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning("Regenerating a cut-off branch failed, keeping it as an ending: %s", result)
+        if any(not isinstance(result, Exception) for result in results):
+            llm_json_repairs.inc(repair=REGENERATED_SUBTREES)
+
+    @classmethod
+    # Streaming version of agenerate_story: the title and every node are saved (and published to /stories/{id}/stream) as soon as their part of the JSON has been generated, instead of after the whole completion.
+    async def astream_story(cls, db: AsyncSession, session_id: str, theme: str = "fantasy", on_story_created=None) -> Story:
+        llm = cls._get_llm()
+        with stage("prompt"):
+            prompt_value, _ = cls._build_prompt(theme, "story") # the stream writer follows the long key names, so streaming always uses the verbose prompt
+
+        json_parser = IncrementalJSONParser()
+        writer = StreamingStoryWriter(db, session_id, on_story_created)
+        try:
+            with stage("llm_stream"): # the LLM stream and the saving interleave, so they are measured together
+                async with aclosing(llm.astream(prompt_value)) as stream: # closed explicitly, not whenever the garbage collector gets to it
+                    async for chunk in stream: # yields the completion a few tokens at a time
+                        if json_parser.done:
+                            continue # read the stream to its end anyway: providers send the token usage (usage_metadata) on the last chunk, and the router records it from there
+                        for path, value in json_parser.feed(cls._chunk_text(chunk)):
+                            await writer.handle(path, value)
+                        await writer.commit() # one commit per chunk, not per node
+
+            if not json_parser.done:
+                raise ValueError("The LLM stream ended before the story JSON was complete")
+            try:
+                StoryLLMResponse.model_validate(json_parser.value) # the same schema check the non-streaming path gets from _parse_response()
+            except ValidationError as e:
+                raise StoryParseError("StoryLLMResponse", e) from None
+            await writer.finish()
+        except Exception as e:
+            await writer.abort(str(e))
+            raise
+        return writer.story
+
+    @classmethod
+    def _chunk_text(cls, chunk) -> str:
+        content = chunk.content if hasattr(chunk, "content") else chunk
+        if isinstance(content, list): # some providers stream a list of content parts instead of a plain string
+            return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+        return content
+
     @classmethod
     # since we got returned massage from LLM in JSON, we need to process the data and save it to the database. This function is to process each node in the story recursively and save it to the database.
     def _process_story_node(cls, db: Session, story_id: int, node_data: StoryNodeLLM, is_root: bool = False) -> StoryNode:
         node = StoryNode(story_id=story_id,
-                        content=node_data.content if hasattr(node_data, "content") else node_data["content"],
+                        content=node_data.content,
                         is_root=is_root,
-                        is_ending=node_data.isEnding if hasattr(node_data, "isEnding") else node_data["isEnding"],
-                        is_winning=node_data.isWinningEnding if hasattr(node_data, "isWinningEnding") else node_data["isWinningEnding"],
+                        is_ending=node_data.isEnding,
+                        is_winning=node_data.isWinningEnding,
                         options=[])
         db.add(node)
         db.flush()
 
         # store simplified information from the node to the tree data structure
-        if not node.is_ending and (hasattr(node_data, "options") and node_data.options):
+        if not node.is_ending and node_data.options:
             options_list = []
             for option_data in node_data.options:
-                next_node = option_data.nextNode
-                
-                if isinstance(next_node, dict):
-                    next_node = StoryNodeLLM.model_validate(next_node) # validate the data and convert it to a StoryNodeLLM object
-                child_node = cls._process_story_node(db, story_id, next_node, is_root=False) # recursively process the child node
+                child_node = cls._process_story_node(db, story_id, option_data.nextNode, is_root=False) # recursively process the child node
                 
                 options_list.append({
                     "text": option_data.text,
@@ -93,4 +363,74 @@ class StoryGenerator:
                 })
             node.options = options_list
         db.flush()
-        return node
\ No newline at end of file
+        return node
+
+    @classmethod
+    # Flatten the LLM tree into a list in the order the nodes are visited (root first). Each entry keeps the validated node data and the list of (option text, index of the child entry) pairs, so that the options can be filled in before anything touches the database.
+    # An explicit stack is used instead of recursion, so very deep trees can't hit Python's recursion limit.
+    def _flatten_story_tree(cls, root_node_data: StoryNodeLLM) -> list:
+        flat_nodes = []
+        stack = [(root_node_data, None)] # (node data, (parent entry, option text)) waiting to be visited
+        while stack:
+            node_data, parent = stack.pop()
+            entry = {"data": node_data, "options": []}
+            index = len(flat_nodes)
+            flat_nodes.append(entry)
+            if parent is not None:
+                parent_entry, option_text = parent
+                parent_entry["options"].append((option_text, index))
+
+            if not node_data.isEnding and node_data.options:
+                # push in reverse so the first option is visited first and options keep the order the LLM gave them
+                for option_data in reversed(node_data.options):
+                    stack.append((option_data.nextNode, (entry, option_data.text)))
+        return flat_nodes
+
+    @classmethod
+    # Reserve `count` ids for story_nodes before inserting, so every row can be written together with its final options (which point at the children's ids).
+    def _reserve_node_ids(cls, db: Session, count: int) -> list:
+        if count == 0:
+            return []
+        if db.get_bind().dialect.name == "postgresql":
+            # take a block of values from the serial sequence in one round trip; the sequence is never handed out twice, so concurrent jobs can't collide
+            result = db.execute(
+                text("SELECT nextval(pg_get_serial_sequence('story_nodes', 'id')) FROM generate_series(1, :count)"),
+                {"count": count})
+            return list(result.scalars())
+
+        # SQLite has no sequences. The Story row was flushed before this call, so this transaction already holds the database write lock and no other writer can insert nodes between reading MAX(id) and our insert.
+        start = db.execute(select(func.max(StoryNode.id))).scalar() or 0
+        return list(range(start + 1, start + 1 + count))
+
+    @classmethod
+    # Save the whole tree with a single bulk INSERT. Compared to _process_story_node (INSERT + UPDATE per node), the number of statements no longer grows with the size of the story.
+    def _persist_story_nodes(cls, db: Session, story_id: int, root_node_data: StoryNodeLLM) -> list:
+        return cls._persist_flat_nodes(db, story_id, cls._flatten_story_tree(root_node_data))
+
+    @classmethod
+    # _persist_story_nodes for a tree that is already flattened
+    def _persist_flat_nodes(cls, db: Session, story_id: int, flat_nodes: list) -> list:
+        node_ids = cls._reserve_node_ids(db, len(flat_nodes))
+
+        rows = []
+        for index, entry in enumerate(flat_nodes):
+            node_data = entry["data"]
+            rows.append({
+                "id": node_ids[index],
+                "story_id": story_id,
+                "content": node_data.content,
+                "is_root": index == 0, # the root is always the first node visited
+                "is_ending": node_data.isEnding,
+                "is_winning": node_data.isWinningEnding,
+                "options": [{"text": option_text, "node_id": node_ids[child_index]}
+                            for option_text, child_index in entry["options"]],
+            })
+
+        db.execute(insert(StoryNode), rows) # executemany of one INSERT statement; SQLAlchemy batches the rows into multi-row VALUES where the driver supports it
+        return node_ids
+
+    @classmethod
+    # The packed form of a flattened tree (STORY_STORAGE=packed). It uses the same flattening as the bulk insert, so a node's local id is its position in the visit order + 1.
+    def _pack_story_tree(cls, flat_nodes: list) -> bytes:
+        return pack_story([(entry["data"].content, entry["data"].isEnding, entry["data"].isWinningEnding, entry["options"]) for entry in flat_nodes],
+                          settings.STORY_PACK_COMPRESSION)
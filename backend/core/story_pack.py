@@ -0,0 +1,113 @@
+import json
+import zlib
+
+try:
+    import msgpack # optional, smaller and faster to decode than JSON
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard # optional, compresses better and decompresses faster than zlib
+except ImportError:
+    zstandard = None
+
+"""
+Packed story storage (STORY_STORAGE=packed): the whole node tree of a story as one blob on Story.packed_tree, instead of one story_nodes row per node.
+
+A finished story never changes and is always read as a whole (or a node and its children), so it can be loaded with a single-row lookup and decoded in one call.
+
+    blob = b"1" + codec + compression + body
+        codec:        b"J" JSON, b"M" msgpack
+        compression:  b"-" none, b"z" zlib, b"Z" zstd
+        body:         [[content, flags, [[option text, child id], ...]], ...]   flags: 1 = ending, 2 = winning ending
+
+Nodes are listed in the order they are visited (root first) and their ids are local to the story: the root is node 1, the next node visited is node 2 and so on.
+The header records how the blob was written, so blobs written with different settings (or on a machine with other packages installed) can always be read back.
+"""
+
+FORMAT_VERSION = b"1"
+ENDING = 1
+WINNING = 2
+ROOT_NODE_ID = 1
+
+
+def _encode(body: list) -> tuple:
+    if msgpack is not None:
+        return b"M", msgpack.packb(body, use_bin_type=True)
+    return b"J", json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _compress(data: bytes, compression: str) -> tuple:
+    if compression == "zstd" and zstandard is not None:
+        return b"Z", zstandard.ZstdCompressor(level=3).compress(data)
+    if compression in ("zstd", "zlib"): # zstd without the package falls back to zlib, which is always there
+        return b"z", zlib.compress(data, 6)
+    return b"-", data
+
+
+# `nodes` is a list of (content, is_ending, is_winning, [(option text, index of the child in `nodes`), ...]), root first
+def pack_story(nodes: list, compression: str = "zstd") -> bytes:
+    body = []
+    for content, is_ending, is_winning, options in nodes:
+        flags = (ENDING if is_ending else 0) | (WINNING if is_winning else 0)
+        body.append([content, flags, [[text, child_index + 1] for text, child_index in options]])
+    codec, data = _encode(body)
+    compression_code, data = _compress(data, compression)
+    return FORMAT_VERSION + codec + compression_code + data
+
+
+# The nodes of a packed story, as dicts with the fields of CompleteStoryNodeResponse (the same shape core.story_stream.node_payload sends), root first
+def unpack_story(blob: bytes) -> list:
+    blob = bytes(blob) # some drivers hand out memoryview for binary columns
+    version, codec, compression, data = blob[:1], blob[1:2], blob[2:3], blob[3:]
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unknown packed story format {version!r}")
+
+    if compression == b"Z":
+        if zstandard is None:
+            raise RuntimeError("This story was packed with zstd, install zstandard to read it")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif compression == b"z":
+        data = zlib.decompress(data)
+
+    if codec == b"M":
+        if msgpack is None:
+            raise RuntimeError("This story was packed with msgpack, install msgpack to read it")
+        body = msgpack.unpackb(data, raw=False)
+    else:
+        body = json.loads(data)
+
+    return [{ # keys in the field order of CompleteStoryNodeResponse, so routers.story.render_complete_story can serialize them as they are
+        "content": content,
+        "is_ending": bool(flags & ENDING),
+        "is_winning_ending": bool(flags & WINNING),
+        "id": index,
+        "options": [{"text": text, "node_id": child_id} for text, child_id in options],
+    } for index, (content, flags, options) in enumerate(body, start=ROOT_NODE_ID)]
+
+
+# Pack a story that is stored as story_nodes rows (used by pack_stories.py). Row ids are replaced with local ids in visit order, so the result is the same as packing the tree at generation time.
+# Returns the blob and {row id: local id} of the rows it contains (rows no option leads to are left out), for moving whatever refers to the nodes over to the new ids.
+def pack_rows(rows: list, compression: str = "zstd") -> tuple:
+    by_id = {row.id: row for row in rows}
+    root = next((row for row in rows if row.is_root), None)
+    if root is None:
+        raise ValueError("The story has no root node")
+
+    order = [] # rows in visit order
+    index_of = {} # row id -> position in `order`
+    stack = [root.id]
+    while stack: # explicit stack, like StoryGenerator._flatten_story_tree
+        row_id = stack.pop()
+        if row_id in index_of or row_id not in by_id:
+            continue # a dangling or repeated link, the row was already written or never existed
+        index_of[row_id] = len(order)
+        order.append(by_id[row_id])
+        for option in reversed(by_id[row_id].options or []):
+            stack.append(option.get("node_id"))
+
+    nodes = []
+    for row in order:
+        options = [(option["text"], index_of[option["node_id"]]) for option in row.options or [] if option.get("node_id") in index_of]
+        nodes.append((row.content, row.is_ending, row.is_winning, options))
+    return pack_story(nodes, compression), {row_id: index + ROOT_NODE_ID for row_id, index in index_of.items()}
@@ -0,0 +1,152 @@
+import logging
+import time
+from collections import Counter as TallyCounter, deque
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.config import settings
+from core.generation_cache import normalize_theme
+from core.job_queue import utcnow
+from core.metrics import story_pool_stock, story_pool_lookups, story_pool_generated
+from db.async_database import AsyncSessionLocal
+from models.job import StoryJob
+from models.story import Story
+
+"""
+A warm pool of finished, unassigned stories for the most requested themes, so a popular request is answered with a completed job right away instead of a generation.
+
+    popularity:  story_jobs.theme over the last STORY_POOL_WINDOW_HOURS ──► the STORY_POOL_THEMES most requested themes
+    refill:      while the service is quiet, generate stories for those themes until each has STORY_POOL_SIZE in stock
+    claim:       POST /stories/create with a stocked theme takes one story (compare-and-set on stories.pool_theme) and hands it to the caller's session
+
+* A pooled story is a normal Story row with session_id NULL and pool_theme set to the normalized theme; claiming it sets the session and clears pool_theme.
+* Refills only run off-peak (fewer than STORY_POOL_BUSY_JOBS jobs pending or processing, across all processes) and within STORY_POOL_MAX_PER_HOUR generations, so the pool never competes with real requests or burns the LLM budget.
+* Stock levels, hit rate and refill rate are in snapshot() (GET /api/stories/pool/stats) and on /metrics.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class StoryPool:
+    def __init__(self, stock_per_theme: int, max_themes: int, min_requests: int, window_hours: float, max_per_hour: int, busy_jobs: int):
+        self.stock_per_theme = stock_per_theme
+        self.max_themes = max_themes
+        self.min_requests = min_requests
+        self.window_hours = window_hours
+        self.max_per_hour = max_per_hour
+        self.busy_jobs = busy_jobs
+        self.stats = {"hits": 0, "misses": 0, "generated": 0, "failed": 0}
+        self.stock = {} # normalized theme -> stories in stock, as of the last refill round (and the claims since)
+        self.hot_themes = [] # (theme as users write it, requests in the window), most requested first
+        self._generated_at = deque() # monotonic times of the pool generations in the last hour, for the budget
+
+    @property
+    def enabled(self) -> bool:
+        return settings.STORY_POOL_ENABLED and self.stock_per_theme > 0
+
+    # Take a stocked story for `theme` and give it to `session_id`. The caller commits (together with the job it creates). Returns the story id, or None when the theme has no stock.
+    async def claim(self, db: AsyncSession, theme: str, session_id: str) -> Optional[int]:
+        key = normalize_theme(theme)
+        result = await db.execute(select(Story.id).where(Story.pool_theme == key).order_by(Story.id).limit(3))
+        for story_id in result.scalars().all():
+            # compare-and-set: only one request can take a story out of the pool, a loser tries the next candidate
+            claimed = await db.execute(
+                update(Story).where(Story.id == story_id, Story.pool_theme == key)
+                .values(pool_theme=None, session_id=session_id)
+                .execution_options(synchronize_session=False))
+            if claimed.rowcount == 1:
+                self.stats["hits"] += 1
+                story_pool_lookups.inc(result="hit")
+                if self.stock.get(key):
+                    self.stock[key] -= 1
+                    story_pool_stock.set(self.stock[key], theme=key)
+                return story_id
+        self.stats["misses"] += 1
+        story_pool_lookups.inc(result="miss")
+        return None
+
+    async def find_hot_themes(self, db: AsyncSession) -> list:
+        since = utcnow() - timedelta(hours=self.window_hours)
+        result = await db.execute(
+            select(StoryJob.theme, func.count()).where(StoryJob.created_at >= since, StoryJob.batch_id.is_(None)) # seeded batches say nothing about what players ask for
+            .group_by(StoryJob.theme).order_by(func.count().desc()).limit(self.max_themes * 10))
+
+        requests = TallyCounter()
+        spellings = {} # normalized theme -> the most used way of writing it, which is what we generate with
+        for theme, count in result.all():
+            key = normalize_theme(theme or "")
+            if not key:
+                continue
+            requests[key] += count
+            if key not in spellings: # rows come most requested first
+                spellings[key] = theme
+        return [(spellings[key], count) for key, count in requests.most_common(self.max_themes) if count >= self.min_requests]
+
+    async def stock_levels(self, db: AsyncSession) -> dict:
+        result = await db.execute(select(Story.pool_theme, func.count()).where(Story.pool_theme.is_not(None)).group_by(Story.pool_theme))
+        return dict(result.all())
+
+    async def is_off_peak(self, db: AsyncSession) -> bool:
+        result = await db.execute(select(func.count()).where(StoryJob.status.in_(("pending", "processing"))))
+        return result.scalar() < self.busy_jobs
+
+    def budget_left(self) -> int:
+        hour_ago = time.monotonic() - 3600
+        while self._generated_at and self._generated_at[0] < hour_ago:
+            self._generated_at.popleft()
+        return self.max_per_hour - len(self._generated_at)
+
+    # One refill round. `generate(theme)` creates an unassigned story with pool_theme set and returns its id. Returns the number of stories generated.
+    async def refill(self, generate) -> int:
+        async with AsyncSessionLocal() as db:
+            self.hot_themes = await self.find_hot_themes(db)
+            self.stock = await self.stock_levels(db)
+        for key, count in self.stock.items():
+            story_pool_stock.set(count, theme=key)
+
+        generated = 0
+        for theme, _ in self.hot_themes: # most requested first, so a small budget goes to the themes that matter most
+            key = normalize_theme(theme)
+            while self.stock.get(key, 0) < self.stock_per_theme:
+                if self.budget_left() <= 0:
+                    return generated
+                async with AsyncSessionLocal() as db:
+                    if not await self.is_off_peak(db): # checked before every generation, real requests may have arrived meanwhile
+                        return generated
+                self._generated_at.append(time.monotonic())
+                try:
+                    await generate(theme)
+                except Exception:
+                    self.stats["failed"] += 1
+                    logger.exception("Pre-generating a story for %r failed", theme)
+                    break # try the other themes, this one again next round
+                generated += 1
+                self.stats["generated"] += 1
+                story_pool_generated.inc()
+                self.stock[key] = self.stock.get(key, 0) + 1
+                story_pool_stock.set(self.stock[key], theme=key)
+        return generated
+
+    def snapshot(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else None,
+            "generated_last_hour": self.max_per_hour - self.budget_left(),
+            "budget_per_hour": self.max_per_hour,
+            "stock": self.stock,
+            "hot_themes": [{"theme": theme, "requests": count} for theme, count in self.hot_themes],
+        }
+
+
+story_pool = StoryPool(
+    stock_per_theme=settings.STORY_POOL_SIZE,
+    max_themes=settings.STORY_POOL_THEMES,
+    min_requests=settings.STORY_POOL_MIN_REQUESTS,
+    window_hours=settings.STORY_POOL_WINDOW_HOURS,
+    max_per_hour=settings.STORY_POOL_MAX_PER_HOUR,
+    busy_jobs=settings.STORY_POOL_BUSY_JOBS,
+)
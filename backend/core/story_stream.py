@@ -0,0 +1,160 @@
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.story import Story, StoryNode
+from core.models import StoryNodeLLM
+from core.notifications import notification_bus, story_channel
+
+"""
+Saves a story while its JSON is still being streamed from the LLM.
+
+IncrementalJSONParser reports (path, value) pairs, and this writer turns them into rows:
+* ("title",)                                   -> the Story row is created
+* (<node path>, "content" / "isEnding" / ...)  -> once content, isEnding and isWinningEnding are known the StoryNode row is created, before its children are even generated
+* (<node path>, "options", i, "text")          -> the option is linked into the parent's options as soon as the child node row exists
+
+Node paths look like ("rootNode",) or ("rootNode", "options", 1, "nextNode", "options", 0, "nextNode").
+Changes are committed once per streamed chunk (not once per node) and only then published on the notification bus, so an SSE client never hears about a row it can't read back yet.
+"""
+
+HEADER_FIELDS = ("content", "isEnding", "isWinningEnding")
+
+
+def is_node_path(path: tuple) -> bool:
+    if not path or path[0] != "rootNode" or (len(path) - 1) % 3 != 0:
+        return False
+    return all(path[i] == "options" and isinstance(path[i + 1], int) and path[i + 2] == "nextNode"
+               for i in range(1, len(path), 3))
+
+
+def node_payload(node: StoryNode) -> dict:
+    # same field names as CompleteStoryNodeResponse, so the client can render streamed nodes and /complete nodes the same way
+    return {
+        "id": node.id,
+        "content": node.content,
+        "is_ending": node.is_ending,
+        "is_winning_ending": node.is_winning,
+        "options": node.options or [],
+    }
+
+
+class StreamingStoryWriter:
+    def __init__(self, db: AsyncSession, session_id: str, on_story_created=None):
+        self.db = db
+        self.session_id = session_id
+        self.on_story_created = on_story_created # called with the Story row right after it is created, e.g. to put story_id on the job
+        self.story = None
+        self.story_id = None # kept separately, the Story object is expired (unreadable) after a rollback
+        self._nodes = {} # node path -> {"fields": {...}, "row": StoryNode or None, "options": {index: {"text", "node_id"}}}
+        self._option_texts = {} # (parent node path, option index) -> option text
+        self._pending_messages = [] # published after the next commit
+        self._dirty = False
+
+    def _node(self, path: tuple) -> dict:
+        if path not in self._nodes:
+            self._nodes[path] = {"fields": {}, "row": None, "options": {}}
+        return self._nodes[path]
+
+    async def handle(self, path: tuple, value):
+        if path == ("title",) and self.story is None:
+            self.story = Story(title=value, session_id=self.session_id)
+            self.db.add(self.story)
+            await self.db.flush() # we need story.id for the nodes and for the client
+            self.story_id = self.story.id
+            if self.on_story_created:
+                self.on_story_created(self.story)
+            self._dirty = True
+            self._pending_messages.append({"type": "story", "id": self.story_id, "title": self.story.title})
+            for node_path in list(self._nodes): # nodes that were complete before the title arrived
+                await self._try_insert(node_path)
+            return
+
+        if len(path) >= 2 and path[-1] in HEADER_FIELDS and is_node_path(path[:-1]):
+            self._node(path[:-1])["fields"][path[-1]] = value
+            await self._try_insert(path[:-1])
+        elif len(path) >= 3 and path[-1] == "text" and path[-3] == "options" and is_node_path(path[:-3]):
+            self._option_texts[(path[:-3], path[-2])] = value
+            await self._try_link(path[:-3] + ("options", path[-2], "nextNode"))
+        elif is_node_path(path):
+            # the node object closed, every field it will ever have is now known
+            node = self._node(path)
+            for field in HEADER_FIELDS:
+                if field in value:
+                    node["fields"][field] = value[field]
+            await self._try_insert(path, closed=True)
+
+    async def _try_insert(self, path: tuple, closed: bool = False):
+        node = self._node(path)
+        if node["row"] is not None or self.story is None:
+            return
+        if not closed and not all(field in node["fields"] for field in HEADER_FIELDS):
+            return
+        node_data = StoryNodeLLM.model_validate({**node["fields"], "options": None}) # raises if the LLM left out a required field
+
+        row = StoryNode(story_id=self.story_id,
+                        content=node_data.content,
+                        is_root=path == ("rootNode",),
+                        is_ending=node_data.isEnding,
+                        is_winning=node_data.isWinningEnding,
+                        options=[])
+        self.db.add(row)
+        await self.db.flush()
+        node["row"] = row
+        self._dirty = True
+        self._pending_messages.append({"type": "node", "node": node_payload(row), "is_root": row.is_root})
+
+        await self._try_link(path) # link this node to its parent
+        for child_path in [p for p in self._nodes if len(p) == len(path) + 3 and p[:len(path)] == path]:
+            await self._try_link(child_path) # and its already saved children to it
+
+    async def _try_link(self, child_path: tuple):
+        if len(child_path) < 4:
+            return # the root has no parent
+        parent_path, index = child_path[:-3], child_path[-2]
+        parent = self._nodes.get(parent_path)
+        child = self._nodes.get(child_path)
+        text = self._option_texts.get((parent_path, index))
+        if parent is None or child is None or parent["row"] is None or child["row"] is None or text is None:
+            return
+        if index in parent["options"]:
+            return
+
+        parent["options"][index] = {"text": text, "node_id": child["row"].id}
+        parent_row = parent["row"]
+        parent_row.options = [parent["options"][i] for i in sorted(parent["options"])] # assign a new list so SQLAlchemy notices the JSON column changed
+        self._dirty = True
+        self._pending_messages.append({"type": "options", "node_id": parent_row.id, "options": parent_row.options})
+
+    # commit what the last chunk produced and tell the subscribers about it
+    async def commit(self):
+        if not self._dirty:
+            return
+        await self.db.commit()
+        self._dirty = False
+        if self.story_id is not None:
+            for message in self._pending_messages:
+                notification_bus.publish(story_channel(self.story_id), message)
+        self._pending_messages = []
+
+    async def finish(self):
+        if self.story is None or self._nodes.get(("rootNode",), {}).get("row") is None:
+            raise ValueError("The story stream ended without a title or a root node")
+        missing = [path for path, node in self._nodes.items() if node["row"] is None]
+        if missing:
+            raise ValueError(f"The story stream ended with incomplete nodes: {missing[0]}")
+        self.story.node_count = len(self._nodes)
+        self.story.ending_count = sum(1 for node in self._nodes.values() if node["row"].is_ending)
+        self._dirty = True
+        await self.commit()
+        notification_bus.publish(story_channel(self.story_id), {"type": "complete", "id": self.story_id})
+
+    # generation failed half way: remove the partial story so nobody can open it, and let the stream subscribers know
+    async def abort(self, error: str):
+        await self.db.rollback()
+        story_id = self.story_id
+        if story_id is None:
+            return
+        await self.db.execute(delete(StoryNode).where(StoryNode.story_id == story_id))
+        await self.db.execute(delete(Story).where(Story.id == story_id))
+        await self.db.commit()
+        notification_bus.publish(story_channel(story_id), {"type": "error", "id": story_id, "error": error})
@@ -0,0 +1,166 @@
+import json
+import re
+from typing import Any, List, Tuple
+
+"""
+An incremental JSON parser for LLM output that arrives token by token.
+
+json.loads() (and PydanticOutputParser) need the whole document, so the user would wait for the full completion before seeing anything. This parser is fed the text chunk by chunk and reports every value (string, number, object, array ...) the moment its closing character arrives, together with the path to it:
+
+    parser = IncrementalJSONParser()
+    parser.feed('{"title": "The Ca')          -> []
+    parser.feed('ve", "rootNode": {"content"') -> [(("title",), "The Cave")]
+    ...
+    parser.feed('}}')                          -> [..., (("rootNode",), {...}), ((), {...})]
+
+A path is a tuple of object keys and array indexes, e.g. ("rootNode", "options", 0, "nextNode", "content").
+Containers are reported when they close, but they are attached to their parent as soon as they open, so `value` always holds everything parsed so far.
+"""
+
+NUMBER_PATTERN = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?")
+NUMBER_PREFIX_PATTERN = re.compile(r"[-+0-9.eE]+")
+LITERALS = {"true": True, "false": False, "null": None}
+PUNCTUATION = "{}[]:,"
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._frames = [] # one frame per open object/array: {"container", "path", "key", "state"}
+        self.started = False
+        self.done = False
+        self.value = None # the top-level value, filled in as soon as its first character is seen
+
+    def feed(self, chunk: str) -> List[Tuple[tuple, Any]]:
+        self._buffer += chunk
+        completed = []
+        while not self.done:
+            token = self._next_token()
+            if token is None: # need more text to finish the current token
+                break
+            self._handle(token, completed)
+
+        self._buffer = self._buffer[self._position:] # forget what has been consumed, keep a partial token for the next chunk
+        self._position = 0
+        return completed
+
+    def _next_token(self):
+        if not self.started:
+            # LLMs like to wrap JSON in ```json fences or a sentence, skip everything before the document starts
+            starts = [index for index in (self._buffer.find("{", self._position), self._buffer.find("[", self._position)) if index != -1]
+            if not starts:
+                self._position = len(self._buffer)
+                return None
+            self._position = min(starts)
+
+        buffer = self._buffer
+        position = self._position
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        self._position = position
+        if position >= len(buffer):
+            return None
+
+        char = buffer[position]
+        if char in PUNCTUATION:
+            self._position = position + 1
+            return char
+
+        if char == '"':
+            end = position + 1
+            while True:
+                end = buffer.find('"', end)
+                if end == -1:
+                    return None # string is still being streamed
+                backslashes = 0
+                while buffer[end - 1 - backslashes] == "\\":
+                    backslashes += 1
+                if backslashes % 2 == 0: # an even number of backslashes means the quote itself is not escaped
+                    break
+                end += 1
+            self._position = end + 1
+            return ("value", json.loads(buffer[position:end + 1]))
+
+        for literal, literal_value in LITERALS.items():
+            if buffer.startswith(literal, position):
+                self._position = position + len(literal)
+                return ("value", literal_value)
+            if literal.startswith(buffer[position:]):
+                return None # e.g. "tr" at the end of the chunk
+
+        if NUMBER_PREFIX_PATTERN.fullmatch(buffer, position):
+            return None # the chunk ends inside a number ("-", "12", "1.5e"), more digits may follow
+        match = NUMBER_PATTERN.match(buffer, position)
+        if match:
+            self._position = match.end()
+            number = match.group()
+            return ("value", float(number) if any(c in number for c in ".eE") else int(number))
+
+        raise ValueError(f"Unexpected character {char!r} in JSON stream at: {buffer[position:position + 30]!r}")
+
+    def _current_path(self) -> tuple:
+        frame = self._frames[-1]
+        key = frame["key"] if isinstance(frame["container"], dict) else len(frame["container"])
+        return frame["path"] + (key,)
+
+    def _handle(self, token, completed):
+        if not self._frames:
+            if self.started or token not in ("{", "["):
+                raise ValueError(f"Unexpected token {token!r} outside of the JSON document")
+            self.started = True
+            self.value = {} if token == "{" else []
+            self._frames.append({"container": self.value, "path": (), "key": None, "state": "key" if token == "{" else "value"})
+            return
+
+        frame = self._frames[-1]
+        state = frame["state"]
+        is_object = isinstance(frame["container"], dict)
+
+        if token in ("}", "]"):
+            if token != ("}" if is_object else "]") or state == "colon" or (is_object and state == "value"):
+                raise ValueError(f"Unexpected {token!r} in JSON stream")
+            self._frames.pop()
+            completed.append((frame["path"], frame["container"]))
+            if not self._frames:
+                self.done = True
+            return
+
+        if token == ",":
+            if state != "comma":
+                raise ValueError("Unexpected ',' in JSON stream")
+            frame["state"] = "key" if is_object else "value"
+            return
+
+        if is_object and state == "key":
+            if not (isinstance(token, tuple) and isinstance(token[1], str)):
+                raise ValueError(f"Expected an object key, got {token!r}")
+            frame["key"] = token[1]
+            frame["state"] = "colon"
+            return
+
+        if token == ":":
+            if state != "colon":
+                raise ValueError("Unexpected ':' in JSON stream")
+            frame["state"] = "value"
+            return
+
+        if state != "value":
+            raise ValueError(f"Unexpected token {token!r} in JSON stream")
+
+        path = self._current_path()
+        if token in ("{", "["):
+            value = {} if token == "{" else []
+        else:
+            value = token[1]
+
+        if is_object:
+            frame["container"][frame["key"]] = value
+        else:
+            frame["container"].append(value)
+        frame["state"] = "comma"
+
+        if token in ("{", "["):
+            self._frames.append({"container": value, "path": path, "key": None, "state": "key" if token == "{" else "value"})
+        else:
+            completed.append((path, value))
@@ -0,0 +1,56 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession # asyncio versions of create_engine / sessionmaker / Session
+
+from core.config import settings
+from core.metrics import instrument_engine
+from db.engine_profiles import engine_options, configure_engine
+
+# The sync engine in db/database.py makes every request hold a worker thread while it waits for the database. The async engine talks to the database through an async driver, so waiting on a query only suspends the coroutine and the event loop keeps serving other requests.
+
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+# DATABASE_URL is written for the sync drivers, e.g. sqlite:///./stories.db or postgresql+psycopg2://..., so replace the scheme with the matching async driver: sqlite+aiosqlite:///./stories.db
+def to_async_url(database_url: str) -> str:
+    scheme, separator, rest = database_url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        return database_url # unknown dialect, assume the URL already names an async driver
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+def create_profiled_engine(database_url: str):
+    engine = create_async_engine(database_url, **engine_options(database_url)) # same DB_ENGINE_PROFILE as the sync engine
+    configure_engine(engine.sync_engine) # SQLAlchemy events live on the sync engine the async one wraps
+    instrument_engine(engine.sync_engine)
+    return engine
+
+async_engine = create_profiled_engine(settings.ASYNC_DATABASE_URL or to_async_url(settings.DATABASE_URL))
+
+# expire_on_commit=False: after commit() the ORM objects keep their loaded values. With AsyncSession an expired attribute can't be lazily reloaded (that would be hidden blocking IO), so we refresh explicitly where we need server-generated values.
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db: # the async context manager closes the session when the request finishes, like the finally block in get_db()
+        yield db
+
+
+# Read-only sessions for the hot read paths (job status polls, /stories/{id}/complete). With DATABASE_READ_URL they go to a replica with its own pool, so polling doesn't take connections from the jobs writing stories; without it they use the primary engine.
+# A replica lags behind the primary, so a read that finds nothing (a job created a moment ago) should look again with AsyncSessionLocal; see READ_REPLICA.
+class ReadOnlySession(Session):
+    pass
+
+@event.listens_for(ReadOnlySession, "before_flush")
+def _refuse_writes(session, flush_context, instances):
+    raise RuntimeError("ReadSessionLocal sessions are read-only, write with AsyncSessionLocal")
+
+READ_REPLICA = bool(settings.DATABASE_READ_URL)
+read_engine = create_profiled_engine(to_async_url(settings.DATABASE_READ_URL)) if READ_REPLICA else async_engine
+ReadSessionLocal = async_sessionmaker(bind=read_engine, class_=AsyncSession, sync_session_class=ReadOnlySession, autoflush=False, expire_on_commit=False)
+
+async def get_read_db():
+    async with ReadSessionLocal() as db:
+        yield db
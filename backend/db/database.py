@@ -1,11 +1,16 @@
-from sqlalchemy import create_engine #wrap database connections and provides a common interface for different database backends
+from sqlalchemy import create_engine, inspect, text #wrap database connections and provides a common interface for different database backends
 from sqlalchemy.orm import sessionmaker # create a new SQLAlchemy session, which is used to interact with the database. It provides methods for querying and manipulating the database, and it manages the connection to the database.
 from sqlalchemy.ext.declarative import declarative_base # base class for our database models.
 
 from core.config import settings
+from core.metrics import instrument_engine
+from db.engine_profiles import engine_options, configure_engine
 
 # Purpose: Establish the connection to database server. The engine manages a pool of connections that can be reused. All database operations go through this engine. Example: Code -> Engine (creates connection) -> Database server.
-engine = create_engine(settings.DATABASE_URL)
+# Pool sizes, connection checks and (on SQLite) WAL mode come from the DB_ENGINE_PROFILE settings, see db/engine_profiles.py
+engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+configure_engine(engine)
+instrument_engine(engine) # count the statements of each story job for /metrics
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine) # create a new SQLAlchemy session factory. The autocommit and autoflush parameters are set to False to ensure that changes to the database are not automatically committed or flushed until explicitly done so in the code. The bind parameter is set to the engine we created earlier, which allows the session to connect to the database.
 
@@ -49,4 +54,24 @@ class Story(Base):
 # CREATE TABLE stories (...)
 """
 def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+# create_all() only creates missing TABLES. When a model gains a new column, an existing database keeps the old table, so add the missing (nullable) columns with ALTER TABLE (filling the existing rows when the column has info={"backfill": ...}), then the indexes the table doesn't have yet (index=True on a new column, or a new composite index). Works the same on SQLite and Postgres.
+def add_missing_columns():
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                backfill = column.info.get("backfill") # a column can ask for a value on the rows that existed before it, e.g. models.story.Story.last_opened_at
+                if backfill is not None:
+                    connection.execute(table.update().values({column.name: backfill()}))
+            for index in table.indexes:
+                index.create(bind=connection, checkfirst=True)
\ No newline at end of file
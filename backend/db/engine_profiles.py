@@ -0,0 +1,83 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from core.config import settings
+
+"""
+Engine profiles: how db/database.py and db/async_database.py create their engines, picked with DB_ENGINE_PROFILE.
+
+    profile   pool (size + overflow)     pre-ping  recycle  driver statement cache   on every new connection
+    default   SQLAlchemy's defaults, as the engines were created before profiles existed
+    sqlite    5 + 10                     no        never    256 (sqlite3)            PRAGMA journal_mode=WAL, synchronous=NORMAL, busy_timeout
+    server    N + N, N = concurrency + 4 yes       30 min   512 (asyncpg)            -
+
+* "auto" (the default) is "sqlite" for SQLite URLs and "server" for everything else.
+* sqlite: with the default rollback journal a writer locks the whole file, so the background jobs saving stories and the status polls wait for each other. In WAL mode readers read the last committed state while one writer appends; synchronous=NORMAL syncs at checkpoints instead of on every commit (a power cut can lose the last transactions, never corrupt the file), and busy_timeout makes a second writer wait instead of failing with "database is locked".
+* server: the pool is sized for this process's concurrency (generations or worker slots, plus a few requests) instead of SQLAlchemy's 5 + 10; pre-ping and recycle replace connections a database restart or an idle timeout on a proxy closed.
+* DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_PRE_PING, DB_POOL_RECYCLE_SECONDS and DB_STATEMENT_CACHE_SIZE override the profile's values one by one.
+"""
+
+PROFILES = {
+    "default": {},
+    "sqlite": {"pool_size": 5, "max_overflow": 10, "pool_pre_ping": False, "pool_recycle": -1, "statement_cache_size": 256, "sqlite_pragmas": True},
+    "server": {"pool_size": None, "max_overflow": None, "pool_pre_ping": True, "pool_recycle": 1800, "statement_cache_size": 512}, # None: sized from the concurrency settings
+}
+
+# connect() argument of each driver that sets its per-connection prepared statement cache
+STATEMENT_CACHE_ARGUMENTS = {
+    "pysqlite": "cached_statements",
+    "aiosqlite": "cached_statements", # passed through to sqlite3.connect
+    "asyncpg": "prepared_statement_cache_size",
+}
+
+
+def resolve_profile(database_url: str, profile: str = None) -> str:
+    profile = profile or settings.DB_ENGINE_PROFILE
+    if profile == "auto":
+        return "sqlite" if make_url(database_url).get_backend_name() == "sqlite" else "server"
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE: {profile}")
+    return profile
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and (url.database in (None, "", ":memory:") or url.query.get("mode") == "memory")
+
+
+# Keyword arguments for create_engine() / create_async_engine() of `database_url` under the profile (DB_ENGINE_PROFILE unless given)
+def engine_options(database_url: str, profile: str = None) -> dict:
+    url = make_url(database_url)
+    values = dict(PROFILES[resolve_profile(database_url, profile)])
+    concurrency = max(settings.GENERATION_MAX_CONCURRENCY, settings.WORKER_CONCURRENCY) + 4 # a connection per running generation plus a few for requests
+    for name, setting in (("pool_size", settings.DB_POOL_SIZE), ("max_overflow", settings.DB_MAX_OVERFLOW),
+                          ("pool_pre_ping", settings.DB_POOL_PRE_PING), ("pool_recycle", settings.DB_POOL_RECYCLE_SECONDS),
+                          ("statement_cache_size", settings.DB_STATEMENT_CACHE_SIZE)):
+        if setting is not None:
+            values[name] = setting
+        elif name in values and values[name] is None:
+            values[name] = concurrency
+
+    options = {}
+    if not _is_memory_sqlite(url): # an in-memory database lives in one connection (StaticPool / SingletonThreadPool), which takes no pool sizes
+        for name in ("pool_size", "max_overflow", "pool_pre_ping", "pool_recycle"):
+            if name in values:
+                options[name] = values[name]
+    argument = STATEMENT_CACHE_ARGUMENTS.get(url.get_driver_name())
+    if "statement_cache_size" in values and argument:
+        options["connect_args"] = {argument: values["statement_cache_size"]}
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL") # stored in the database file, the other pragmas are per connection
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.close()
+
+
+# Per-connection setup of the profile; `engine` is a sync Engine (for an AsyncEngine pass its .sync_engine)
+def configure_engine(engine, profile: str = None):
+    database_url = engine.url.render_as_string(hide_password=False)
+    if PROFILES[resolve_profile(database_url, profile)].get("sqlite_pragmas") and engine.url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _set_sqlite_pragmas)
@@ -1,11 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from core.config import settings
-from routers import story, job
+from routers import story, job, metrics
 from db.database import create_tables
+from core.notifications import notification_bus
+from core.scheduler import generation_scheduler
+from core.story_generator import StoryGenerator
+from core.metrics import RequestTimingMiddleware
+from core.retention import retention_loop
+from core.playthrough_events import event_buffer
 
-create_tables() # create tables in the database when the application starts. This ensures that the necessary tables are available for storing and retrieving data related to story generation jobs. By calling this function at the start of the application, we can ensure that the database schema is set up correctly before any operations are performed on it.
+# code before `yield` runs once when the server starts, code after it when the server shuts down
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create the missing tables (and columns, indexes) before the first request. This used to run when main.py was imported, so every import paid for a database round trip; with SCHEMA_SETUP=migrate it is left to `python migrate.py`, run once per deploy.
+    if settings.SCHEMA_SETUP == "lifespan":
+        await asyncio.to_thread(create_tables)
+    await notification_bus.start() # connect the job/story notification backend (a no-op for the in-process one)
+    warm_up_task = StoryGenerator.start_warm_up() # compile the prompts and create the LLM clients, by default in the background so startup doesn't wait for langchain
+    recovery_task = None
+    if settings.JOB_EXECUTION_MODE == "inprocess": # in worker mode the worker processes recover abandoned jobs themselves
+        recovery_task = asyncio.create_task(story.job_recovery_loop())
+    pool_task = None
+    if settings.STORY_POOL_ENABLED: # pre-generate stories for the popular themes while the service is quiet
+        pool_task = asyncio.create_task(story.story_pool_loop())
+    retention_task = asyncio.create_task(retention_loop()) # records which stories are opened and, with RETENTION_ENABLED, deletes old jobs and stories
+    event_buffer.start() # writes the buffered playthrough events every STORY_EVENTS_FLUSH_SECONDS (or sooner when STORY_EVENTS_FLUSH_SIZE are waiting)
+    yield
+    await event_buffer.stop() # write what is still buffered
+    retention_task.cancel()
+    if warm_up_task:
+        warm_up_task.cancel()
+    if recovery_task:
+        recovery_task.cancel()
+    if pool_task:
+        pool_task.cancel()
+    await story.stop_batches()
+    await generation_scheduler.shutdown() # cancel the generations still running in this process
+    await notification_bus.stop()
 
 # API for backend
 app = FastAPI(
@@ -14,6 +49,7 @@ app = FastAPI(
     version="0.1.0", # version of the API
     docs_url="/docs", # FastAPI automatically generates interactive API documentation at this URL. We can view it on the web broweser
     redoc_url="/redoc", # FastAPI also provides an alternative documentation interface called ReDoc, which is available at this URL. ReDoc offers a different layout and style for the API documentation, and some developers prefer it over the default Swagger UI provided at /docs. By specifying both docs_url and redoc_url, we can provide users with the option to choose their preferred documentation interface when accessing the API documentation.
+    lifespan=lifespan, # start/stop the background services together with the server
 )
 
 """
@@ -29,8 +65,11 @@ app.add_middleware(
     allow_headers=["*"], # allow all headers which are additional information you can send with the request, e.g., Content-Type, Authorization etc.
 )
 
+app.add_middleware(RequestTimingMiddleware) # request latency histogram and in-flight gauge for /metrics
+
 app.include_router(story.router, prefix=settings.API_PREFIX)
 app.include_router(job.router, prefix=settings.API_PREFIX)
+app.include_router(metrics.router)
 
 if __name__ == "__main__":
     import uvicorn # web server for running FastAPI applications
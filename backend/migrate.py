@@ -0,0 +1,25 @@
+"""
+Schema setup as an explicit deploy step. With SCHEMA_SETUP=migrate the API and the workers no longer touch the schema when they start, so run this once per deploy, before the new processes:
+
+    python migrate.py
+
+It creates the missing tables, then adds the columns and indexes the models have gained since the database was created (db/database.py create_tables). Running it again changes nothing.
+"""
+import logging
+import time
+
+from db.database import create_tables, engine
+import models.job, models.story, models.playthrough # register the tables on Base.metadata
+
+logger = logging.getLogger("migrate")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    started = time.perf_counter()
+    create_tables()
+    logger.info("Schema of %s is up to date (%.2fs)", engine.url.render_as_string(hide_password=True), time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 # represent the intent to create the story
 
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
@@ -22,13 +22,26 @@ If job is done, backend can send story.
 # table inherited from Base
 class StoryJob(Base):
     __tablename__ = "story_jobs"
+    __table_args__ = (
+        Index("ix_story_jobs_session_story", "session_id", "story_id"), # GET /stories: the stories a session got from the generation cache, read from the index alone
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     job_id = Column(String, index=True, unique=True)
     session_id = Column(String, index=True)
     theme = Column(String)
+    batch_id = Column(String, nullable=True, index=True) # set for jobs created together by POST /stories/batch, GET /jobs/batch/{batch_id} reports on them
     status = Column(String)
     story_id = Column(Integer, nullable=True) # can be null or empty
     error = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    completed_at = Column(DateTime(timezone=True), nullable=True) # can be null or empty since the job is never completed or failed
\ No newline at end of file
+    completed_at = Column(DateTime(timezone=True), nullable=True) # can be null or empty since the job is never completed or failed
+
+    # The table doubles as a durable work queue (see core/job_queue.py): a worker claims a pending job by taking a lease, keeps extending it with heartbeats while it generates, and a job whose lease ran out (the worker crashed) is put back to "pending" for another attempt.
+    attempts = Column(Integer, default=0) # how many times a worker has started this job
+    lease_owner = Column(String, nullable=True) # id of the worker currently generating the story
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True) # the job counts as abandoned after this time unless the lease is renewed
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True) # last time the worker renewed its lease
+    next_attempt_at = Column(DateTime(timezone=True), nullable=True) # retries wait until this time (exponential backoff)
+    prompt_tokens = Column(Integer, nullable=True) # LLM input tokens spent on this job, over all attempts (0 when the story came from a cache)
+    completion_tokens = Column(Integer, nullable=True) # LLM output tokens spent on this job, over all attempts
@@ -0,0 +1,35 @@
+# what players do in StoryGame, written in batches by core/playthrough_events.py
+
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Index
+from sqlalchemy.sql import func
+
+from db.database import Base
+
+# One row per event a player's browser sent to POST /stories/{id}/events (with STORY_EVENTS_STORE_RAW=True), for analyses the aggregates below don't answer.
+# No foreign keys: events are accepted without looking the story up, and the retention sweeper removes them together with their story.
+class PlaythroughEvent(Base):
+    __tablename__ = "playthrough_events"
+    __table_args__ = (
+        Index("ix_playthrough_events_story_node", "story_id", "node_id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    story_id = Column(Integer, nullable=False)
+    node_id = Column(Integer, nullable=False) # the node shown ("visit"), the node an option was picked on ("choice") or the ending reached ("finish")
+    kind = Column(String, nullable=False) # "visit", "choice" or "finish"
+    option_index = Column(Integer, nullable=True) # which option of the node was picked, "choice" only
+    won = Column(Boolean, nullable=True) # whether the ending is a winning one, "finish" only
+    playthrough_id = Column(String, nullable=True) # random id the client gives one play of a story, to tell playthroughs apart
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True) # when the batch was written, not when the player clicked
+
+# Running totals per node, updated by every flush with one upsert per touched node, so GET /stories/{id}/stats reads one row per node instead of scanning events.
+# How often each option was picked is the visit count of the node it leads to (every node has one parent).
+class StoryNodeStats(Base):
+    __tablename__ = "story_node_stats"
+
+    story_id = Column(Integer, primary_key=True)
+    node_id = Column(Integer, primary_key=True)
+    visits = Column(Integer, nullable=False, default=0) # times the node was shown
+    choices = Column(Integer, nullable=False, default=0) # times a player picked one of its options (visits - choices left the story here)
+    finishes = Column(Integer, nullable=False, default=0) # playthroughs that went through the node and reached an ending
+    wins = Column(Integer, nullable=False, default=0) # ... and the ending was a winning one, wins / finishes is the node's win rate
@@ -2,22 +2,42 @@
 
 
 # SQL alchemy is an Object-Relational Mapping (ORM) library for Python that provides a high-level interface for working with databases. It allows developers to interact with databases using Python objects and classes, rather than writing raw SQL queries. This can make it easier to manage database interactions and improve code readability. In this code snippet, we are importing various components from SQLAlchemy that will be used to define our database models and interact with the database. These components include Column, Integer, String, DateTime, Boolean, ForeignKey, and JSON, which are used to define the structure of our database tables and the types of data they will store.
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON
+from datetime import datetime, timezone
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, JSON, LargeBinary, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 
 from db.database import Base
 
+# SQLite keeps the server default CURRENT_TIMESTAMP as text without fractions ("2026-01-02 03:04:05"), but SQLAlchemy binds datetimes with microseconds ("2026-01-02 03:04:05.000000"), and SQLite compares the two as text, so a stored time never equals itself.
+# Binding in the stored format keeps created_at comparisons exact, which the (created_at, id) keyset pagination of GET /stories relies on. Other databases keep the normal DateTime type.
+SQLITE_TIMESTAMP = sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d")
+
 # table inherited from Base
 class Story(Base):
     __tablename__ = "stories"
+    __table_args__ = (
+        # GET /stories lists a session's stories newest first and continues after the last (created_at, id) of the previous page, so a page is an index range scan. The stories the session got from the generation cache are a second, small query through ix_story_jobs_session_story, merged in by the endpoint.
+        # On Postgres the listed columns are included in the index, so the page is answered from the index alone.
+        Index("ix_stories_session_created_id", "session_id", "created_at", "id", postgresql_include=["title", "node_count", "ending_count"]),
+    )
 
     # primary_key: a unique value
     # index: can look up the index to find the row faster, which can improve query performance when searching for specific stories in the database. By indexing the id column, we can quickly retrieve a story based on its unique identifier, which is especially beneficial when dealing with large datasets.
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String, index=True)
     session_id = Column(String, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True).with_variant(SQLITE_TIMESTAMP, "sqlite"), server_default=func.now())
+    last_opened_at = Column(DateTime(timezone=True).with_variant(SQLITE_TIMESTAMP, "sqlite"), nullable=True, # last time a player loaded the story (written in batches by core/retention.py, so up to RETENTION_ACCESS_FLUSH_SECONDS late), null if never; stories unopened for RETENTION_STORY_DAYS are deleted
+                            info={"backfill": lambda: datetime.now(timezone.utc)}) # stories from before the column count as opened when it was added (db/database.py add_missing_columns), nobody knows when they were last read
+    node_count = Column(Integer, nullable=True) # number of nodes, set when the story is saved so listing stories doesn't touch the nodes (null for stories saved before the column existed)
+    ending_count = Column(Integer, nullable=True) # how many of them are endings
+    # A finished story never changes, so the /complete response is rendered to JSON once when generation finishes and kept here. Serving it is then a byte copy instead of loading and validating every node.
+    complete_payload = Column(LargeBinary, nullable=True) # serialized CompleteStoryResponse (UTF-8 JSON), null until the story is finished
+    complete_etag = Column(String, nullable=True) # hash of complete_payload, sent as the HTTP ETag
+    packed_tree = Column(LargeBinary, nullable=True) # the whole node tree in one blob when the story is stored packed (core/story_pack.py), null for stories stored as story_nodes rows
+    pool_theme = Column(String, nullable=True, index=True) # normalized theme while the story waits unassigned in the warm pool (core/story_pool.py), null once a session has it
     
     # 1-to-many relationship type.
     # referece to StoryNode model
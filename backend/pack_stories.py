@@ -0,0 +1,122 @@
+"""
+Backfill for packed story storage: moves stories saved as story_nodes rows into the one-blob layout of STORY_STORAGE=packed (core/story_pack.py).
+
+    python pack_stories.py --dry-run          # how many stories would be packed and how much smaller they get
+    python pack_stories.py                    # pack every finished story, 100 per transaction
+    python pack_stories.py --batch-size 500 --limit 10000 --compression zlib
+
+For each story the blob is written, the /complete response is rendered again (node ids become local to the story, so the stored payload and its ETag change), its playthrough events and node stats are moved to the new ids and its rows are deleted, all in the same transaction.
+Stories whose job is still pending or processing are skipped, they may still be growing. The script can be stopped and run again at any time, packed stories are never touched twice.
+
+An API process that is already running keeps serving the /complete responses it has cached in memory, which still carry the old row ids, and its event buffer may still hold events with them. Restart the API after the backfill (or run it before switching STORY_STORAGE) so clients don't mix both kinds of ids.
+"""
+import argparse
+import logging
+import time
+
+from sqlalchemy import select, delete, insert, update, func, case
+
+from core.config import settings
+from core.story_pack import pack_rows
+from db.database import SessionLocal, create_tables
+from models.job import StoryJob
+from models.playthrough import PlaythroughEvent, StoryNodeStats
+from models.story import Story, StoryNode
+from routers.story import store_complete_payload # the same rendering the API uses
+
+logger = logging.getLogger("pack_stories")
+
+
+def stories_to_pack(db, after_id: int, batch_size: int) -> list:
+    growing = select(StoryJob.story_id).where(StoryJob.story_id.is_not(None), StoryJob.status.in_(("pending", "processing")))
+    has_rows = select(StoryNode.id).where(StoryNode.story_id == Story.id).exists()
+    result = db.execute(
+        select(Story.id)
+        .where(Story.id > after_id, Story.packed_tree.is_(None), has_rows, Story.id.not_in(growing))
+        .order_by(Story.id)
+        .limit(batch_size))
+    return list(result.scalars())
+
+
+# Events and node stats refer to nodes by row id, switch them to the story's local ids (those of nodes the packed tree no longer has are deleted).
+# Node stats are deleted and inserted again rather than updated in place: an old row id can equal another node's new local id, and (story_id, node_id) is their primary key.
+def move_playthrough_data(db, story_id: int, local_ids: dict):
+    stats = db.execute(select(StoryNodeStats.node_id, StoryNodeStats.visits, StoryNodeStats.choices, StoryNodeStats.finishes, StoryNodeStats.wins)
+                       .where(StoryNodeStats.story_id == story_id))
+    moved = [{"story_id": story_id, "node_id": local_ids[row.node_id], "visits": row.visits, "choices": row.choices, "finishes": row.finishes, "wins": row.wins}
+             for row in stats if row.node_id in local_ids]
+    db.execute(delete(StoryNodeStats).where(StoryNodeStats.story_id == story_id))
+    if moved:
+        db.execute(insert(StoryNodeStats), moved)
+
+    db.execute(delete(PlaythroughEvent).where(PlaythroughEvent.story_id == story_id, PlaythroughEvent.node_id.not_in(list(local_ids))))
+    if local_ids:
+        db.execute(update(PlaythroughEvent).where(PlaythroughEvent.story_id == story_id)
+                   .values(node_id=case(local_ids, value=PlaythroughEvent.node_id)).execution_options(synchronize_session=False))
+
+
+# Pack one batch in one transaction. Returns (bytes in the rows' content and options, bytes of the blobs)
+def pack_batch(db, story_ids: list, compression: str, dry_run: bool) -> tuple:
+    rows_by_story = {story_id: [] for story_id in story_ids}
+    for row in db.execute(select(StoryNode).where(StoryNode.story_id.in_(story_ids))).scalars():
+        rows_by_story[row.story_id].append(row)
+
+    row_bytes = blob_bytes = 0
+    for story_id, rows in rows_by_story.items():
+        blob, local_ids = pack_rows(rows, compression)
+        row_bytes += sum(len(row.content or "") + len(str(row.options or "")) for row in rows)
+        blob_bytes += len(blob)
+        if dry_run:
+            continue
+        story = db.get(Story, story_id)
+        story.packed_tree = blob
+        if story.node_count is None: # saved before the counters existed
+            story.node_count = len(rows)
+            story.ending_count = sum(1 for row in rows if row.is_ending)
+        db.flush() # render_complete_story selects the blob from the story row
+        store_complete_payload(db, story_id)
+        move_playthrough_data(db, story_id, local_ids)
+
+    if dry_run:
+        db.rollback()
+    else:
+        db.execute(delete(StoryNode).where(StoryNode.story_id.in_(story_ids)))
+        db.commit()
+    return row_bytes, blob_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=100, help="stories packed per transaction")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many stories (0: all)")
+    parser.add_argument("--compression", default=settings.STORY_PACK_COMPRESSION, choices=("zstd", "zlib", "none"))
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be packed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    create_tables() # adds the packed_tree column to an older database
+    started = time.perf_counter()
+    packed = row_bytes = blob_bytes = 0
+    after_id = 0
+    with SessionLocal() as db:
+        remaining = db.execute(select(func.count(Story.id)).where(Story.packed_tree.is_(None))).scalar()
+        logger.info("%d stories are stored as rows", remaining)
+        while not args.limit or packed < args.limit:
+            batch_size = min(args.batch_size, args.limit - packed) if args.limit else args.batch_size
+            story_ids = stories_to_pack(db, after_id, batch_size)
+            if not story_ids:
+                break
+            batch_row_bytes, batch_blob_bytes = pack_batch(db, story_ids, args.compression, args.dry_run)
+            packed += len(story_ids)
+            row_bytes += batch_row_bytes
+            blob_bytes += batch_blob_bytes
+            after_id = story_ids[-1]
+            logger.info("%s %d stories (up to id %d)", "Would pack" if args.dry_run else "Packed", packed, after_id)
+
+    ratio = blob_bytes / row_bytes if row_bytes else 0
+    logger.info("%s %d stories in %.1fs: %d bytes of node text and options -> %d bytes packed (%.0f%%)",
+                "Would pack" if args.dry_run else "Packed", packed, time.perf_counter() - started, row_bytes, blob_bytes, ratio * 100)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,94 @@
 import uuid
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Cookie
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Cookie, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db
+from db.async_database import get_async_db, get_read_db, AsyncSessionLocal, READ_REPLICA
 from models.job import StoryJob
-from schemas.job import StoryJobResponse
+from schemas.job import StoryJobResponse, StoryBatchStatusResponse
+from core.notifications import notification_bus, job_channel, format_sse
+from core.scheduler import generation_scheduler
 
 router = APIRouter(
     prefix="/jobs",
     tags=["jobs"]
 )
 
+FINISHED_STATUSES = ("completed", "failed") # a job never changes again after reaching one of these
+
+# Progress of a POST /stories/batch: job counts per status and the tokens spent so far, from one GROUP BY over the batch_id index.
+# Declared before /{job_id}/events, otherwise a batch called "events" would be read as a job id.
+@router.get("/batch/{batch_id}", response_model=StoryBatchStatusResponse)
+async def get_batch_status(batch_id: str, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(StoryJob.status, func.count(), func.sum(StoryJob.prompt_tokens), func.sum(StoryJob.completion_tokens))
+        .where(StoryJob.batch_id == batch_id).group_by(StoryJob.status))
+    progress = StoryBatchStatusResponse(batch_id=batch_id, total=0, done=False)
+    for status, count, prompt_tokens, completion_tokens in result.all():
+        progress.total += count
+        if status in ("pending", "processing", "completed", "failed"):
+            setattr(progress, status, count)
+        progress.prompt_tokens += prompt_tokens or 0
+        progress.completion_tokens += completion_tokens or 0
+    if progress.total == 0:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    progress.done = progress.completed + progress.failed == progress.total
+    return progress
+
+# ?wait=N turns this into a long-poll: if the job is still pending/processing, the request is held open for up to N seconds and answered the moment generate_story_task publishes a new status. A client waiting for a story then needs about one request per status change instead of one every few seconds, and only the first lookup of each request touches the database.
+# Polls only read, so they go through the read-only session factory (a replica when DATABASE_READ_URL is set); the replica answers for finished jobs, unfinished ones are read on the primary.
 @router.get("/{job_id}", response_model=StoryJobResponse)
-def get_job_status(job_id: str, db: Session = Depends(get_db)):
-    job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first() # return: SQLAlchemy StoryJob object
+async def get_job_status(job_id: str, wait: Optional[int] = Query(None, ge=0, le=60), db: AsyncSession = Depends(get_read_db)): # async def: runs on the event loop, so status polls never wait for a free threadpool thread
+    # subscribe before reading the job, so a status change between the query and the wait can't be missed
+    async with notification_bus.subscribe(job_channel(job_id)) as subscription:
+        result = await db.execute(select(StoryJob).where(StoryJob.job_id == job_id))
+        job = result.scalars().first() # return: SQLAlchemy StoryJob object
+        # A replica lags behind the primary: a job created a moment ago may be missing, and a job still pending or processing there may have finished already.
+        # Only a finished job can't change any more, so anything else is read again on the primary, after subscribing, before a long-poll waits on it.
+        if READ_REPLICA and (not job or job.status not in FINISHED_STATUSES):
+            async with AsyncSessionLocal() as primary:
+                result = await primary.execute(select(StoryJob).where(StoryJob.job_id == job_id))
+                job = result.scalars().first()
 
-    
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.status == "pending":
+            job.queue_position = generation_scheduler.position(job_id) # not a column, only reported in the response
+        if not wait or job.status in FINISHED_STATUSES:
+            return job # FastAPI converts JSON-serializable format generated by the Pydantic model to JSON text for HTTP transmission. Pydantic does the heavy lifting (validation + serialization), FastAPI just takes the result and sends it as JSON.
+
+        await db.close() # give the connection back to the pool while we wait, the loaded job stays readable
+        message = await subscription.get(timeout=wait)
+        return message if message is not None else job # the published message already is a StoryJobResponse
+
+# Server-Sent Events version: sends the current status right away, then every status change, and closes once the job is completed or failed.
+@router.get("/{job_id}/events")
+async def stream_job_status(job_id: str, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(select(StoryJob).where(StoryJob.job_id == job_id))
+    job = result.scalars().first()
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
-    return job # FastAPI converts JSON-serializable format generated by the Pydantic model to JSON text for HTTP transmission. Pydantic does the heavy lifting (validation + serialization), FastAPI just takes the result and sends it as JSON.
+    await db.close()
+
+    async def event_stream():
+        async with notification_bus.subscribe(job_channel(job_id)) as subscription:
+            # read the job again after subscribing, the status may have changed since the check above
+            async with AsyncSessionLocal() as stream_db:
+                result = await stream_db.execute(select(StoryJob).where(StoryJob.job_id == job_id))
+                current = StoryJobResponse.model_validate(result.scalars().first()).model_dump(mode="json")
+
+            yield format_sse("status", current)
+            while current["status"] not in FINISHED_STATUSES:
+                message = await subscription.get(timeout=15)
+                if message is None:
+                    yield ": keep-alive\n\n" # SSE comment, keeps proxies from closing an idle connection
+                    continue
+                current = message
+                yield format_sse("status", current)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 """
 1. You return: job (SQLAlchemy object)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from core.metrics import metrics_registry, jobs_in_flight, llm_provider_latency, llm_provider_available
+from core.scheduler import generation_scheduler
+from core.llm_providers import get_llm_router
+
+# Served at /metrics (outside API_PREFIX, where Prometheus looks by default)
+router = APIRouter(tags=["metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    jobs_in_flight.set(generation_scheduler.snapshot()["queued"], state="queued") # read from the scheduler when scraped instead of updating it on every submit
+    for provider in get_llm_router().providers:
+        llm_provider_available.set(1 if provider.available else 0, provider=provider.name) # a cooldown ends without any call, so check it here
+        if provider.latency is not None:
+            llm_provider_latency.set(provider.latency, provider=provider.name)
+    return PlainTextResponse(metrics_registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
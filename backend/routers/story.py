@@ -1,18 +1,48 @@
 # write the endpoints hit by our users
+import asyncio
+import logging
+import math
+import os
+import socket
 import uuid # generate unique ids for our stories
-from typing import Optional
+import base64
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Cookie, Response, BackgroundTasks
+import orjson # installed with fastapi[all]
+from typing import Optional
+from functools import partial
+from fastapi import APIRouter, Depends, HTTPException, Cookie, Response, Request, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, insert, func, case, tuple_, literal
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db.database import get_db, SessionLocal
+from db.async_database import get_async_db, get_read_db, AsyncSessionLocal, READ_REPLICA
 from models.story import Story, StoryNode
 from models.job import StoryJob
+from models.playthrough import StoryNodeStats
 from schemas.story import (
-    CompleteStoryResponse, CompleteStoryNodeResponse, CreateStoryRequest)
-from schemas.job import StoryJobResponse
+    CompleteStoryResponse, CompleteStoryNodeResponse, CreateStoryRequest, CreateStoryBatchRequest, StoryNodeWithChildrenResponse,
+    StoryListResponse, StorySummaryResponse, PlaythroughEventsRequest, PlaythroughEventsResponse, StoryStatsResponse, StoryNodeStatsResponse)
+from schemas.job import StoryJobResponse, StoryBatchResponse
 from core.story_generator import StoryGenerator
+from core.config import settings
+from core.notifications import notification_bus, story_channel, format_sse
+from core.story_stream import node_payload
+from core.generation_cache import generation_cache, normalize_theme
+from core.metrics import stage, track_job, observe_queue_wait, jobs_finished, job_token_usage
+from core.response_cache import complete_story_cache, make_etag, is_current_etag
+from core.scheduler import generation_scheduler, SchedulerSaturated, DEFAULT_JOB_SECONDS
+from core.story_pool import story_pool
+from core.story_pack import unpack_story, ROOT_NODE_ID
+from core.retention import retention_sweeper
+from core.playthrough_events import event_buffer
+from core.job_queue import (
+    utcnow, claim_job, claim_next_job, run_with_lease, LeaseLost, publish_job_status, retry_or_fail_values, requeue_expired_jobs, orphaned_pending_jobs)
+
 
+logger = logging.getLogger(__name__)
+
+PROCESS_WORKER_ID = f"api:{socket.gethostname()}:{os.getpid()}" # lease owner name for jobs generated inside this API process
 
 router = APIRouter(
     prefix="/stories",
@@ -31,15 +61,37 @@ def get_session_id(session_id: Optional[str] = Cookie(None)):
 # Return a job response, which contains the job id and the status of the job (e.g., "pending", "completed", "failed")
 # Accept a "CreateStoryRequest" object as the request body, which contains the theme of the story to be created
 @router.post("/create", response_model=StoryJobResponse) # response_model is a part of FastAPI's response handling system. It allows you to specify a Pydantic model that defines the structure of the response data. When you return a response from your endpoint, FastAPI will automatically validate and serialize the response data according to the specified model. This helps ensure that the response data is consistent and adheres to the expected format, making it easier for clients to consume and understand the API responses.
-def create_story(
+async def create_story(
     request: CreateStoryRequest,
-    background_tasks: BackgroundTasks,
     response: Response,
-    session_id: str = Depends(get_session_id), # Thread 1: main HTTP thread. Depends: Allow get_session_id to be called on EVERY request and then inject this value into the session_id, so that we can use them in our logic.
-    db: Session = Depends(get_db)
+    session_id: str = Depends(get_session_id), # Depends: Allow get_session_id to be called on EVERY request and then inject this value into the session_id, so that we can use them in our logic.
+    db: AsyncSession = Depends(get_async_db)
 ):
     response.set_cookie(key="session_id", value=session_id, httponly=True) # The server sets the session_id in the cookie, so that the browser can store it and send it back in subsequent requests
 
+    # a popular theme may have a finished story waiting in the warm pool: hand it over and return a job that is already completed
+    if story_pool.enabled:
+        story_id = await story_pool.claim(db, request.theme, session_id)
+        if story_id is not None:
+            job = StoryJob(
+                job_id=str(uuid.uuid4()),
+                session_id=session_id,
+                theme=request.theme,
+                status="completed",
+                story_id=story_id,
+                completed_at=utcnow()
+            )
+            db.add(job)
+            await db.commit() # the claim and the job are committed together
+            await db.refresh(job)
+            return job
+
+    # refuse early when the generation queue is full, before writing anything to the database
+    try:
+        generation_scheduler.check_admission(session_id)
+    except SchedulerSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
     job_id = str(uuid.uuid4()) # Generate a unique job id for this story creation task. The type should be aligned with the one declared in StoryJobResponse.
     job = StoryJob(
         job_id=job_id,
@@ -49,15 +101,27 @@ def create_story(
     )
 
     db.add(job) # First time: ADD to database. Add the job to the database session, but it is not committed yet, so the job is not saved in the database yet. We need to call db.commit() to save the job in the database.
-    db.commit() # Thread 1 writes to database
+    await db.commit()
+    await db.refresh(job) # load created_at, which is filled in by the database (server_default)
+
+    # hand the generation to the scheduler (or, in worker mode, leave it to the worker processes), so that we can return the response to the user immediately without waiting for the story generation to complete. The scheduler starts generate_story_task when a slot is free (taking turns between sessions), and the task updates the job status in the database once the story generation is completed, so that the frontend can check the status of the job and get the story when it is completed.
+    if settings.JOB_EXECUTION_MODE == "worker":
+        return job # the committed "pending" row is the queue entry, a worker process will claim it
+    try:
+        generation_scheduler.submit(job_id, session_id, partial(
+            generate_story_task,
+            job_id=job_id,
+            theme=request.theme,
+            session_id=session_id
+        ))
+    except SchedulerSaturated as e: # the queue filled up while the job was being saved
+        job.status = "failed"
+        job.error = str(e)
+        job.completed_at = utcnow()
+        await db.commit()
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    job.queue_position = generation_scheduler.position(job_id) # not a column, only reported in the response
 
-    # create a background task to generate the story, so that we can return the response to the user immediately without waiting for the story generation to complete. The background task will update the job status in the database once the story generation is completed, so that the frontend can check the status of the job and get the story when it is completed.
-    background_tasks.add_task(
-        generate_story_task,
-        job_id=job_id,
-        theme=request.theme,
-        session_id=session_id
-    )
     # # Is equivalent to:
     # generate_story_task(
     #     job_id=job_id,
@@ -69,10 +133,10 @@ def create_story(
             ↓
     Time 2: Server executes create_story
             ├─ Create job in database
-            ├─ Queue background task (generate_story_task)
+            ├─ Queue the job in the generation scheduler (generate_story_task)
             ├─ Return response to browser immediately ✅
             ↓
-    Time 3: Background thread starts
+    Time 3: Scheduler starts the task on the event loop once a slot is free (no extra thread, generate_story_task is async)
             ├─ Calls: generate_story_task(job_id="xyz", theme="fantasy", session_id="abc123")
             ├─ Generates story (might take 10+ seconds)
             ├─ Updates database
@@ -81,6 +145,66 @@ def create_story(
 
     return job # This is what I actually returning to the frontend
 
+# Endpoint, POST: create one story per theme in a single request, e.g. to seed content. All the jobs are inserted with one multi-row INSERT and one commit, under a shared batch_id that GET /jobs/batch/{batch_id} reports on.
+# The batch is then worked through BATCH_CONCURRENCY stories at a time (in worker mode, by the workers), outside the per-session queue limits of the scheduler.
+@router.post("/batch", response_model=StoryBatchResponse)
+async def create_story_batch(
+    request: CreateStoryBatchRequest,
+    response: Response,
+    session_id: str = Depends(get_session_id),
+    db: AsyncSession = Depends(get_async_db)
+):
+    response.set_cookie(key="session_id", value=session_id, httponly=True)
+
+    # like /create's per-session queue limit: a session can't pile up more unfinished batch jobs than BATCH_MAX_PENDING_PER_SESSION
+    result = await db.execute(select(func.count(StoryJob.id)).where(
+        StoryJob.session_id == session_id, StoryJob.batch_id.is_not(None), StoryJob.status.in_(("pending", "processing"))))
+    unfinished = result.scalar()
+    if unfinished + len(request.themes) > settings.BATCH_MAX_PENDING_PER_SESSION:
+        retry_after = max(1, math.ceil(unfinished / max(settings.BATCH_CONCURRENCY, 1)) * DEFAULT_JOB_SECONDS)
+        raise HTTPException(status_code=429, detail="You already have too many batch stories waiting to be generated", headers={"Retry-After": str(retry_after)})
+
+    batch_id = str(uuid.uuid4())
+    rows = [{"job_id": str(uuid.uuid4()), "session_id": session_id, "theme": theme, "status": "pending", "batch_id": batch_id}
+            for theme in request.themes]
+    await db.execute(insert(StoryJob), rows)
+    await db.commit()
+
+    if settings.JOB_EXECUTION_MODE != "worker": # the workers claim batch jobs like any other pending job
+        start_batch(batch_id)
+    return StoryBatchResponse(batch_id=batch_id, job_ids=[row["job_id"] for row in rows])
+
+_batch_tasks = {} # batch_id -> task of run_batch, for the batches being worked through in this process
+_batch_slots = asyncio.Semaphore(settings.BATCH_CONCURRENCY) # shared by the lanes of all batches, so concurrent batches don't add up to more generations
+
+def start_batch(batch_id: str):
+    task = asyncio.create_task(run_batch(batch_id))
+    _batch_tasks[batch_id] = task
+    task.add_done_callback(lambda _: _batch_tasks.pop(batch_id, None))
+
+# BATCH_CONCURRENCY lanes, each claiming the next due job of the batch until none is left. Claims go through the database like a worker's, so a batch interrupted by a restart is finished by job_recovery_loop.
+# A lane only claims a job once it holds one of the process-wide _batch_slots: two batches share BATCH_CONCURRENCY generations instead of running twice as many, and the generation_scheduler slots of /create stay free for interactive requests.
+async def run_batch(batch_id: str):
+    async def lane():
+        while True:
+            async with _batch_slots, AsyncSessionLocal() as db:
+                job = await claim_next_job(db, PROCESS_WORKER_ID, batch_id=batch_id)
+                if job is None:
+                    return # retries wait for their backoff, job_recovery_loop picks them up
+                await run_story_job(db, job, PROCESS_WORKER_ID)
+
+    try:
+        await asyncio.gather(*(lane() for _ in range(settings.BATCH_CONCURRENCY)))
+    except Exception:
+        logger.exception("Batch %s stopped, job_recovery_loop will finish its jobs", batch_id)
+
+# called by main.py on shutdown; the interrupted jobs are requeued once their leases run out
+async def stop_batches():
+    tasks = list(_batch_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 """
 # In story.py:
 @router.post("/create")
@@ -93,65 +217,420 @@ def create_story(db: Session = Depends(get_db)):
     # After endpoint finishes, finally block runs
 """
 
-def generate_story_task(job_id: str, theme: str, session_id: str):
-    # We need to create a new database session when user reqeusts, because one session can tell users that it is process and the other can do some the background task running in a different thread. Once the background task is completed, we need to update the job status in the database, so that the frontend can check the status of the job and get the story when it is completed. If we use the same database session, we will have some hanging operations where the background task in running and it's using the database, the API will not be able to use the database at the same time. It is a asynchronous task, so we need to create a new database session for it.
-    db = SessionLocal() # Thread 2: background thread -> SEPERATE session!
-
-    try:
-        # We can't share the same job object between the main and the background task, because they are running in different threads.
-        # We're QUERYING an existing job, not creating a new one!
-        job = db.query(StoryJob).filter(StoryJob.job_id == job_id).first() # grab the first entry we found
-        
+async def generate_story_task(job_id: str, theme: str, session_id: str):
+    # We need to create a new database session for the background task, because the request's session is closed as soon as the response is sent. The task keeps its own session (and transaction) until the story is saved, so the API can keep serving other requests at the same time.
+    async with AsyncSessionLocal() as db: # SEPERATE session from the request!
+        # We can't share the same job object between the request and the background task, because the request's session is already closed.
+        # Claiming moves the job from "pending" to "processing" under a lease; it returns None if the job doesn't exist or another process already took it.
+        job = await claim_job(db, job_id, PROCESS_WORKER_ID)
         if not job:
             return
+        await run_story_job(db, job, PROCESS_WORKER_ID)
+
+# Generate the story for a claimed job and record the outcome. Shared by the in-process scheduler and the standalone workers (worker.py).
+async def run_story_job(db: AsyncSession, job: StoryJob, worker_id: str):
+    if job.attempts == 1:
+        observe_queue_wait(job.created_at) # retries would also count their backoff, so only first attempts are measured
+    with track_job(), stage("job"): # in-flight gauge, statement count and total time of this attempt
+        try:
+            await _run_story_job(db, job, worker_id)
+        except LeaseLost as e:
+            logger.warning("%s, leaving it to the worker that took it over", e)
+            await db.rollback() # drop the cancelled generation's writes
+            jobs_finished.inc(status="lease_lost")
+            return
+    jobs_finished.inc(status="retry" if job.status == "pending" else job.status)
+
+async def _run_story_job(db: AsyncSession, job: StoryJob, worker_id: str):
+    theme, session_id = job.theme, job.session_id
+    publish_job_status(job) # now "processing"
+    try:
+        async def generate() -> int: # only runs when the generation cache has no story for this theme
+            if settings.FANOUT_GENERATION:
+                story = await StoryGenerator.agenerate_story_fanout(db, session_id, theme) # outline first, then the branches in parallel
+            elif settings.STREAM_GENERATION:
+                def attach_story(story): # the story row exists before the nodes do, so the client can already open /stories/{id}/stream
+                    job.story_id = story.id
+                story = await StoryGenerator.astream_story(db, session_id, theme, on_story_created=attach_story)
+            else:
+                story = await StoryGenerator.agenerate_story(db, session_id, theme) # awaits the LLM without holding a thread
+            with stage("render"):
+                await db.run_sync(store_complete_payload, story.id) # render the /complete response once, it is committed together with the job below
+            return story.id
+
+        async def story_exists(story_id: int) -> bool: # a cached story may have been deleted by another process's retention sweep
+            return (await db.execute(select(Story.id).where(Story.id == story_id))).first() is not None
+
+        # a cached story for the same theme, the result of an identical request that is already generating, or a new story.
+        # The story row keeps the session it was generated for; the other sessions that get it only have this job's story_id, which GET /stories also lists (so retention keeps such jobs).
+        # The lease is renewed while it runs, so the job isn't requeued while we are still working on it.
+        job.story_id = await run_with_lease(job.job_id, worker_id, generation_cache.get_or_generate(theme, generate, exists=story_exists))
+
+        job.status = "completed"
+        job.completed_at = utcnow()
+        record_job_tokens(job)
+        job.error = None # an earlier attempt may have failed
+        job.lease_owner = None
+        job.lease_expires_at = None
+        await db.commit()
+        publish_job_status(job)
+    except LeaseLost:
+        raise # the job belongs to whoever took it over, record nothing
+    except Exception as e:
+        await db.rollback() # drop whatever the failed generation left in the transaction before recording the failure
+        await db.refresh(job) # the rollback expired the job, load it again
+        job.story_id = None # a partially streamed story is removed when generation fails
+        record_job_tokens(job) # a failed attempt was paid for too
+        for column, value in retry_or_fail_values(job.attempts, str(e)).items(): # back to "pending" with a backoff, or "failed" after the last attempt
+            setattr(job, column, value)
+        await db.commit()
+        publish_job_status(job)
+
+# add the tokens of this attempt's LLM calls (counted by core.metrics.track_job) to the job
+def record_job_tokens(job: StoryJob):
+    prompt_tokens, completion_tokens = job_token_usage()
+    job.prompt_tokens = (job.prompt_tokens or 0) + prompt_tokens
+    job.completion_tokens = (job.completion_tokens or 0) + completion_tokens
+
+# Safety net for JOB_EXECUTION_MODE=inprocess, started by main.py: jobs abandoned by a crashed process and retries whose backoff is over are queued in this process's scheduler again
+async def job_recovery_loop():
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                await requeue_expired_jobs(db)
+                for job in await orphaned_pending_jobs(db):
+                    if generation_scheduler.is_queued(job.job_id) or job.batch_id in _batch_tasks: # a running batch gets to its own jobs
+                        continue
+                    generation_scheduler.submit(job.job_id, job.session_id, partial(
+                        generate_story_task, job_id=job.job_id, theme=job.theme, session_id=job.session_id))
+        except SchedulerSaturated:
+            pass # busy, the remaining jobs are picked up in a later round
+        except Exception:
+            logger.exception("Job recovery round failed")
+        await asyncio.sleep(settings.JOB_RECOVERY_INTERVAL_SECONDS)
+
+# Generate one story for the warm pool: like a job, but without a session, and tagged with the theme it waits for
+async def generate_pool_story(theme: str) -> int:
+    async with AsyncSessionLocal() as db:
+        if settings.FANOUT_GENERATION:
+            story = await StoryGenerator.agenerate_story_fanout(db, None, theme)
+        else:
+            story = await StoryGenerator.agenerate_story(db, None, theme)
+        story.pool_theme = normalize_theme(theme)
+        with stage("render"):
+            await db.run_sync(store_complete_payload, story.id)
+        await db.commit()
+        return story.id
 
+# Started by main.py when STORY_POOL_ENABLED: keeps the popular themes stocked while the service is quiet
+async def story_pool_loop():
+    while True:
         try:
-            job.status = "processing" # since the job exists, just modify existing data and then use commit() to save the changes to the database.
-            db.commit() # Thread 2 independently manages its own transaction
-            
-            story = StoryGenerator.generate_story(db, session_id, theme)
-            
-            job.story_id = story.id
-            job.status = "completed"
-            job.completed_at = datetime.now()
-            db.commit()
-        except Exception as e:
-            job.status = "failed"
-            job.completed_at = datetime.now()
-            job.error = str(e)
-            db.commit()
-    finally:
-        db.close()
-
-@router.get("/{story_id}/complete", response_model=CompleteStoryResponse)
-def get_complete_story(story_id: int, db: Session = Depends(get_db)):
-    story = db.query(Story).filter(Story.id == story_id).first()
+            await story_pool.refill(generate_pool_story)
+        except Exception:
+            logger.exception("Story pool refill failed")
+        await asyncio.sleep(settings.STORY_POOL_REFILL_INTERVAL_SECONDS)
+
+# hit / miss / coalesced counters of the generation cache
+@router.get("/cache/stats")
+async def get_generation_cache_stats():
+    return generation_cache.snapshot()
+
+# stock per theme, hit rate and refill rate of the warm pool
+@router.get("/pool/stats")
+async def get_story_pool_stats():
+    return story_pool.snapshot()
+
+# what the last retention sweep removed (or would remove, in a dry run) and how long it took
+@router.get("/retention/stats")
+async def get_retention_stats():
+    return retention_sweeper.snapshot()
+
+# accepted / dropped / written playthrough events of this process and the last flush
+@router.get("/events/stats")
+async def get_event_buffer_stats():
+    return event_buffer.snapshot()
+
+# The caller's story library, newest first. Keyset pagination: the cursor is the (created_at, id) of the last story on the previous page and the next page continues strictly after it, so however deep the player has paged a page is one range scan, and stories created meanwhile don't shift the pages.
+# A story belongs to the session it was generated for and to every other session the generation cache handed it to (see core/generation_cache.py); those only have a job pointing at it, so the library also looks through story_jobs (ix_story_jobs_session_story).
+# node_count / ending_count are stored on the story row when it is saved, so no node is loaded.
+@router.get("", response_model=StoryListResponse)
+async def list_stories(
+    cursor: Optional[str] = None,
+    limit: int = Query(settings.STORY_LIST_PAGE_SIZE, ge=1, le=settings.STORY_LIST_MAX_PAGE_SIZE),
+    session_id: Optional[str] = Cookie(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    if not session_id: # no cookie yet, so no story can be this caller's
+        return StoryListResponse(items=[])
+
+    # Two keyset queries, merged below: an OR of both conditions in one query can't use the (session_id, created_at, id) index for its order and makes the database sort every matching story.
+    owned = select(Story.id, Story.title, Story.created_at, Story.node_count, Story.ending_count).where(Story.session_id == session_id) # index range scan
+    from_cache = (select(Story.id, Story.title, Story.created_at, Story.node_count, Story.ending_count) # stories the generation cache handed this session, found through its jobs (ix_story_jobs_session_story), only a few per session
+                  .where(Story.id.in_(select(StoryJob.story_id).where(StoryJob.session_id == session_id, StoryJob.story_id.is_not(None))),
+                         Story.session_id != session_id)) # the owned ones are already in the first query
+    if cursor:
+        created_at, story_id = decode_story_cursor(cursor)
+        # literal() with the column's type, so SQLite gets the time in its stored format (see SQLITE_TIMESTAMP in models/story.py)
+        after_cursor = tuple_(Story.created_at, Story.id) < tuple_(literal(created_at, Story.created_at.type), literal(story_id, Story.id.type))
+        owned, from_cache = owned.where(after_cursor), from_cache.where(after_cursor)
+    rows = []
+    for query in (owned, from_cache):
+        result = await db.execute(query.order_by(Story.created_at.desc(), Story.id.desc()).limit(limit + 1)) # one more than asked, to know whether there is a next page
+        rows.extend(result.all())
+    rows.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+
+    items = [StorySummaryResponse(id=row.id, title=row.title, created_at=row.created_at, node_count=row.node_count, ending_count=row.ending_count)
+             for row in rows[:limit]]
+    legacy_ids = [item.id for item in items if item.node_count is None]
+    if legacy_ids: # stories saved before the counters existed: count their rows, for this page only
+        result = await db.execute(
+            select(StoryNode.story_id, func.count(StoryNode.id), func.sum(case((StoryNode.is_ending == True, 1), else_=0)))
+            .where(StoryNode.story_id.in_(legacy_ids))
+            .group_by(StoryNode.story_id))
+        counts = {story_id: (node_count, ending_count) for story_id, node_count, ending_count in result}
+        for item in items:
+            if item.id in counts:
+                item.node_count, item.ending_count = counts[item.id]
+
+    next_cursor = encode_story_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return StoryListResponse(items=items, next_cursor=next_cursor)
+
+# The cursor is opaque to the client: URL-safe base64 of "<created_at ISO 8601>|<id>"
+def encode_story_cursor(created_at: datetime, story_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{story_id}".encode()).decode().rstrip("=")
+
+def decode_story_cursor(cursor: str) -> tuple:
+    try:
+        created_at, story_id = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+        return datetime.fromisoformat(created_at), int(story_id)
+    except ValueError: # also covers bad base64 (binascii.Error) and bad UTF-8
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# The response is rendered once per story (see store_complete_payload) and then served as stored bytes: from the in-memory cache when possible, otherwise with a single-row lookup. The strong ETag lets the browser revalidate with If-None-Match and get an empty 304 back.
+# The lookup goes through the read-only session factory (a replica when DATABASE_READ_URL is set); the rare story without a stored payload is rendered and stored on the primary.
+@router.get("/{story_id}/complete", response_model=CompleteStoryResponse) # response_model is still used for the API docs, the stored bytes already match it
+async def get_complete_story(story_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    retention_sweeper.record_open(story_id) # in memory only, written to last_opened_at in batches
+    rendered = complete_story_cache.get(story_id)
+    if rendered is None:
+        payload_query = select(Story.complete_payload, Story.complete_etag).where(Story.id == story_id)
+        row = (await db.execute(payload_query)).first()
+        if (not row or row[0] is None) and READ_REPLICA: # the replica may not have the story (or its payload) yet
+            async with AsyncSessionLocal() as primary:
+                row = (await primary.execute(payload_query)).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="Story not found")
+        payload, etag = row
+        if payload is not None and not is_current_etag(etag):
+            payload = None # stored by an older version (e.g. with the session_id still in it), render it again
+
+        if payload is None: # a story saved before payloads were stored, or one that is still being streamed
+            async with AsyncSessionLocal() as primary:
+                result = await primary.execute(select(StoryJob.id).where(StoryJob.story_id == story_id, StoryJob.status.in_(("pending", "processing"))))
+                if result.first() is not None: # still growing, render what there is now and don't store a partial tree
+                    return Response(content=await primary.run_sync(render_complete_story, story_id), media_type="application/json")
+                story = await primary.run_sync(store_complete_payload, story_id)
+                await primary.commit()
+                payload, etag = story.complete_payload, story.complete_etag
+
+        rendered = await complete_story_cache.aput(story_id, payload, etag) # compressed in a thread, not on the event loop
+    return rendered_response(rendered, request)
+
+def rendered_response(rendered, request: Request) -> Response:
+    headers = {
+        "ETag": rendered.etag,
+        "Vary": "Accept-Encoding", # the body depends on the Accept-Encoding header, tell caches not to mix the variants
+        "Cache-Control": "no-cache", # the browser may keep the body but has to revalidate it (a cheap 304) before using it
+    }
+    if rendered.matches(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+
+    encoding, body = rendered.body_for(request.headers.get("accept-encoding", ""))
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
+
+# Render the /complete response of a finished story and keep the bytes, with their ETag, on the story row.
+def store_complete_payload(db: Session, story_id: int) -> Story:
+    story = db.get(Story, story_id)
+    payload = render_complete_story(db, story_id)
+    story.complete_payload = payload
+    story.complete_etag = make_etag(payload)
+    return story
+
+# Lazy navigation: instead of downloading the whole tree from /complete, a player fetches the node they are on and its direct children. Both queries go by primary key (or the story_id index for the root), so the work per click depends on the number of options, not on the size of the story.
+@router.get("/{story_id}/nodes/root", response_model=StoryNodeWithChildrenResponse) # declared before /nodes/{node_id}, otherwise "root" would be parsed as a node id
+async def get_root_node(story_id: int, prefetch: bool = False, db: AsyncSession = Depends(get_async_db)):
+    retention_sweeper.record_open(story_id)
+    result = await db.execute(select(StoryNode).where(StoryNode.story_id == story_id, StoryNode.is_root == True))
+    node = result.scalars().first()
+    if not node:
+        return await packed_node_with_children(db, story_id, ROOT_NODE_ID, prefetch, "Story not found")
+    return await build_node_with_children(db, node, prefetch)
+
+@router.get("/{story_id}/nodes/{node_id}", response_model=StoryNodeWithChildrenResponse)
+async def get_story_node(story_id: int, node_id: int, prefetch: bool = False, db: AsyncSession = Depends(get_async_db)):
+    node = await db.get(StoryNode, node_id)
+    if not node or node.story_id != story_id:
+        return await packed_node_with_children(db, story_id, node_id, prefetch, "Node not found") # node ids of a packed story are local to it, not story_nodes ids
+    return await build_node_with_children(db, node, prefetch)
+
+# The same response for a story stored packed: one single-row lookup, and the children are already in the blob
+async def packed_node_with_children(db: AsyncSession, story_id: int, node_id: int, prefetch: bool, not_found: str) -> StoryNodeWithChildrenResponse:
+    result = await db.execute(select(Story.packed_tree).where(Story.id == story_id))
+    packed_tree = result.scalar()
+    nodes = unpack_story(packed_tree) if packed_tree is not None else []
+    if not 1 <= node_id <= len(nodes):
+        raise HTTPException(status_code=404, detail=not_found)
+    node = nodes[node_id - ROOT_NODE_ID]
+    children = {}
+    if prefetch:
+        children = {option["node_id"]: CompleteStoryNodeResponse(**nodes[option["node_id"] - ROOT_NODE_ID]) for option in node["options"]}
+    return StoryNodeWithChildrenResponse(**node, story_id=story_id, is_root=node_id == ROOT_NODE_ID, children=children)
+
+async def build_node_with_children(db: AsyncSession, node: StoryNode, prefetch: bool) -> StoryNodeWithChildrenResponse:
+    children = {}
+    child_ids = [option["node_id"] for option in (node.options or []) if option.get("node_id") is not None]
+    if prefetch and child_ids:
+        result = await db.execute(select(StoryNode).where(StoryNode.id.in_(child_ids), StoryNode.story_id == node.story_id))
+        children = {child.id: to_node_response(child) for child in result.scalars()}
+
+    return StoryNodeWithChildrenResponse(
+        **to_node_response(node).model_dump(),
+        story_id=node.story_id,
+        is_root=node.is_root,
+        children=children)
+
+def to_node_response(node: StoryNode) -> CompleteStoryNodeResponse:
+    return CompleteStoryNodeResponse(
+        id=node.id,
+        content=node.content,
+        is_ending=node.is_ending,
+        is_winning_ending=node.is_winning,
+        options=node.options if node.options else []
+    )
+
+# Playthrough events from StoryGame, sent in batches. The request never touches the database: the events go into this process's bounded buffer and are written by its flush loop with multi-row inserts (core/playthrough_events.py).
+# When the buffer is full the rest of the batch is dropped and counted, answered with the number dropped, so a slow database never holds up players.
+# The story isn't looked up either; events of a story that doesn't exist are removed by the retention sweeper with the story's other rows.
+@router.post("/{story_id}/events", response_model=PlaythroughEventsResponse, status_code=202)
+async def record_playthrough_events(story_id: int, request: PlaythroughEventsRequest):
+    events = [(event.type, event.node_id, event.option_index, event.won, event.path) for event in request.events]
+    accepted = event_buffer.add(story_id, request.playthrough_id, events)
+    return PlaythroughEventsResponse(accepted=accepted, dropped=len(events) - accepted)
+
+# Per node: visits, choices, finished playthroughs and win rate, read from story_node_stats (one row per played node), not from the raw events.
+# Events still in the API processes' buffers are missing for up to STORY_EVENTS_FLUSH_SECONDS.
+@router.get("/{story_id}/stats", response_model=StoryStatsResponse)
+async def get_story_stats(story_id: int, db: AsyncSession = Depends(get_async_db)):
+    result = await db.execute(
+        select(StoryNodeStats.node_id, StoryNodeStats.visits, StoryNodeStats.choices, StoryNodeStats.finishes, StoryNodeStats.wins)
+        .where(StoryNodeStats.story_id == story_id).order_by(StoryNodeStats.node_id))
+    nodes = [StoryNodeStatsResponse(node_id=node_id, visits=visits, choices=choices, finishes=finishes, wins=wins,
+                                    win_rate=wins / finishes if finishes else None)
+             for node_id, visits, choices, finishes, wins in result.all()]
+    return StoryStatsResponse(story_id=story_id, nodes=nodes)
+
+# Server-Sent Events feed of a story that may still be generating. It first replays the nodes that are already saved, then pushes every new node / option as the background task saves it, and ends with a "complete" (or "error") event.
+@router.get("/{story_id}/stream")
+async def stream_story(story_id: int, db: AsyncSession = Depends(get_async_db)):
+    story = await db.get(Story, story_id)
     if not story:
         raise HTTPException(status_code=404, detail="Story not found")
+    title, packed_tree = story.title, story.packed_tree
+
+    async def event_stream():
+        # subscribe BEFORE reading the saved nodes, so nothing saved in between is missed (duplicates are skipped below)
+        async with notification_bus.subscribe(story_channel(story_id)) as subscription:
+            async with AsyncSessionLocal() as stream_db: # the request's session is closed once the response starts streaming
+                result = await stream_db.execute(select(StoryNode).where(StoryNode.story_id == story_id).order_by(StoryNode.id))
+                nodes = [(node_payload(node), node.is_root) for node in result.scalars()]
+                if not nodes and packed_tree is not None: # a packed story is only saved when it is finished, so this replay is all there is
+                    nodes = [(node, node["id"] == ROOT_NODE_ID) for node in unpack_story(packed_tree)]
+                result = await stream_db.execute(select(StoryJob.status).where(StoryJob.story_id == story_id))
+                job_status = result.scalars().first()
 
-    complete_story = build_complete_story_tree(db, story)
-    return complete_story
+            yield format_sse("story", {"type": "story", "id": story_id, "title": title})
+            sent_node_ids = set()
+            for node, is_root in nodes:
+                sent_node_ids.add(node["id"])
+                yield format_sse("node", {"type": "node", "node": node, "is_root": is_root})
+
+            if job_status in (None, "completed", "failed"): # nothing is generating this story anymore
+                yield format_sse("complete", {"type": "complete", "id": story_id})
+                return
+
+            while True:
+                message = await subscription.get(timeout=15)
+                if message is None:
+                    yield ": keep-alive\n\n" # SSE comment, keeps proxies from closing an idle connection
+                    continue
+                if message["type"] == "node" and message["node"]["id"] in sent_node_ids:
+                    continue
+                yield format_sse(message["type"], message)
+                if message["type"] in ("complete", "error"):
+                    return
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 def build_complete_story_tree(db: Session,story: Story) -> CompleteStoryResponse:
-    nodes = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
-    
-    node_dict = {}
-    for node in nodes:
-        node_response = CompleteStoryNodeResponse(
-            id=node.id,
-            content=node.content,
-            is_ending=node.is_ending,
-            is_winning_ending=node.is_winning,
-            options=node.options if node.options else []
-        )
-        node_dict[node.id] = node_response
-    root_node = next((node for node in nodes if node.is_root), None)
-    if not root_node:
+    if story.packed_tree is not None: # packed story: the whole tree is in the blob we already have, no node query
+        node_dict = {node["id"]: CompleteStoryNodeResponse(**node) for node in unpack_story(story.packed_tree)}
+        root_id = ROOT_NODE_ID
+    else:
+        nodes = db.query(StoryNode).filter(StoryNode.story_id == story.id).all()
+
+        node_dict = {}
+        for node in nodes:
+            node_dict[node.id] = to_node_response(node)
+        root_node = next((node for node in nodes if node.is_root), None)
+        root_id = root_node.id if root_node else None
+    if root_id not in node_dict:
         raise HTTPException(status_code=500, detail="Root node not found") # internal server error, because this should not happen if the story is generated correctly
     return CompleteStoryResponse(
         id=story.id,
         title=story.title,
-        session_id=story.session_id,
         created_at=story.created_at,
-        root_nodes=node_dict[root_node.id],
+        root_nodes=node_dict[root_id],
         all_nodes=node_dict)
+
+# Columns of story_nodes the /complete response needs, selected as plain tuples
+COMPLETE_NODE_COLUMNS = (StoryNode.id, StoryNode.content, StoryNode.is_root, StoryNode.is_ending, StoryNode.is_winning, StoryNode.options)
+
+# Fast path of build_complete_story_tree(...).model_dump_json(): the same bytes, without ORM objects, a Pydantic model per node or a second validation by response_model.
+# Rows are selected as tuples and turned into dicts whose keys are in the schema's field order, and orjson writes them (UTC as "Z", integer keys as strings, like Pydantic does).
+# benchmarks/bench_complete_render.py checks the output is byte-for-byte the same as the Pydantic rendering.
+def render_complete_story(db: Session, story_id: int) -> bytes:
+    story = db.execute(select(Story.title, Story.created_at, Story.packed_tree).where(Story.id == story_id)).first()
+    if story is None:
+        raise HTTPException(status_code=404, detail="Story not found")
+    title, created_at, packed_tree = story
+
+    all_nodes = {}
+    root_id = None
+    if packed_tree is not None:
+        for node in unpack_story(packed_tree):
+            all_nodes[node["id"]] = node
+        root_id = ROOT_NODE_ID
+    else:
+        for node_id, content, is_root, is_ending, is_winning, options in db.execute(select(*COMPLETE_NODE_COLUMNS).where(StoryNode.story_id == story_id)):
+            all_nodes[node_id] = {
+                "content": content,
+                "is_ending": is_ending,
+                "is_winning_ending": is_winning,
+                "id": node_id,
+                "options": [{"text": option["text"], "node_id": option.get("node_id")} for option in options or []], # only the fields of StoryOptionsSchema
+            }
+            if is_root and root_id is None:
+                root_id = node_id
+    if root_id not in all_nodes:
+        raise HTTPException(status_code=500, detail="Root node not found")
+
+    return orjson.dumps({
+        "title": title,
+        "id": story_id,
+        "created_at": created_at,
+        "root_nodes": all_nodes[root_id],
+        "all_nodes": all_nodes,
+    }, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
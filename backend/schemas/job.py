@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -12,9 +12,29 @@ class StoryJobResponse(BaseModel):
     story_id: Optional[int] = None
     completed_at: Optional[datetime] = None
     error: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    queue_position: Optional[int] = None # 1 = next to start; only set while the job waits in the generation scheduler
 
     class Config:
         from_attributes = True # how Pydantic reads data from the SQLAlchemy object (using attribute access like job.job_id instead of dict access like job["job_id"]
         
+# returned by POST /stories/batch
+class StoryBatchResponse(BaseModel):
+    batch_id: str
+    job_ids: List[str] # in the order of the themes
+
+# GET /jobs/batch/{batch_id}: how far the batch is, counted in one query
+class StoryBatchStatusResponse(BaseModel):
+    batch_id: str
+    total: int
+    pending: int = 0
+    processing: int = 0
+    completed: int = 0
+    failed: int = 0
+    done: bool # every job is completed or failed
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
 class StoryJobCreate(StoryJobBase):
     pass
\ No newline at end of file
@@ -1,6 +1,8 @@
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Literal
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+from core.config import settings
 
 # All of schemes are needed to inherit from BaseModel, or at least have one parent class which is the BaseModel 
 # => pydantic automatically validate data
@@ -25,6 +27,9 @@ class StoryBase(BaseModel):
 class CreateStoryRequest(BaseModel):
     theme: str
 
+class CreateStoryBatchRequest(BaseModel):
+    themes: List[str] = Field(min_length=1, max_length=settings.BATCH_MAX_THEMES) # one story (and job) per theme
+
 #  Used for responses
 class CompleteStoryNodeResponse(StoryNodeBase):
     id: int
@@ -33,7 +38,55 @@ class CompleteStoryNodeResponse(StoryNodeBase):
     class Config:
         from_attributes = True
 
-class CompleteStoryResponse(StoryBase):
+# One node plus (with ?prefetch=1) the nodes its options lead to, so the client can show the next choice without another round trip
+class StoryNodeWithChildrenResponse(CompleteStoryNodeResponse):
+    story_id: int
+    is_root: bool = False
+    children: Dict[int, CompleteStoryNodeResponse] = {}
+
+# One entry of GET /stories: what the library page shows, without loading any node
+class StorySummaryResponse(BaseModel):
+    id: int
+    title: str
+    created_at: datetime
+    node_count: Optional[int] = None
+    ending_count: Optional[int] = None
+
+class StoryListResponse(BaseModel):
+    items: List[StorySummaryResponse]
+    next_cursor: Optional[str] = None # pass as ?cursor= to get the next page, null on the last page
+
+# One thing a player did in StoryGame, see core/playthrough_events.py
+class PlaythroughEventRequest(BaseModel):
+    type: Literal["visit", "choice", "finish"] # node_id was shown / one of its options was picked / it is the ending the playthrough reached
+    node_id: int
+    option_index: Optional[int] = Field(None, ge=0) # "choice": which option was picked
+    won: Optional[bool] = None # "finish": whether the ending is a winning one
+    path: List[int] = Field([], max_length=settings.STORY_EVENTS_MAX_PATH) # "finish": the nodes visited on the way, so each of them gets the outcome
+
+class PlaythroughEventsRequest(BaseModel):
+    playthrough_id: Optional[str] = Field(None, max_length=64) # random id the client picks for one play of the story
+    events: List[PlaythroughEventRequest] = Field(min_length=1, max_length=settings.STORY_EVENTS_MAX_PER_REQUEST)
+
+class PlaythroughEventsResponse(BaseModel):
+    accepted: int
+    dropped: int # shed because the server's event buffer was full, not worth retrying
+
+class StoryNodeStatsResponse(BaseModel):
+    node_id: int
+    visits: int
+    choices: int
+    finishes: int
+    wins: int
+    win_rate: Optional[float] = None # wins / finishes, null before any playthrough through this node finished
+
+class StoryStatsResponse(BaseModel):
+    story_id: int
+    nodes: List[StoryNodeStatsResponse] # nodes that were played at least once, by node id
+
+# No session_id: the cookie value is what GET /stories trusts, and story ids are sequential, so it must never be part of a public response
+class CompleteStoryResponse(BaseModel):
+    title: str
     id: int
     created_at: datetime
     root_nodes: CompleteStoryNodeResponse
@@ -0,0 +1,43 @@
+"""
+Run one retention sweep (core/retention.py) outside the API, e.g. from cron, or to see what RETENTION_* settings would remove before turning them on:
+
+    python sweep.py --dry-run                         # count what would be removed, change nothing
+    python sweep.py                                   # remove it, with the TTLs from the settings / .env
+    python sweep.py --dry-run --failed-job-days 1 --story-days 90
+
+Prints the rows removed per category and the time spent as JSON. The API's last_opened_at times are only as fresh as the last flush of each API process (RETENTION_ACCESS_FLUSH_SECONDS).
+
+This process can't clear the in-memory caches of the running API processes. They check a story still exists before the generation cache hands it out again, but an API process may keep serving the cached /complete response of a deleted story for up to COMPLETE_STORY_CACHE_TTL_SECONDS.
+"""
+import argparse
+import asyncio
+import json
+import logging
+
+from core.config import settings
+from core.retention import retention_sweeper
+from db.database import create_tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only count what would be removed")
+    parser.add_argument("--completed-job-days", type=float, default=settings.RETENTION_COMPLETED_JOB_DAYS)
+    parser.add_argument("--failed-job-days", type=float, default=settings.RETENTION_FAILED_JOB_DAYS)
+    parser.add_argument("--story-days", type=float, default=settings.RETENTION_STORY_DAYS)
+    parser.add_argument("--batch-size", type=int, default=settings.RETENTION_BATCH_SIZE, help="rows per delete transaction")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    settings.RETENTION_COMPLETED_JOB_DAYS = args.completed_job_days
+    settings.RETENTION_FAILED_JOB_DAYS = args.failed_job_days
+    settings.RETENTION_STORY_DAYS = args.story_days
+    settings.RETENTION_BATCH_SIZE = args.batch_size
+
+    create_tables() # adds last_opened_at to an older database
+    result = asyncio.run(retention_sweeper.sweep(dry_run=args.dry_run))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Standalone generation worker. Run any number of these next to the API (with JOB_EXECUTION_MODE=worker on the API side):
+
+    python worker.py                  # WORKER_CONCURRENCY generations at a time
+    python worker.py --concurrency 8
+    python worker.py --metrics-port 9100   # Prometheus metrics of this worker at http://host:9100/metrics
+
+Each worker claims pending jobs from the story_jobs table, generates the stories, keeps its leases alive with heartbeats, and requeues jobs abandoned by crashed workers. API replicas and workers can then be scaled independently.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import uuid
+
+from core.config import settings
+from core.job_queue import claim_next_job, requeue_expired_jobs
+from core.metrics import metrics_registry
+from core.notifications import notification_bus
+from core.story_generator import StoryGenerator
+from db.async_database import AsyncSessionLocal
+from db.database import create_tables
+from routers.story import run_story_job # the same job code the API runs in-process
+
+logger = logging.getLogger("worker")
+
+
+async def process_job(job, worker_id: str, slots: asyncio.Semaphore):
+    try:
+        async with AsyncSessionLocal() as db:
+            job = await db.merge(job, load=False) # attach the claimed job to this task's session
+            await run_story_job(db, job, worker_id)
+    except asyncio.CancelledError:
+        logger.warning("Job %s was cancelled, it will be requeued when its lease expires", job.job_id)
+    except Exception:
+        logger.exception("Job %s crashed", job.job_id)
+    finally:
+        slots.release()
+
+
+# Minimal HTTP endpoint so Prometheus can scrape a worker the same way as the API's GET /metrics
+async def serve_metrics(port: int):
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n") # the request itself doesn't matter, every path answers with the metrics
+            body = metrics_registry.render().encode()
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, "0.0.0.0", port)
+
+
+async def run_worker(concurrency: int, metrics_port: int = 0):
+    worker_id = f"worker:{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    slots = asyncio.Semaphore(concurrency)
+    running = set()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signal_number, stopping.set)
+
+    await notification_bus.start() # job status changes must reach the API processes (use a cross-process backend)
+    warm_up_task = StoryGenerator.start_warm_up() # the first claimed job may already find the prompts compiled; kept referenced, asyncio only holds tasks weakly
+    metrics_server = await serve_metrics(metrics_port) if metrics_port else None
+    logger.info("Worker %s started, %d slots", worker_id, concurrency)
+    last_recovery = 0.0
+    try:
+        while not stopping.is_set():
+            if loop.time() - last_recovery >= settings.JOB_RECOVERY_INTERVAL_SECONDS:
+                last_recovery = loop.time()
+                async with AsyncSessionLocal() as db:
+                    await requeue_expired_jobs(db)
+
+            await slots.acquire() # wait for a free slot before claiming, so we never hold jobs we can't start
+            async with AsyncSessionLocal() as db:
+                job = await claim_next_job(db, worker_id)
+            if job is None:
+                slots.release()
+                try:
+                    await asyncio.wait_for(stopping.wait(), settings.JOB_POLL_SECONDS) # idle: wait a bit, or stop
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            logger.info("Claimed job %s (attempt %s)", job.job_id, job.attempts)
+            task = asyncio.create_task(process_job(job, worker_id, slots))
+            running.add(task)
+            task.add_done_callback(running.discard)
+    finally:
+        # stop claiming and let the running generations finish; anything cut off is requeued once its lease expires
+        logger.info("Worker %s stopping, waiting for %d running jobs", worker_id, len(running))
+        await asyncio.gather(*running, return_exceptions=True)
+        if warm_up_task:
+            warm_up_task.cancel()
+        if metrics_server:
+            metrics_server.close()
+        await notification_bus.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Story generation worker")
+    parser.add_argument("--concurrency", type=int, default=settings.WORKER_CONCURRENCY)
+    parser.add_argument("--metrics-port", type=int, default=0, help="serve Prometheus metrics on this port (0: off)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if settings.SCHEMA_SETUP == "lifespan":
+        create_tables()
+    asyncio.run(run_worker(args.concurrency, args.metrics_port))
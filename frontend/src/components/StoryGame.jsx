@@ -1,4 +1,12 @@
-import {useState, useEffect} from 'react';
+import {useState, useEffect, useRef, useCallback} from 'react';
+import axios from "axios";
+import {API_BASE_URL} from "../util.js"
+
+const EVENT_FLUSH_MS = 5000 // send the collected playthrough events at least this often
+const MAX_EVENTS_PER_REQUEST = 200 // STORY_EVENTS_MAX_PER_REQUEST on the server
+const MAX_PATH_LENGTH = 50 // STORY_EVENTS_MAX_PATH on the server
+
+const newPlaythroughId = () => Math.random().toString(36).slice(2) + Date.now().toString(36)
 
 function StoryGame({story, onNewStory}) {
     const [currentNodeId, setCurrentNodeId] = useState(null);
@@ -7,6 +15,29 @@ function StoryGame({story, onNewStory}) {
     const [isEnding, setIsEnding] = useState(false)
     const [isWinningEnding, setIsWinningEnding] = useState(false)
 
+    // playthrough events are collected here and sent in batches, not one request per click
+    const pendingEvents = useRef([])
+    const path = useRef([]) // nodes visited in this playthrough, sent with the ending so every one of them counts towards the win rate
+    const playthroughId = useRef(newPlaythroughId())
+    const [playthrough, setPlaythrough] = useState(0)
+
+    const sendEvents = useCallback(() => {
+        if (!story || !story.id) return
+        while (pendingEvents.current.length > 0) {
+            const events = pendingEvents.current.splice(0, MAX_EVENTS_PER_REQUEST)
+            axios.post(`${API_BASE_URL}/stories/${story.id}/events`, {playthrough_id: playthroughId.current, events})
+                .catch(() => {}) // analytics only, the game goes on either way
+        }
+    }, [story])
+
+    useEffect(() => {
+        const timer = setInterval(sendEvents, EVENT_FLUSH_MS)
+        return () => {
+            clearInterval(timer)
+            sendEvents() // leaving the story
+        }
+    }, [sendEvents])
+
     useEffect(() => {
         if (story && story.root_nodes) {
             const rootNodeId = story.root_nodes.id
@@ -22,21 +53,34 @@ function StoryGame({story, onNewStory}) {
             setIsEnding(node.is_ending)
             setIsWinningEnding(node.is_winning_ending)
 
+            pendingEvents.current.push({type: "visit", node_id: currentNodeId})
+            if (node.is_ending) {
+                pendingEvents.current.push({type: "finish", node_id: currentNodeId, won: node.is_winning_ending, path: [...new Set(path.current)].slice(-MAX_PATH_LENGTH)})
+                sendEvents()
+            } else {
+                path.current = [...path.current, currentNodeId]
+            }
+
             if (!node.is_ending && node.options && node.options.length > 0) {
                 setOptions(node.options)
             } else {
                 setOptions([])
             }
         }
-    }, [currentNodeId, story])
+    }, [currentNodeId, playthrough, story, sendEvents])
 
 
-    const chooseOption = (optionId) => {
+    const chooseOption = (optionId, optionIndex) => {
+        pendingEvents.current.push({type: "choice", node_id: currentNodeId, option_index: optionIndex})
         setCurrentNodeId(optionId)
     }
 
     const restartStory = () => {
         if (story && story.root_nodes) {
+            sendEvents() // the events so far still belong to the old playthrough
+            playthroughId.current = newPlaythroughId()
+            path.current = []
+            setPlaythrough(count => count + 1) // shows (and counts) the root node again even if the player restarts from it
             setCurrentNodeId(story.root_nodes.id)
         }
     }
@@ -62,7 +106,7 @@ function StoryGame({story, onNewStory}) {
                             {options.map((option, index) => {
                                 return <button
                                         key={index}
-                                        onClick={() => chooseOption(option.node_id)}
+                                        onClick={() => chooseOption(option.node_id, index)}
                                         className="option-btn"
                                         >
                                         {option.text}
@@ -1,4 +1,4 @@
-import {useState, useEffect} from "react"
+import {useState} from "react"
 import {useNavigate} from "react-router-dom"
 import axios from "axios"
 import ThemeInput from "./ThemeInput.jsx"
@@ -13,20 +13,6 @@ function StoryGenerator() {
     const [error, setError] = useState(null);
     const [loading, setLoading] = useState(false);
 
-    useEffect(() => {
-        let pollInterval;
-        if (jobId && jobStatus == "processing") {
-            pollInterval = setInterval(() => {
-                pollJobStatus(jobId)
-            }, 5000) // poll every 5 seconds
-        }
-        return () => {
-            if (pollInterval) {
-                clearInterval(pollInterval);
-            }
-        }
-    }, [jobId, jobStatus])
-
     const generateStory = async(theme) => {
         setLoading(true);
         setError(null); // clear the error state before starting a new generation
@@ -46,15 +32,20 @@ function StoryGenerator() {
 
     const pollJobStatus = async(id) => {
         try {
-            const response = await axios.get(`${API_BASE_URL}/jobs/${id}`);
-            const {status, story_id, jobError} = response.data;
-            setJobStatus(status);
+            let status = null;
+            while (status != "completed" && status != "failed") {
+                // long-poll: the backend holds the request for up to 30 seconds and answers as soon as the job status changes
+                const response = await axios.get(`${API_BASE_URL}/jobs/${id}`, {params: {wait: 30}});
+                const {story_id, error: jobError} = response.data;
+                status = response.data.status;
+                setJobStatus(status);
 
-            if (status == "completed" && story_id) {
-                fetchStory(story_id);
-            } else if (status == "failed") {
-                setError(jobError || "Failed to generate story");
-                setLoading(false);
+                if (status == "completed" && story_id) {
+                    fetchStory(story_id);
+                } else if (status == "failed") {
+                    setError(jobError || "Failed to generate story");
+                    setLoading(false);
+                }
             }
         } catch (e) {
             if (e.response?.status == 404) {